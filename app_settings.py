@@ -4,6 +4,8 @@ import os
 from enum import Enum
 from typing import Optional
 
+from thumb_cache import THUMB_BACKENDS
+
 
 class FocalMode(Enum):
     OFF = "off"
@@ -32,9 +34,17 @@ _SETTINGS_FILE = os.path.join(
 )
 
 
+# 索引存储引擎："json"（单文件）或 "sqlite"（WAL 数据库，增量写入）
+STORAGE_ENGINES = ("json", "sqlite")
+
+
 class AppSettings:
     def __init__(self):
         self._focal_mode = FocalMode.AUTO_BY_CAMERA
+        self._storage_engine = "json"
+        self._thumb_backend = "files"
+        self._thumb_cache_mb = 0            # 缩略图缓存磁盘预算，0 表示不限
+        self._image_cache_mb = 96           # 界面中已解码缩略图的内存预算
         self._load()
 
     def _load(self):
@@ -46,13 +56,31 @@ class AppSettings:
                 self._focal_mode = FocalMode(raw)
             except ValueError:
                 self._focal_mode = FocalMode.AUTO_BY_CAMERA
+            engine = d.get("storage_engine", "json")
+            self._storage_engine = engine if engine in STORAGE_ENGINES else "json"
+            backend = d.get("thumb_backend", "files")
+            self._thumb_backend = backend if backend in THUMB_BACKENDS else "files"
+            try:
+                self._thumb_cache_mb = max(0, int(d.get("thumb_cache_mb", 0)))
+            except (TypeError, ValueError):
+                self._thumb_cache_mb = 0
+            try:
+                self._image_cache_mb = max(1, int(d.get("image_cache_mb", 96)))
+            except (TypeError, ValueError):
+                self._image_cache_mb = 96
         except (FileNotFoundError, json.JSONDecodeError):
             pass
 
     def save(self):
         os.makedirs(os.path.dirname(_SETTINGS_FILE), exist_ok=True)
         with open(_SETTINGS_FILE, "w", encoding="utf-8") as f:
-            json.dump({"focal_mode": self._focal_mode.value}, f)
+            json.dump({
+                "focal_mode": self._focal_mode.value,
+                "storage_engine": self._storage_engine,
+                "thumb_backend": self._thumb_backend,
+                "thumb_cache_mb": self._thumb_cache_mb,
+                "image_cache_mb": self._image_cache_mb,
+            }, f)
 
     @property
     def focal_mode(self) -> FocalMode:
@@ -63,6 +91,46 @@ class AppSettings:
         self._focal_mode = value
         self.save()
 
+    @property
+    def storage_engine(self) -> str:
+        return self._storage_engine
+
+    @storage_engine.setter
+    def storage_engine(self, value: str):
+        if value not in STORAGE_ENGINES:
+            raise ValueError(f"unknown storage engine: {value}")
+        self._storage_engine = value
+        self.save()
+
+    @property
+    def thumb_backend(self) -> str:
+        return self._thumb_backend
+
+    @thumb_backend.setter
+    def thumb_backend(self, value: str):
+        if value not in THUMB_BACKENDS:
+            raise ValueError(f"unknown thumbnail backend: {value}")
+        self._thumb_backend = value
+        self.save()
+
+    @property
+    def thumb_cache_mb(self) -> int:
+        return self._thumb_cache_mb
+
+    @thumb_cache_mb.setter
+    def thumb_cache_mb(self, value: int):
+        self._thumb_cache_mb = max(0, int(value))
+        self.save()
+
+    @property
+    def image_cache_mb(self) -> int:
+        return self._image_cache_mb
+
+    @image_cache_mb.setter
+    def image_cache_mb(self, value: int):
+        self._image_cache_mb = max(1, int(value))
+        self.save()
+
     def focal_multiplier(self, camera_model: Optional[str]) -> float:
         if self._focal_mode == FocalMode.OFF:
             return 1.0
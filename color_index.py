@@ -0,0 +1,262 @@
+from __future__ import annotations
+import os
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    _NP_OK = True
+except ImportError:
+    _NP_OK = False
+
+# 特征：RGB 各量化到 2 位的 64 格联合直方图 + 16 格亮度直方图
+COLOR_BINS = 64
+TONE_BINS = 16
+FEATURE_DIM = COLOR_BINS + TONE_BINS
+
+
+def color_feature(img) -> Optional[bytes]:
+    """由已解码的小图计算颜色/影调特征（float32 字节，FEATURE_DIM 维）；需要 numpy。
+
+    两段直方图各自归一化后开平方再整体做 L2 归一化，两个特征的点积即两段
+    Bhattacharyya 系数的平均，1 为完全相同。
+    """
+    if not _NP_OK:
+        return None
+    try:
+        rgb = np.asarray(img.convert("RGB"), dtype=np.uint8).reshape(-1, 3)
+    except Exception:
+        return None
+    if not len(rgb):
+        return None
+    q = (rgb >> 6).astype(np.intp)
+    color = np.bincount((q[:, 0] << 4) | (q[:, 1] << 2) | q[:, 2], minlength=COLOR_BINS)
+    luma = (rgb.astype(np.uint32) @ np.array([299, 587, 114], dtype=np.uint32)) // 1000
+    tone = np.bincount((luma >> 4).astype(np.intp), minlength=TONE_BINS)
+    vec = np.sqrt(np.concatenate([color, tone]).astype(np.float32) / len(rgb))
+    vec /= np.float32(np.sqrt(2.0))
+    return vec.tobytes()
+
+
+class ColorMatrix:
+    """所有照片颜色特征组成的连续 float32 矩阵（行号即 TagBitmapIndex 分配的照片位置）。
+
+    相似查询是整个矩阵与查询向量的一次矩阵乘法，再用 argpartition 取前 k 个。
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._size = 0
+        self._vectors = np.zeros((capacity, FEATURE_DIM), dtype=np.float32)
+        self._live = np.zeros(capacity, dtype=bool)
+
+    def __len__(self) -> int:
+        return int(self._live[:self._size].sum())
+
+    def _grow(self, need: int):
+        cap = len(self._live)
+        if need <= cap:
+            return
+        new_cap = max(need, cap * 2)
+        vectors = np.zeros((new_cap, FEATURE_DIM), dtype=np.float32)
+        vectors[:cap] = self._vectors
+        live = np.zeros(new_cap, dtype=bool)
+        live[:cap] = self._live
+        self._vectors, self._live = vectors, live
+
+    def has(self, pos: Optional[int]) -> bool:
+        return pos is not None and pos < self._size and bool(self._live[pos])
+
+    def vector(self, pos: int) -> Optional["np.ndarray"]:
+        return self._vectors[pos].copy() if self.has(pos) else None
+
+    def set(self, pos: int, feature):
+        self._grow(pos + 1)
+        self._size = max(self._size, pos + 1)
+        self._vectors[pos] = np.frombuffer(feature, dtype=np.float32) if isinstance(feature, bytes) else feature
+        self._live[pos] = True
+
+    def set_many(self, positions: Sequence[int], vectors: "np.ndarray"):
+        """批量写入（载入整个库时使用）"""
+        if not len(positions):
+            return
+        pos = np.asarray(positions, dtype=np.int64)
+        top = int(pos.max()) + 1
+        self._grow(top)
+        self._size = max(self._size, top)
+        self._vectors[pos] = vectors
+        self._live[pos] = True
+
+    def clear(self, pos: int):
+        if pos < self._size:
+            self._live[pos] = False
+            self._vectors[pos] = 0
+
+    def reset(self):
+        self._size = 0
+        self._live[:] = False
+        self._vectors[:] = 0
+
+    def top_k(
+        self,
+        query: "np.ndarray",
+        k: int,
+        within: Optional["np.ndarray"] = None,
+        exclude: Optional[int] = None,
+    ) -> List[Tuple[int, float]]:
+        """与 query 最相近的 k 行 [(位置, 相似度)]，相似度降序；within 为可选的行掩码"""
+        n = self._size
+        if n == 0 or k <= 0:
+            return []
+        scores = self._vectors[:n] @ query.astype(np.float32, copy=False)
+        keep = self._live[:n] if within is None else self._live[:n] & within[:n]
+        scores[~keep] = -np.inf
+        if exclude is not None and exclude < n:
+            scores[exclude] = -np.inf
+        k = min(k, int(keep.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > -np.inf]
+
+
+# ---- 持久化：追加写入的定长记录 (照片 id, 特征)，与索引文件放在一起 ----
+# 删除记为特征首元素为 NaN 的墓碑；载入时后写的记录覆盖先写的，失效记录过多时整体重写
+
+_LOG_MAGIC = b"TGCF\x01\x00\x00\x00"
+_ID_BYTES = 36      # uuid4 字符串
+
+
+def _record_dtype():
+    return np.dtype([("id", f"S{_ID_BYTES}"), ("vec", "<f4", (FEATURE_DIM,))])
+
+
+class ColorFeatureLog:
+    def __init__(self, path: str):
+        self._path = path
+        self._fh = None
+        self._records = 0
+
+    @property
+    def records(self) -> int:
+        """文件中的记录条数（含被覆盖的旧记录与墓碑）"""
+        return self._records
+
+    def load(self) -> Tuple[List[str], "np.ndarray"]:
+        """读出全部有效记录 (ids, 特征矩阵)；文件缺失或损坏时返回空"""
+        dtype = _record_dtype()
+        ids: List[str] = []
+        vectors = np.zeros((0, FEATURE_DIM), dtype=np.float32)
+        try:
+            with open(self._path, "rb") as f:
+                if f.read(len(_LOG_MAGIC)) != _LOG_MAGIC:
+                    raise ValueError("bad magic")
+                # 上次写入中断留下的半条记录在这里被忽略，下次追加前截掉
+                count = (os.fstat(f.fileno()).st_size - len(_LOG_MAGIC)) // dtype.itemsize
+                records = np.fromfile(f, dtype=dtype, count=count)
+        except (OSError, ValueError):
+            self._records = 0
+            return ids, vectors
+        # 每个 id 取最后一条记录：在倒序数组上取首次出现的位置
+        _, first = np.unique(records["id"][::-1], return_index=True)
+        rows = np.sort(len(records) - 1 - first)
+        rows = rows[~np.isnan(records["vec"][rows, 0])]
+        ids = records["id"][rows].astype(f"U{_ID_BYTES}").tolist()
+        vectors = np.ascontiguousarray(records["vec"][rows], dtype=np.float32)
+        self._records = len(records)
+        return ids, vectors
+
+    def _open(self):
+        if self._fh is not None:
+            return
+        itemsize = _record_dtype().itemsize
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        fresh = not os.path.exists(self._path) or os.path.getsize(self._path) < len(_LOG_MAGIC)
+        self._fh = open(self._path, "wb" if fresh else "r+b")
+        if fresh:
+            self._fh.write(_LOG_MAGIC)
+            return
+        # 截掉末尾不完整的记录
+        body = os.fstat(self._fh.fileno()).st_size - len(_LOG_MAGIC)
+        end = len(_LOG_MAGIC) + body // itemsize * itemsize
+        self._fh.truncate(end)
+        self._fh.seek(end)
+
+    def _write(self, ids: Sequence[str], vectors: "np.ndarray"):
+        records = np.zeros(len(ids), dtype=_record_dtype())
+        records["id"] = [i.encode("ascii") for i in ids]
+        records["vec"] = vectors
+        self._open()
+        self._fh.write(records.tobytes())
+        self._records += len(ids)
+
+    def append(self, ids: Sequence[str], vectors: "np.ndarray"):
+        if len(ids):
+            self._write(ids, vectors)
+
+    def remove(self, ids: Sequence[str]):
+        if len(ids):
+            self._write(ids, np.full((len(ids), FEATURE_DIM), np.nan, dtype=np.float32))
+
+    def flush(self):
+        if self._fh is not None:
+            self._fh.flush()
+
+    def rewrite(self, ids: Sequence[str], vectors: "np.ndarray"):
+        """只保留给定的记录（压缩）"""
+        self.close()
+        tmp = self._path + ".tmp"
+        records = np.zeros(len(ids), dtype=_record_dtype())
+        records["id"] = [i.encode("ascii") for i in ids]
+        records["vec"] = vectors
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(_LOG_MAGIC)
+            f.write(records.tobytes())
+        os.replace(tmp, self._path)
+        self._records = len(ids)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+if __name__ == "__main__":
+    # 基准：50 万张照片的特征矩阵——逐张增量写入、top-k 查询、日志写入与载入
+    import tempfile
+    import time
+    import uuid
+
+    n, k = 500_000, 50
+    rng = np.random.default_rng(1)
+    raw = rng.random((n, FEATURE_DIM), dtype=np.float32) ** 4
+    raw /= np.linalg.norm(raw, axis=1, keepdims=True)
+    ids = [str(uuid.uuid4()) for _ in range(n)]
+
+    t0 = time.perf_counter()
+    m = ColorMatrix()
+    for i in range(n):
+        m.set(i, raw[i])
+    print(f"incremental build {n}: {time.perf_counter() - t0:.2f}s")
+
+    for _ in range(3):
+        t0 = time.perf_counter()
+        hits = m.top_k(raw[123], k, exclude=123)
+        print(f"top-{k} query: {(time.perf_counter() - t0) * 1000:.1f} ms")
+    t0 = time.perf_counter()
+    brute = np.argsort(-(raw @ raw[123]))[1:k + 1]
+    print(f"full argsort:   {(time.perf_counter() - t0) * 1000:.1f} ms, same result: "
+          f"{[p for p, _ in hits] == brute.tolist()}")
+
+    with tempfile.TemporaryDirectory() as d:
+        log = ColorFeatureLog(os.path.join(d, "color_features.bin"))
+        t0 = time.perf_counter()
+        log.append(ids, raw)
+        log.flush()
+        print(f"log write: {time.perf_counter() - t0:.2f}s, "
+              f"{os.path.getsize(os.path.join(d, 'color_features.bin')) / 1e6:.0f} MB")
+        log.close()
+        t0 = time.perf_counter()
+        loaded_ids, loaded = ColorFeatureLog(os.path.join(d, "color_features.bin")).load()
+        print(f"log load: {time.perf_counter() - t0:.2f}s, round-trip ok: "
+              f"{loaded_ids == ids and np.array_equal(loaded, raw)}")
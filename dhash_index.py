@@ -0,0 +1,132 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from tag_query import bit_count
+
+
+def hamming(a: int, b: int) -> int:
+    return bit_count(a ^ b)
+
+
+def format_dhash(value: int) -> str:
+    """64 位 dHash 存为 16 位十六进制字符串（SQLite INTEGER 放不下无符号 64 位）"""
+    return f"{value:016x}"
+
+
+def parse_dhash(text: Optional[str]) -> Optional[int]:
+    """format_dhash 的逆操作；缺失或格式不对（含超出 64 位）时返回 None"""
+    try:
+        value = int(text, 16) if text else None
+    except (TypeError, ValueError):
+        return None
+    return value if value is None or 0 <= value < 1 << 64 else None
+
+
+def _flip_masks(bits: int, radius: int) -> List[int]:
+    """bits 位宽内、置位数 <= radius 的全部掩码（按置位数升序）"""
+    masks = [0]
+    frontier = [(0, -1)]
+    for _ in range(radius):
+        nxt = []
+        for mask, top in frontier:
+            for b in range(top + 1, bits):
+                m = mask | (1 << b)
+                masks.append(m)
+                nxt.append((m, b))
+        frontier = nxt
+    return masks
+
+
+class MultiIndexHash:
+    """64 位哈希的多索引哈希表：按 16 位切成 4 段，每段一张 段值 -> 哈希集合 的表。
+
+    汉明距离 <= k 的两个哈希至少有一段距离 <= k // 4（抽屉原理），因此查询只需在每段
+    枚举距离 <= k // 4 的段值做字典查找，再对候选逐个核对完整距离。哈希相同的照片共用一项。
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self, items: Iterable[Tuple[int, str]] = ()):
+        self._ids: Dict[int, Set[str]] = {}
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in range(self.CHUNKS)]
+        self._masks: Dict[int, List[int]] = {}
+        self._size = 0
+        for value, photo_id in items:
+            self.add(value, photo_id)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _chunks(self, value: int) -> List[int]:
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(value >> (i * self.CHUNK_BITS)) & mask for i in range(self.CHUNKS)]
+
+    def add(self, value: int, photo_id: str):
+        ids = self._ids.get(value)
+        if ids is None:
+            ids = self._ids[value] = set()
+            for table, chunk in zip(self._tables, self._chunks(value)):
+                table.setdefault(chunk, set()).add(value)
+        if photo_id not in ids:
+            ids.add(photo_id)
+            self._size += 1
+
+    def remove(self, value: int, photo_id: str):
+        ids = self._ids.get(value)
+        if ids is None or photo_id not in ids:
+            return
+        ids.discard(photo_id)
+        self._size -= 1
+        if ids:
+            return
+        del self._ids[value]
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            bucket = table[chunk]
+            bucket.discard(value)
+            if not bucket:
+                del table[chunk]
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, str]]:
+        """距离 <= max_distance 的所有 (距离, 照片 id)，按距离升序"""
+        radius = max(0, max_distance) // self.CHUNKS
+        masks = self._masks.get(radius)
+        if masks is None:
+            masks = self._masks[radius] = _flip_masks(self.CHUNK_BITS, radius)
+        candidates: Set[int] = set()
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for m in masks:
+                bucket = table.get(chunk ^ m)
+                if bucket:
+                    candidates |= bucket
+        out: List[Tuple[int, str]] = []
+        for h in candidates:
+            d = hamming(value, h)
+            if d <= max_distance:
+                out.extend((d, i) for i in self._ids[h])
+        out.sort()
+        return out
+
+
+if __name__ == "__main__":
+    # 粗略基准：随机 64 位哈希上多索引查询与线性扫描的对比
+    import random
+    import time
+
+    n = 200_000
+    rng = random.Random(1)
+    hashes = [rng.getrandbits(64) for _ in range(n)]
+    t0 = time.perf_counter()
+    index = MultiIndexHash((h, str(i)) for i, h in enumerate(hashes))
+    print(f"build {n}: {time.perf_counter() - t0:.2f}s")
+    probes = [h ^ (1 << rng.randrange(64)) for h in rng.sample(hashes, 50)]
+    for k in (4, 8, 12):
+        t0 = time.perf_counter()
+        for q in probes:
+            index.search(q, k)
+        indexed = (time.perf_counter() - t0) / len(probes)
+        t0 = time.perf_counter()
+        for q in probes[:5]:
+            [i for i, h in enumerate(hashes) if hamming(q, h) <= k]
+        linear = (time.perf_counter() - t0) / 5
+        print(f"k={k}: index {indexed * 1000:.2f} ms, linear {linear * 1000:.2f} ms")
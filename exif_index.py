@@ -0,0 +1,194 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+    _NP_OK = True
+except ImportError:
+    _NP_OK = False
+
+from library_models import PhotoEXIF
+
+# 数值列与类别列；行号即 TagBitmapIndex 分配的照片位置
+NUMERIC_FIELDS = ("focal_length", "f_number", "exposure_time", "iso")
+CATEGORY_FIELDS = ("camera_model", "lens_model")
+
+Range = Tuple[Optional[float], Optional[float]]
+
+
+class ExifColumns:
+    """PhotoEXIF 的列式镜像：每个数值字段一列 float64 加有效位掩码，相机/镜头为整数编码列。
+
+    范围过滤、直方图与分组计数都在整列上向量化完成；增删照片时按位置原地更新对应行。
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._size = 0
+        self._live = np.zeros(capacity, dtype=bool)
+        self._values = {f: np.zeros(capacity, dtype=np.float64) for f in NUMERIC_FIELDS}
+        self._valid = {f: np.zeros(capacity, dtype=bool) for f in NUMERIC_FIELDS}
+        # 类别编码：-1 表示缺失
+        self._codes = {f: np.full(capacity, -1, dtype=np.int32) for f in CATEGORY_FIELDS}
+        self._names: Dict[str, List[str]] = {f: [] for f in CATEGORY_FIELDS}
+        self._lookup: Dict[str, Dict[str, int]] = {f: {} for f in CATEGORY_FIELDS}
+
+    def __len__(self) -> int:
+        return int(self._live[:self._size].sum())
+
+    def _grow(self, need: int):
+        cap = len(self._live)
+        if need <= cap:
+            return
+        new_cap = max(need, cap * 2)
+
+        def grown(arr, fill):
+            out = np.full(new_cap, fill, dtype=arr.dtype)
+            out[:cap] = arr
+            return out
+
+        self._live = grown(self._live, False)
+        for f in NUMERIC_FIELDS:
+            self._values[f] = grown(self._values[f], 0)
+            self._valid[f] = grown(self._valid[f], False)
+        for f in CATEGORY_FIELDS:
+            self._codes[f] = grown(self._codes[f], -1)
+
+    def _code(self, field: str, name: Optional[str]) -> int:
+        if not name:
+            return -1
+        code = self._lookup[field].get(name)
+        if code is None:
+            code = self._lookup[field][name] = len(self._names[field])
+            self._names[field].append(name)
+        return code
+
+    def set(self, pos: int, exif: Optional[PhotoEXIF]):
+        self._grow(pos + 1)
+        self._size = max(self._size, pos + 1)
+        self._live[pos] = True
+        for f in NUMERIC_FIELDS:
+            v = getattr(exif, f, None) if exif is not None else None
+            self._valid[f][pos] = v is not None
+            self._values[f][pos] = v if v is not None else 0
+        for f in CATEGORY_FIELDS:
+            self._codes[f][pos] = self._code(f, getattr(exif, f, None) if exif is not None else None)
+
+    def set_many(self, positions: Sequence[int], exifs: Sequence[Optional[PhotoEXIF]]):
+        """批量写入（载入整个库时使用），每列一次向量化赋值"""
+        if not positions:
+            return
+        pos = np.asarray(positions, dtype=np.int64)
+        top = int(pos.max()) + 1
+        self._grow(top)
+        self._size = max(self._size, top)
+        self._live[pos] = True
+        for f in NUMERIC_FIELDS:
+            raw = [getattr(e, f, None) if e is not None else None for e in exifs]
+            self._valid[f][pos] = [v is not None for v in raw]
+            self._values[f][pos] = [v if v is not None else 0 for v in raw]
+        for f in CATEGORY_FIELDS:
+            self._codes[f][pos] = [
+                self._code(f, getattr(e, f, None) if e is not None else None) for e in exifs
+            ]
+
+    def clear(self, pos: int):
+        if pos >= self._size:
+            return
+        self._live[pos] = False
+        for f in NUMERIC_FIELDS:
+            self._valid[f][pos] = False
+        for f in CATEGORY_FIELDS:
+            self._codes[f][pos] = -1
+
+    def reset(self):
+        self._size = 0
+        self._live[:] = False
+        for f in NUMERIC_FIELDS:
+            self._valid[f][:] = False
+        for f in CATEGORY_FIELDS:
+            self._codes[f][:] = -1
+
+    def mask(
+        self,
+        ranges: Optional[Dict[str, Range]] = None,
+        equals: Optional[Dict[str, str]] = None,
+        within: Optional["np.ndarray"] = None,
+    ) -> "np.ndarray":
+        """满足所有条件的行掩码。ranges: 字段 -> (下限, 上限)，闭区间，None 表示不限；
+        有范围条件的字段缺失值的行被排除。equals: 类别字段 -> 名称。within: 额外的行掩码。"""
+        n = self._size
+        m = self._live[:n].copy()
+        if within is not None:
+            m &= within[:n]
+        for f, (lo, hi) in (ranges or {}).items():
+            if f not in NUMERIC_FIELDS:
+                raise ValueError(f"unknown numeric field: {f}")
+            vals = self._values[f][:n]
+            m &= self._valid[f][:n]
+            if lo is not None:
+                m &= vals >= lo
+            if hi is not None:
+                m &= vals <= hi
+        for f, name in (equals or {}).items():
+            if f not in CATEGORY_FIELDS:
+                raise ValueError(f"unknown category field: {f}")
+            code = self._lookup[f].get(name)
+            if code is None:
+                return np.zeros(n, dtype=bool)
+            m &= self._codes[f][:n] == code
+        return m
+
+    def counts_by(self, field: str, within: Optional["np.ndarray"] = None) -> Dict[Optional[str], int]:
+        """按相机或镜头计数；缺失值计在 None 下"""
+        if field not in CATEGORY_FIELDS:
+            raise ValueError(f"unknown category field: {field}")
+        m = self.mask(within=within)
+        codes = self._codes[field][:self._size][m]
+        counts = np.bincount(codes + 1, minlength=len(self._names[field]) + 1)
+        out: Dict[Optional[str], int] = {}
+        if counts[0]:
+            out[None] = int(counts[0])
+        for code, n in enumerate(counts[1:]):
+            if n:
+                out[self._names[field][code]] = int(n)
+        return out
+
+    def histogram(
+        self,
+        field: str,
+        bins: Union[int, Sequence[float]] = 20,
+        group_by: Optional[str] = None,
+        within: Optional["np.ndarray"] = None,
+    ) -> Tuple["np.ndarray", Dict[Optional[str], "np.ndarray"]]:
+        """数值字段的直方图，返回 (分箱边界, {分组名: 各箱计数})。
+
+        不分组时字典只有键 None；分组时所有分组共用同一组边界，便于比较。
+        """
+        if field not in NUMERIC_FIELDS:
+            raise ValueError(f"unknown numeric field: {field}")
+        m = self.mask(within=within) & self._valid[field][:self._size]
+        vals = self._values[field][:self._size][m]
+        edges = np.histogram_bin_edges(vals, bins=bins)
+        nbins = len(edges) - 1
+        if group_by is None:
+            return edges, {None: np.histogram(vals, edges)[0]}
+        if group_by not in CATEGORY_FIELDS:
+            raise ValueError(f"unknown category field: {group_by}")
+        # 每行的 (分组, 箱) 合成一个下标，一次 bincount 得到所有分组的直方图
+        codes = self._codes[group_by][:self._size][m] + 1
+        idx = np.clip(np.searchsorted(edges, vals, side="right") - 1, 0, nbins - 1)
+        keep = (vals >= edges[0]) & (vals <= edges[-1])
+        ngroups = len(self._names[group_by]) + 1
+        flat = np.bincount(codes[keep] * nbins + idx[keep], minlength=ngroups * nbins)
+        table = flat.reshape(ngroups, nbins)
+        out: Dict[Optional[str], "np.ndarray"] = {}
+        for g in range(ngroups):
+            if table[g].any():
+                out[None if g == 0 else self._names[group_by][g - 1]] = table[g]
+        return edges, out
+
+
+def bitmap_to_mask(bits: int, length: int) -> "np.ndarray":
+    """把 TagBitmapIndex 的整数位图转成按位置排列的布尔掩码"""
+    data = np.frombuffer(bits.to_bytes((length + 7) >> 3, "little"), dtype=np.uint8)
+    return np.unpackbits(data, bitorder="little")[:length].astype(bool)
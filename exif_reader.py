@@ -0,0 +1,385 @@
+from __future__ import annotations
+import mmap
+import struct
+from typing import Dict, List, Optional, Tuple
+
+
+# TIFF 字段类型 -> (单个值的字节数, struct 格式)
+_TYPES = {
+    1: (1, "B"),   # BYTE
+    2: (1, "s"),   # ASCII
+    3: (2, "H"),   # SHORT
+    4: (4, "I"),   # LONG
+    5: (8, "II"),  # RATIONAL
+    7: (1, "B"),   # UNDEFINED
+    9: (4, "i"),   # SLONG
+    10: (8, "ii"), # SRATIONAL
+    13: (4, "I"),  # IFD
+}
+
+_TAG_JPEG_OFFSET = 0x0201
+_TAG_JPEG_LENGTH = 0x0202
+
+
+class TiffReader:
+    """在一段 TIFF 数据（EXIF 块或 TIFF 容器文件）上按偏移读取 IFD，不做任何像素解码"""
+
+    def __init__(self, buf, base: int = 0):
+        self._buf = buf
+        self._base = base
+        order = bytes(buf[base:base + 2])
+        if order == b"II":
+            self._e = "<"
+        elif order == b"MM":
+            self._e = ">"
+        else:
+            raise ValueError("not a TIFF header")
+        magic, first = struct.unpack_from(self._e + "HI", buf, base + 2)
+        if magic not in (42, 0x4F52, 0x5352, 0x55):  # TIFF / ORF 变体 / RW2
+            raise ValueError("not a TIFF header")
+        self.first_ifd = first
+
+    def _u(self, fmt: str, offset: int) -> tuple:
+        return struct.unpack_from(self._e + fmt, self._buf, self._base + offset)
+
+    def read_ifd(self, offset: int) -> Tuple[Dict[int, Tuple[int, int, int]], int]:
+        """返回 ({tag: (type, count, 值所在偏移)}, 下一个 IFD 偏移)"""
+        if offset <= 0 or self._base + offset + 2 > len(self._buf):
+            return {}, 0
+        (n,) = self._u("H", offset)
+        entries: Dict[int, Tuple[int, int, int]] = {}
+        pos = offset + 2
+        for _ in range(n):
+            if self._base + pos + 12 > len(self._buf):
+                return entries, 0
+            tag, typ, count = self._u("HHI", pos)
+            size = _TYPES.get(typ, (1, "B"))[0] * count
+            value_at = pos + 8 if size <= 4 else self._u("I", pos + 8)[0]
+            entries[tag] = (typ, count, value_at)
+            pos += 12
+        nxt = self._u("I", pos)[0] if self._base + pos + 4 <= len(self._buf) else 0
+        return entries, nxt
+
+    def values(self, entry: Tuple[int, int, int]) -> List:
+        typ, count, at = entry
+        size, fmt = _TYPES.get(typ, (1, "B"))
+        if self._base + at + size * count > len(self._buf):
+            return []
+        if typ == 2:
+            raw = bytes(self._buf[self._base + at:self._base + at + count])
+            return [raw.split(b"\0", 1)[0].decode("utf-8", "replace")]
+        out = []
+        for i in range(count):
+            v = self._u(fmt, at + i * size)
+            out.append(v if len(v) > 1 else v[0])
+        return out
+
+    def value(self, entry: Tuple[int, int, int]):
+        vals = self.values(entry)
+        return vals[0] if vals else None
+
+    def slice(self, offset: int, length: int) -> bytes:
+        start = self._base + offset
+        return bytes(self._buf[start:start + length])
+
+
+def exif_thumbnail(exif_block: bytes) -> Optional[bytes]:
+    """从 EXIF 块（可带 "Exif\\0\\0" 前缀）的 IFD1 中取出内嵌 JPEG 缩略图"""
+    if not exif_block:
+        return None
+    base = 6 if exif_block.startswith(b"Exif\0\0") else 0
+    try:
+        r = TiffReader(exif_block, base)
+        _, ifd1 = r.read_ifd(r.first_ifd)
+        entries, _ = r.read_ifd(ifd1)
+        if _TAG_JPEG_OFFSET not in entries or _TAG_JPEG_LENGTH not in entries:
+            return None
+        data = r.slice(r.value(entries[_TAG_JPEG_OFFSET]), r.value(entries[_TAG_JPEG_LENGTH]))
+    except (ValueError, struct.error, TypeError):
+        return None
+    return data if data.startswith(b"\xff\xd8") else None
+
+
+# ---- 只读文件头的 EXIF 解析（JPEG APP1 与基于 TIFF 的 RAW 容器） ----
+
+_TAG_EXIF_IFD = 0x8769
+
+# 需要的标签 -> 与 PIL.ExifTags.TAGS 相同的名称，便于与 PIL 路径共用后续转换
+_IFD0_TAGS = {
+    0x0110: "Model",
+    0x0132: "DateTime",
+}
+_EXIF_TAGS = {
+    0x829A: "ExposureTime",
+    0x829D: "FNumber",
+    0x8827: "ISOSpeedRatings",
+    0x9003: "DateTimeOriginal",
+    0x9004: "DateTimeDigitized",
+    0x920A: "FocalLength",
+    0xA434: "LensModel",
+}
+
+# JPEG 中 EXIF 必须位于 SOS 之前；扫描段头时最多看这么多字节
+HEADER_LIMIT = 512 * 1024
+
+
+def _scalar(r: TiffReader, entry: Tuple[int, int, int]):
+    vals = r.values(entry)
+    if not vals:
+        return None
+    if entry[0] in (5, 10):
+        out = []
+        for num, den in vals:
+            out.append(num / den if den else None)
+        vals = out
+    return vals[0] if len(vals) == 1 else tuple(vals)
+
+
+def _jpeg_exif_base(buf) -> Optional[int]:
+    """在 JPEG 段头中找到 APP1 Exif，返回其中 TIFF 头的偏移"""
+    pos = 2
+    end = min(len(buf), HEADER_LIMIT)
+    while pos + 4 <= end:
+        if buf[pos] != 0xFF:
+            return None
+        marker = buf[pos + 1]
+        if marker == 0xFF:          # 填充字节
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        if marker in (0xDA, 0xD9):  # SOS / EOI：EXIF 不会出现在后面
+            return None
+        (length,) = struct.unpack_from(">H", buf, pos + 2)
+        if marker == 0xE1 and bytes(buf[pos + 4:pos + 10]) == b"Exif\0\0":
+            return pos + 10
+        pos += 2 + length
+    return None
+
+
+def _tiff_base(buf) -> Optional[int]:
+    """返回 EXIF 所在 TIFF 结构的起始偏移；不支持的容器返回 None"""
+    head = bytes(buf[:4])
+    if head[:2] == b"\xff\xd8":
+        return _jpeg_exif_base(buf)
+    if head[:2] in (b"II", b"MM"):  # TIFF / DNG / NEF / ARW / CR2 / ORF / RW2 …
+        return 0
+    return None
+
+
+def read_exif_tags(path: str) -> Optional[Dict[str, object]]:
+    """只读取文件头部，解析 IFD0 与 Exif IFD 中拍摄日期、机身、镜头与曝光参数。
+
+    返回以 PIL 标签名为键的字典（有理数已换算为 float）；不是 JPEG/TIFF 容器时返回 None，
+    调用方可退回 PIL。文件通过 mmap 访问，只有实际读到的页会从磁盘载入。
+    """
+    try:
+        with open(path, "rb") as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:      # 空文件
+                return None
+            try:
+                return exif_tags_from_buffer(buf)
+            finally:
+                buf.close()
+    except OSError:
+        return None
+
+
+def exif_tags_from_buffer(buf) -> Optional[Dict[str, object]]:
+    """同 read_exif_tags，作用于调用方已映射或读入的整个文件（mmap / bytes）"""
+    base = _tiff_base(buf)
+    if base is None:
+        return None
+    try:
+        r = TiffReader(buf, base)
+        ifd0, _ = r.read_ifd(r.first_ifd)
+    except (ValueError, struct.error):
+        return None
+    tags: Dict[str, object] = {}
+    try:
+        for tag, name in _IFD0_TAGS.items():
+            if tag in ifd0:
+                tags[name] = _scalar(r, ifd0[tag])
+        if _TAG_EXIF_IFD in ifd0:
+            exif_ifd, _ = r.read_ifd(r.value(ifd0[_TAG_EXIF_IFD]))
+            for tag, name in _EXIF_TAGS.items():
+                if tag in exif_ifd:
+                    tags[name] = _scalar(r, exif_ifd[tag])
+    except (struct.error, TypeError):
+        pass
+    return {k: v for k, v in tags.items() if v is not None}
+
+
+# ---- RAW 内嵌 JPEG 预览 ----
+
+_TAG_SUBIFDS = 0x014A
+_TAG_COMPRESSION = 0x0103
+_TAG_PHOTOMETRIC = 0x0106
+_TAG_STRIP_OFFSETS = 0x0111
+_TAG_STRIP_COUNTS = 0x0117
+_TAG_RW2_JPEG = 0x002E          # Panasonic RW2 的 JpgFromRaw
+_RAW_PHOTOMETRIC = (32803, 34892)   # CFA / LinearRaw：传感器数据而非预览
+_MAX_IFDS = 64
+
+
+def _jpeg_size(buf, start: int, end: int) -> Optional[Tuple[int, int]]:
+    """读 JPEG 的 SOF 段得到 (宽, 高)；无损 JPEG（SOF3，RAW 传感器数据常用）返回 None"""
+    pos = start + 2
+    while pos + 9 <= end:
+        if buf[pos] != 0xFF:
+            return None
+        marker = buf[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        if marker in (0xC0, 0xC1, 0xC2):
+            h, w = struct.unpack_from(">HH", buf, pos + 5)
+            return (w, h) if w and h else None
+        if 0xC3 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return None             # 无损 / 算术编码，PIL 不能解码
+        if marker in (0xDA, 0xD9):
+            return None
+        (length,) = struct.unpack_from(">H", buf, pos + 2)
+        pos += 2 + length
+    return None
+
+
+def _walk_ifds(r: TiffReader) -> List[Dict[int, Tuple[int, int, int]]]:
+    """IFD0 起的主链以及各级 SubIFDs（NEF/DNG 的预览与原始数据常在其中）"""
+    out = []
+    seen = set()
+    todo = [r.first_ifd]
+    while todo and len(out) < _MAX_IFDS:
+        offset = todo.pop(0)
+        if not offset or offset in seen:
+            continue
+        seen.add(offset)
+        entries, nxt = r.read_ifd(offset)
+        if not entries:
+            continue
+        out.append(entries)
+        if _TAG_SUBIFDS in entries:
+            todo.extend(v for v in r.values(entries[_TAG_SUBIFDS]) if isinstance(v, int))
+        todo.append(nxt)
+    return out
+
+
+def _preview_candidates(r: TiffReader, ifd: Dict[int, Tuple[int, int, int]]) -> List[Tuple[int, int]]:
+    """一个 IFD 中可能是 JPEG 预览的 (偏移, 长度)"""
+    out = []
+    if _TAG_JPEG_OFFSET in ifd and _TAG_JPEG_LENGTH in ifd:
+        out.append((r.value(ifd[_TAG_JPEG_OFFSET]), r.value(ifd[_TAG_JPEG_LENGTH])))
+    if _TAG_RW2_JPEG in ifd:
+        _, count, at = ifd[_TAG_RW2_JPEG]
+        out.append((at, count))
+    compression = r.value(ifd[_TAG_COMPRESSION]) if _TAG_COMPRESSION in ifd else None
+    photometric = r.value(ifd[_TAG_PHOTOMETRIC]) if _TAG_PHOTOMETRIC in ifd else None
+    if (
+        compression in (6, 7)
+        and photometric not in _RAW_PHOTOMETRIC
+        and _TAG_STRIP_OFFSETS in ifd
+        and _TAG_STRIP_COUNTS in ifd
+    ):
+        offsets = r.values(ifd[_TAG_STRIP_OFFSETS])
+        counts = r.values(ifd[_TAG_STRIP_COUNTS])
+        if len(offsets) == 1 and len(counts) == 1:
+            out.append((offsets[0], counts[0]))
+    return [(o, n) for o, n in out if isinstance(o, int) and isinstance(n, int) and n > 0]
+
+
+def _largest_preview(buf) -> Optional[Tuple[int, int]]:
+    try:
+        r = TiffReader(buf, 0)
+    except (ValueError, struct.error):
+        return None
+    best = None
+    best_pixels = 0
+    try:
+        for ifd in _walk_ifds(r):
+            for offset, length in _preview_candidates(r, ifd):
+                end = offset + length
+                if end > len(buf) or bytes(buf[offset:offset + 2]) != b"\xff\xd8":
+                    continue
+                size = _jpeg_size(buf, offset, end)
+                if size is not None and size[0] * size[1] > best_pixels:
+                    best, best_pixels = (offset, length), size[0] * size[1]
+    except (struct.error, TypeError):
+        pass
+    return best
+
+
+def raw_preview(path: str) -> Optional[bytes]:
+    """从 RAW/TIFF 容器中切出像素最多的内嵌 JPEG 预览；只读 IFD 与预览本身，不解码传感器数据"""
+    try:
+        with open(path, "rb") as f:
+            if f.read(2) not in (b"II", b"MM"):
+                return None
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return None
+            try:
+                return raw_preview_from_buffer(buf)
+            finally:
+                buf.close()
+    except OSError:
+        return None
+
+
+def raw_preview_from_buffer(buf) -> Optional[bytes]:
+    """同 raw_preview，作用于调用方已映射或读入的整个文件"""
+    if bytes(buf[:2]) not in (b"II", b"MM"):
+        return None
+    found = _largest_preview(buf)
+    if found is None:
+        return None
+    offset, length = found
+    return bytes(buf[offset:offset + length])
+
+
+if __name__ == "__main__":
+    # 对比吞吐：python exif_reader.py 照片1 照片2 …
+    import sys
+    import time
+
+    paths = sys.argv[1:]
+    if not paths:
+        sys.exit("usage: python exif_reader.py FILE...")
+
+    from metadata_service import metadata_from_image, metadata_from_tags
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+
+    def bench(label, fn, rounds=3):
+        best = None
+        ok = 0
+        for _ in range(rounds):
+            start = time.perf_counter()
+            ok = sum(1 for p in paths if fn(p) is not None)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        rate = len(paths) / best if best else float("inf")
+        print(f"{label:<8} {ok}/{len(paths)} with EXIF  {best * 1000:8.1f} ms  {rate:10.1f} files/s")
+
+    def header(p):
+        tags = read_exif_tags(p)
+        return metadata_from_tags(tags).exif if tags else None
+
+    def pil(p):
+        try:
+            with Image.open(p) as img:
+                return metadata_from_image(img).exif
+        except Exception:
+            return None
+
+    bench("header", header)
+    if Image is not None:
+        bench("PIL", pil)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+import hashlib
+import os
+from typing import Optional
+
+# 快速指纹只读文件头尾各一块；两块覆盖整个文件时指纹即完整内容哈希
+_BLOCK = 64 * 1024
+_CHUNK = 1024 * 1024
+
+
+def quick_fingerprint(path: str) -> Optional[str]:
+    """文件大小 + 头尾各 64 KB 的 blake2b，形如 "<大小十六进制>-<32 位摘要>"；读取失败返回 None"""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            h = hashlib.blake2b(digest_size=16)
+            h.update(f.read(_BLOCK))
+            if size > 2 * _BLOCK:
+                f.seek(size - _BLOCK)
+                h.update(f.read(_BLOCK))
+            elif size > _BLOCK:
+                h.update(f.read())
+    except OSError:
+        return None
+    return f"{size:x}-{h.hexdigest()}"
+
+
+def fingerprint_buffer(buf) -> str:
+    """同 quick_fingerprint，作用于调用方已映射或读入的整个文件（mmap / bytes）"""
+    size = len(buf)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(buf[:_BLOCK])
+    if size > 2 * _BLOCK:
+        h.update(buf[size - _BLOCK:])
+    elif size > _BLOCK:
+        h.update(buf[_BLOCK:])
+    return f"{size:x}-{h.hexdigest()}"
+
+
+def is_exact(fingerprint: str) -> bool:
+    """指纹是否已覆盖整个文件（小文件无需再做完整哈希）"""
+    return int(fingerprint.split("-", 1)[0], 16) <= 2 * _BLOCK
+
+
+def full_hash(path: str) -> Optional[str]:
+    """整个文件的流式 blake2b，只在快速指纹相同时用来确认"""
+    h = hashlib.blake2b(digest_size=32)
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(_CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def same_content(fingerprint: str, path: str, other_path: str) -> bool:
+    """两个快速指纹相同的文件是否内容一致；另一份已无法读取（如存储卡已拔出）时信任快速指纹"""
+    if is_exact(fingerprint) or os.path.abspath(path) == os.path.abspath(other_path):
+        return True
+    other = full_hash(other_path)
+    if other is None:
+        return True
+    return full_hash(path) == other
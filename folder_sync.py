@@ -0,0 +1,207 @@
+from __future__ import annotations
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from library_store import LibraryStore
+from import_service import CancelToken, ImportProgress, ImportResult, import_files
+
+
+_MANIFEST_PATH = os.path.join(
+    os.path.expanduser("~"), "Library", "Application Support", "TAGGER", "scan_manifest.json"
+)
+
+# 与导入对话框的文件类型一致
+IMAGE_EXTENSIONS = frozenset((
+    ".jpg", ".jpeg", ".png", ".tiff", ".tif", ".heic",
+    ".raw", ".arw", ".cr2", ".nef", ".dng",
+))
+
+
+def scan_tree(root: str, cancel: Optional[CancelToken] = None) -> Iterator[Tuple[str, int, int]]:
+    """用 os.scandir 递归遍历，产出 (绝对路径, 大小, mtime_ns)；跳过隐藏文件/目录与符号链接"""
+    stack = [os.path.abspath(root)]
+    while stack:
+        if cancel is not None and cancel.cancelled:
+            return
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif (entry.is_file(follow_symlinks=False)
+                          and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS):
+                        st = entry.stat(follow_symlinks=False)
+                        yield entry.path, st.st_size, st.st_mtime_ns
+                except OSError:
+                    continue
+
+
+@dataclass
+class ScanPlan:
+    root: str
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)       # 大小或修改时间与清单不同
+    missing: List[str] = field(default_factory=list)       # 清单中有、磁盘上已不存在
+    unchanged: int = 0
+    stats: Dict[str, Tuple[int, int]] = field(default_factory=dict)   # new/changed 的 (大小, mtime_ns)
+
+    @property
+    def to_import(self) -> List[str]:
+        return self.new + self.changed
+
+
+@dataclass
+class SyncResult:
+    plan: ScanPlan
+    result: ImportResult
+    missing_ids: List[str] = field(default_factory=list)  # 原文件已不存在的照片
+    replaced: int = 0                                     # 内容变化、已用新记录替换的照片
+
+
+class ScanManifest:
+    """记录每个已同步文件的 (大小, mtime_ns, 照片 id)，下次同步只处理新增或变化的文件"""
+
+    def __init__(self, path: str = _MANIFEST_PATH):
+        self._path = path
+        self._files: Dict[str, Tuple[int, int, str]] = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._files = {p: (int(v[0]), int(v[1]), str(v[2])) for p, v in data.get("files", {}).items()}
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError, IndexError, TypeError, ValueError):
+            self._files = {}
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            tmp = self._path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "files": self._files}, f, ensure_ascii=False)
+            os.replace(tmp, self._path)
+        except OSError:
+            pass
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def photo_id(self, path: str) -> Optional[str]:
+        entry = self._files.get(path)
+        return entry[2] if entry else None
+
+    def record(self, path: str, size: int, mtime_ns: int, photo_id: str):
+        self._files[path] = (size, mtime_ns, photo_id)
+
+    def forget(self, paths):
+        for p in paths:
+            self._files.pop(p, None)
+
+    def plan(self, root: str, cancel: Optional[CancelToken] = None) -> ScanPlan:
+        root = os.path.abspath(root)
+        plan = ScanPlan(root)
+        seen = set()
+        for path, size, mtime in scan_tree(root, cancel):
+            seen.add(path)
+            entry = self._files.get(path)
+            if entry is None:
+                plan.new.append(path)
+            elif entry[0] != size or entry[1] != mtime:
+                plan.changed.append(path)
+            else:
+                plan.unchanged += 1
+                continue
+            plan.stats[path] = (size, mtime)
+        if cancel is None or not cancel.cancelled:
+            prefix = root.rstrip(os.sep) + os.sep
+            plan.missing = sorted(p for p in self._files if p.startswith(prefix) and p not in seen)
+        plan.new.sort()
+        plan.changed.sort()
+        return plan
+
+
+def finish_sync(store: LibraryStore, manifest: ScanManifest, plan: ScanPlan, result: ImportResult) -> SyncResult:
+    """导入完成后更新清单；内容变化的文件把旧记录的标签并入新记录后移除旧记录"""
+    sync = SyncResult(plan, result)
+    changed = set(plan.changed)
+    with store.batch():
+        for photo in result.imported:
+            path = photo.source_path
+            old_id = manifest.photo_id(path) if path in changed else None
+            old = store.get(old_id) if old_id else None
+            if old is not None and old.id != photo.id:
+                if old.tags:
+                    store.add_tags({photo.id}, old.tags)
+                store.delete_photos({old.id})
+                sync.replaced += 1
+            size, mtime = plan.stats[path]
+            manifest.record(path, size, mtime, photo.id)
+        for path, photo_id in result.duplicates:
+            size, mtime = plan.stats[path]
+            manifest.record(path, size, mtime, photo_id)
+    for path in plan.missing:
+        pid = manifest.photo_id(path)
+        if pid and store.get(pid) is not None:
+            sync.missing_ids.append(pid)
+        else:
+            manifest.forget((path,))     # 照片已从库中移除，不再提示
+    manifest.save()
+    return sync
+
+
+def sync_folder(
+    root: str,
+    store: LibraryStore,
+    initial_tags: List[str] | None = None,
+    manifest: Optional[ScanManifest] = None,
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[ImportProgress], None]] = None,
+    cancel: Optional[CancelToken] = None,
+) -> SyncResult:
+    """递归同步一个文件夹：只导入新增或变化的文件，并列出原文件已消失的照片（不会自动删除）"""
+    manifest = manifest if manifest is not None else ScanManifest()
+    plan = manifest.plan(root, cancel)
+    result = import_files(plan.to_import, initial_tags, store, workers, progress, cancel)
+    return finish_sync(store, manifest, plan, result)
+
+
+if __name__ == "__main__":
+    # 命令行同步：python folder_sync.py 文件夹 [--tag 标签 …] [--workers N]
+    import argparse
+    import time
+    import thumb_cache
+    from app_settings import AppSettings
+
+    parser = argparse.ArgumentParser(description="Incrementally import a folder tree into the TAGGER library")
+    parser.add_argument("root")
+    parser.add_argument("--tag", action="append", default=[], help="tag applied to newly imported photos")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    settings = AppSettings()
+    # 与 TaggerApp 相同：先按设置选好缩略图后端与预算，再载入库
+    thumb_cache.configure(settings.thumb_backend, max_bytes=settings.thumb_cache_mb * 1024 * 1024)
+    store = LibraryStore(engine=settings.storage_engine)
+    sync = sync_folder(
+        args.root, store, args.tag, workers=args.workers,
+        progress=lambda p: print(f"\r{p.done}/{p.total}", end="", flush=True),
+    )
+    r = sync.result
+    print(f"\nnew {len(sync.plan.new)}, changed {len(sync.plan.changed)}, unchanged {sync.plan.unchanged}")
+    print(f"imported {len(r.imported)}, duplicates {len(r.duplicates)}, failed {len(r.failures)}, "
+          f"replaced {sync.replaced}")
+    if sync.plan.missing:
+        print(f"missing {len(sync.plan.missing)} (photos still in library: {len(sync.missing_ids)})")
+    for path, err in r.failures:
+        print(f"  failed: {path}: {err}")
+    print(f"done in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,101 @@
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Set, Tuple
+
+
+@dataclass
+class ImageCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes_used: int = 0
+    max_bytes: int = 0
+
+
+# 每个条目的固定开销（键、OrderedDict 节点、按照片分组的集合项）；None 条目只计这一项，
+# 因此大量解码失败的照片也会按数量被淘汰，而不会无限累积
+_ENTRY_OVERHEAD = 256
+
+
+def _image_bytes(img) -> int:
+    """PhotoImage 在 Tk 中按每像素 4 字节保存"""
+    if img is None:
+        return 0
+    try:
+        return img.width() * img.height() * 4
+    except Exception:
+        return 0
+
+
+class ImageLRU:
+    """按 (photo_id, 尺寸) 缓存 PhotoImage，总像素字节超过预算时淘汰最久未用的条目。
+
+    None 也会被缓存（表示该照片没有可用缩略图），避免反复解码失败的文件；
+    每个条目另计 _ENTRY_OVERHEAD 字节。
+    """
+
+    def __init__(self, max_bytes: int = 96 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Tuple[str, int], Tuple[object, int]]" = OrderedDict()
+        self._by_photo: Dict[str, Set[Tuple[str, int]]] = {}
+        self._bytes = 0
+        self._stats = ImageCacheStats(max_bytes=max_bytes)
+
+    def __contains__(self, key: Tuple[str, int]) -> bool:
+        return key in self._items
+
+    def lookup(self, key: Tuple[str, int]) -> Tuple[bool, object]:
+        """返回 (是否命中, 图像)"""
+        item = self._items.get(key)
+        if item is None:
+            self._stats.misses += 1
+            return False, None
+        self._items.move_to_end(key)
+        self._stats.hits += 1
+        return True, item[0]
+
+    def put(self, key: Tuple[str, int], img):
+        self._discard(key)
+        nbytes = _image_bytes(img) + _ENTRY_OVERHEAD
+        self._items[key] = (img, nbytes)
+        self._by_photo.setdefault(key[0], set()).add(key)
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            old_key = next(iter(self._items))
+            if old_key == key:
+                break
+            self._discard(old_key)
+            self._stats.evictions += 1
+
+    def invalidate(self, photo_id: Hashable):
+        for key in list(self._by_photo.get(photo_id, ())):
+            self._discard(key)
+
+    def clear(self):
+        self._items.clear()
+        self._by_photo.clear()
+        self._bytes = 0
+
+    def stats(self) -> ImageCacheStats:
+        s = self._stats
+        return ImageCacheStats(
+            hits=s.hits,
+            misses=s.misses,
+            evictions=s.evictions,
+            entries=len(self._items),
+            bytes_used=self._bytes,
+            max_bytes=self.max_bytes,
+        )
+
+    def _discard(self, key: Tuple[str, int]):
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+        self._bytes -= item[1]
+        keys = self._by_photo.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_photo[key[0]]
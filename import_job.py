@@ -0,0 +1,409 @@
+from __future__ import annotations
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from library_models import LibraryPhoto
+from library_store import LibraryStore
+from import_service import CancelToken, ImportResult, collect_result, iter_import, split_duplicates
+from file_fingerprint import quick_fingerprint
+from folder_sync import ScanManifest, ScanPlan, SyncResult, finish_sync
+from thumb_cache import THUMB_SIZES, peek_thumb
+from thumbnail_service import features_from_jpeg
+
+
+@dataclass
+class ImportStatus:
+    done: int
+    total: int
+    imported: int
+    failed: int
+    elapsed: float                 # 秒
+    duplicates: int = 0            # 已在库中、跳过的文件
+    current: str = ""              # 最近完成的文件
+    finished: bool = False
+    checked: int = 0               # 查重阶段已算出指纹的文件数
+
+    @property
+    def rate(self) -> float:
+        """每秒处理的文件数"""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """预计剩余秒数；尚无完成的文件时为 None"""
+        if self.done == 0 or self.rate <= 0:
+            return None
+        return (self.total - self.done) / self.rate
+
+
+_DONE = object()
+
+
+class BackgroundImport:
+    """在后台线程运行 iter_import，结果按批通过 after() 交回 Tk 主线程入库。
+
+    store 只在主线程中修改：每次轮询把这段时间完成的照片一次性 add_imported_many，
+    界面因此只收到一次事件。on_progress / on_done 同样在主线程中调用。
+    写盘在整个任务期间推迟（store.defer_saves），每隔 save_interval 秒做一次检查点，结束时写入剩余部分。
+    """
+
+    def __init__(
+        self,
+        widget,
+        store: LibraryStore,
+        paths: List[str],
+        initial_tags: List[str] | None = None,
+        workers: Optional[int] = None,
+        on_progress: Optional[Callable[[ImportStatus], None]] = None,
+        on_done: Optional[Callable[[ImportResult], None]] = None,
+        poll_ms: int = 250,
+        save_interval: float = 30.0,
+    ):
+        self._widget = widget
+        self._store = store
+        self._paths = list(paths)
+        self._save_interval = save_interval
+        self._last_save = 0.0
+        self._deferring = False
+        self._initial_tags = list(initial_tags or [])
+        self._workers = workers
+        self._on_progress = on_progress
+        self._on_done = on_done
+        self._poll_ms = poll_ms
+        self._cancel = CancelToken()
+        self._results: "queue.Queue" = queue.Queue()
+        self._imported: List[Tuple[int, LibraryPhoto]] = []
+        self._failures: List[Tuple[int, str, str]] = []
+        self._duplicates: Dict[int, Union[str, int]] = {}
+        # 查重用的指纹快照在主线程取得，后台线程不直接访问 store
+        self._known = store.fingerprint_index()
+        self._current = ""
+        self._checked = 0               # 由后台线程更新，只做整数赋值
+        self._started = 0.0
+        self._finished = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and not self._finished
+
+    def start(self):
+        self._started = self._last_save = time.monotonic()
+        self._store.defer_saves()
+        self._deferring = True
+        self._thread = threading.Thread(target=self._run, name="import", daemon=True)
+        self._thread.start()
+        self._widget.after(self._poll_ms, self._drain)
+
+    def cancel(self):
+        """处理中的文件完成后停止；已完成的照片仍会入库"""
+        self._cancel.cancel()
+
+    def shutdown(self):
+        """程序退出时调用：停止任务，把已完成的照片入库并写盘（不再等待处理中的文件）"""
+        self._cancel.cancel()
+        if not self._finished:
+            self._ingest()
+            self._finished = True
+        self._resume_saves()
+
+    def _resume_saves(self):
+        if self._deferring:
+            self._deferring = False
+            self._store.resume_saves()
+
+    def status(self) -> ImportStatus:
+        done = len(self._imported) + len(self._failures) + len(self._duplicates)
+        return ImportStatus(
+            done=done,
+            total=len(self._paths),
+            imported=len(self._imported),
+            failed=len(self._failures),
+            elapsed=time.monotonic() - self._started,
+            duplicates=len(self._duplicates),
+            current=self._current,
+            finished=self._finished,
+            checked=self._checked,
+        )
+
+    def _set_checked(self, count: int):
+        self._checked = count
+
+    def _run(self):
+        try:
+            todo, fingerprints, duplicates = split_duplicates(
+                self._paths, self._known, self._cancel, self._set_checked
+            )
+            self._results.put(duplicates)
+            sub_paths = [self._paths[i] for i in todo]
+            for j, path, photo, error in iter_import(
+                sub_paths, self._initial_tags, self._workers, self._cancel,
+                [fingerprints[i] for i in todo],
+            ):
+                self._results.put((todo[j], path, photo, error))
+        except Exception as e:
+            # 进程池本身出错（而非单个文件失败）：剩余文件全部记为失败
+            self._results.put(e)
+        finally:
+            self._results.put(_DONE)
+
+    def _drain(self):
+        if self._finished:
+            return      # 已 shutdown
+        finished = self._ingest()
+        self._finished = finished
+        if finished:
+            self._resume_saves()
+        elif time.monotonic() - self._last_save >= self._save_interval:
+            self._last_save = time.monotonic()
+            self._store.flush_saves()
+        if self._on_progress is not None:
+            self._on_progress(self.status())
+        if finished:
+            if self._on_done is not None:
+                self._on_done(self._result())
+        else:
+            self._widget.after(self._poll_ms, self._drain)
+
+    def _ingest(self) -> bool:
+        """把队列中已完成的结果入库；返回后台线程是否已结束"""
+        batch: List[LibraryPhoto] = []
+        finished = False
+        while True:
+            try:
+                item = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                finished = True
+                break
+            if isinstance(item, dict):
+                # 查重结果：内容已在库中的文件不再处理，初始标签合并到已有照片
+                self._duplicates = item
+                existing = {t for t in item.values() if isinstance(t, str)}
+                if existing and self._initial_tags:
+                    self._store.add_tags(existing, self._initial_tags)
+                continue
+            if isinstance(item, Exception):
+                seen = {i for i, _ in self._imported} | {i for i, _, _ in self._failures}
+                seen |= set(self._duplicates)
+                self._failures.extend(
+                    (i, p, str(item)) for i, p in enumerate(self._paths) if i not in seen
+                )
+                continue
+            idx, path, photo, error = item
+            self._current = path
+            if photo is not None:
+                self._imported.append((idx, photo))
+                batch.append(photo)
+            else:
+                self._failures.append((idx, path, error or ""))
+
+        if batch:
+            self._store.add_imported_many(batch)
+        return finished
+
+    def _result(self) -> ImportResult:
+        return collect_result(
+            self._paths, self._imported, self._failures, self._duplicates, self._cancel.cancelled
+        )
+
+
+class BackgroundSync:
+    """后台同步文件夹：先在线程中扫描并与清单比对，再用 BackgroundImport 导入新增/变化的文件。
+
+    on_planned 在扫描完成后调用一次（可据此设置进度总数）；on_progress / on_done 同 BackgroundImport，
+    都在主线程中调用。
+    """
+
+    def __init__(
+        self,
+        widget,
+        store: LibraryStore,
+        root: str,
+        initial_tags: List[str] | None = None,
+        workers: Optional[int] = None,
+        on_planned: Optional[Callable[[ScanPlan], None]] = None,
+        on_progress: Optional[Callable[[ImportStatus], None]] = None,
+        on_done: Optional[Callable[[SyncResult], None]] = None,
+        poll_ms: int = 250,
+    ):
+        self._widget = widget
+        self._store = store
+        self._root = root
+        self._initial_tags = list(initial_tags or [])
+        self._workers = workers
+        self._on_planned = on_planned
+        self._on_progress = on_progress
+        self._on_done = on_done
+        self._poll_ms = poll_ms
+        self._cancel = CancelToken()
+        self._manifest: Optional[ScanManifest] = None
+        self._plan: Optional[ScanPlan] = None
+        self._job: Optional[BackgroundImport] = None
+        self._thread: Optional[threading.Thread] = None
+        self._finished = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and not self._finished
+
+    @property
+    def manifest(self) -> Optional[ScanManifest]:
+        return self._manifest
+
+    def start(self):
+        self._thread = threading.Thread(target=self._scan, name="folder-scan", daemon=True)
+        self._thread.start()
+        self._widget.after(self._poll_ms, self._wait_plan)
+
+    def cancel(self):
+        self._cancel.cancel()
+        if self._job is not None:
+            self._job.cancel()
+
+    def shutdown(self):
+        """程序退出时调用；已导入的照片入库写盘，清单留到下次同步时由查重补记"""
+        self._cancel.cancel()
+        self._finished = True
+        if self._job is not None:
+            self._job.shutdown()
+
+    def _scan(self):
+        # 清单的读取与目录遍历都在后台线程；扫描结束前主线程不访问 manifest
+        manifest = ScanManifest()
+        self._plan = manifest.plan(self._root, self._cancel)
+        self._manifest = manifest
+
+    def _wait_plan(self):
+        if self._finished:
+            return      # 已 shutdown
+        if self._thread.is_alive():
+            self._widget.after(self._poll_ms, self._wait_plan)
+            return
+        plan = self._plan
+        if self._on_planned is not None:
+            self._on_planned(plan)
+        if self._cancel.cancelled or not plan.to_import:
+            self._imported(ImportResult(cancelled=self._cancel.cancelled))
+            return
+        self._job = BackgroundImport(
+            self._widget, self._store, plan.to_import, self._initial_tags, self._workers,
+            on_progress=self._on_progress, on_done=self._imported, poll_ms=self._poll_ms,
+        )
+        self._job.start()
+
+    def _imported(self, result: ImportResult):
+        self._finished = True
+        sync = finish_sync(self._store, self._manifest, self._plan, result)
+        if self._on_done is not None:
+            self._on_done(sync)
+
+
+class _Backfill(ABC):
+    """补算任务：后台线程逐项计算，主线程分批写回；子类提供 _compute / _apply"""
+
+    thread_name = "backfill"
+
+    def __init__(self, widget, store: LibraryStore, items: list, poll_ms: int = 500, flush_every: int = 5000):
+        self._widget = widget
+        self._store = store
+        self._poll_ms = poll_ms
+        # JSON 引擎每次写回都重写整个索引文件，因此攒够一批再写
+        self._flush_every = flush_every
+        self._pending: Dict[str, object] = {}
+        self._items = items
+        self._cancel = CancelToken()
+        self._results: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if not self._items:
+            return
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._thread.start()
+        self._widget.after(self._poll_ms, self._drain)
+
+    def cancel(self):
+        self._cancel.cancel()
+
+    @abstractmethod
+    def _compute(self, item) -> Optional[Tuple[str, object]]:
+        """在后台线程中执行；返回 (照片 id, 值)，无法计算时返回 None"""
+
+    @abstractmethod
+    def _apply(self, values: Dict[str, object]):
+        """在主线程中把一批结果写回 store"""
+
+    def _run(self):
+        try:
+            for item in self._items:
+                if self._cancel.cancelled:
+                    break
+                result = self._compute(item)
+                if result is not None:
+                    self._results.put(result)
+        finally:
+            self._results.put(_DONE)
+
+    def _drain(self):
+        finished = False
+        while True:
+            try:
+                item = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                finished = True
+                break
+            self._pending[item[0]] = item[1]
+        if self._pending and (finished or len(self._pending) >= self._flush_every):
+            values, self._pending = self._pending, {}
+            self._apply(values)
+        if not finished:
+            self._widget.after(self._poll_ms, self._drain)
+
+
+class FeatureBackfill(_Backfill):
+    """给缺少 dHash / 颜色特征的旧照片补算：读取缓存缩略图计算。
+
+    只读缓存（不从原图重新生成）；缓存中没有缩略图的照片跳过，下次启动再试。
+    """
+
+    thread_name = "feature-backfill"
+
+    def __init__(self, widget, store: LibraryStore, poll_ms: int = 500, flush_every: int = 5000):
+        super().__init__(widget, store, store.missing_feature_ids(), poll_ms, flush_every)
+
+    def _compute(self, photo_id: str):
+        data = peek_thumb(photo_id, min(THUMB_SIZES))
+        return (photo_id, features_from_jpeg(data)) if data is not None else None
+
+    def _apply(self, values: Dict[str, Tuple[Optional[int], Optional[bytes]]]):
+        self._store.set_dhashes({i: h for i, (h, _) in values.items() if h is not None})
+        self._store.set_color_features({i: c for i, (_, c) in values.items() if c is not None})
+
+
+class FingerprintBackfill(_Backfill):
+    """给查重功能加入前导入的照片补算快速指纹：读取原文件头尾。
+
+    原文件已不存在（或所在存储卡未接入）的照片跳过，下次启动再试。
+    """
+
+    thread_name = "fingerprint-backfill"
+
+    def __init__(self, widget, store: LibraryStore, poll_ms: int = 500, flush_every: int = 5000):
+        # 路径在主线程取得，后台线程不直接访问 store
+        super().__init__(widget, store, store.missing_fingerprints(), poll_ms, flush_every)
+
+    def _compute(self, item: Tuple[str, str]):
+        photo_id, path = item
+        fp = quick_fingerprint(path)
+        return (photo_id, fp) if fp is not None else None
+
+    def _apply(self, values: Dict[str, str]):
+        self._store.set_fingerprints(values)
@@ -1,37 +1,329 @@
 from __future__ import annotations
+import mmap
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from dataclasses import dataclass, field
-from typing import List, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 from library_models import LibraryPhoto
-from metadata_service import read_metadata
-from thumbnail_service import save_thumbnail
-from thumb_cache import thumb_url
+from library_store import LibraryStore
+from exif_reader import exif_tags_from_buffer
+from file_fingerprint import fingerprint_buffer, quick_fingerprint, same_content
+from metadata_service import Metadata, metadata_from_image, metadata_from_tags
+from color_index import color_feature
+from thumbnail_service import _PIL_OK, dhash_from_image, open_source_buffer, thumbnail_pyramid_levels
+from thumb_cache import THUMB_SIZES, save_thumbs
 
 
 @dataclass
 class ImportResult:
     imported: List[LibraryPhoto] = field(default_factory=list)
     failures: List[Tuple[str, str]] = field(default_factory=list)
+    duplicates: List[Tuple[str, str]] = field(default_factory=list)   # (路径, 已有照片 id)，未重复导入
+    cancelled: bool = False
 
 
-def import_files(paths: List[str], initial_tags: List[str] | None = None) -> ImportResult:
-    result = ImportResult()
-    initial_tags = initial_tags or []
+@dataclass
+class ImportProgress:
+    done: int
+    total: int
+    path: str
+    photo: Optional[LibraryPhoto] = None
+    error: Optional[str] = None
+
+
+class CancelToken:
+    """跨线程的取消标记；import 在处理完当前文件后停止提交新任务"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+@dataclass
+class ProcessedFile:
+    metadata: Metadata
+    thumbnails: Dict[int, bytes] = field(default_factory=dict)   # 长边像素 -> JPEG 字节
+    dhash: Optional[int] = None                                  # 以下两项由最小一级缩略图计算
+    color: Optional[bytes] = None                                # color_index.color_feature
+    fingerprint: Optional[str] = None                            # 仅在 with_fingerprint 时计算
+
 
-    for path in paths:
+def process_file(
+    path: str,
+    sizes: Tuple[int, ...] = THUMB_SIZES,
+    quality: int = 78,
+    fast: bool = True,
+    with_fingerprint: bool = False,
+) -> ProcessedFile:
+    """只打开一次文件，同时得到元数据、各尺寸缩略图字节、dHash 与颜色特征（及快速指纹）；
+    fast 见 thumbnail_from_image。
+
+    文件整体 mmap 一次，EXIF 解析、指纹、PIL 解码与 RAW 内嵌预览都读同一个映射，
+    只有实际访问到的页会从磁盘载入。元数据优先由 exif_reader 从文件头读取；
+    PIL 打不开的 RAW 用内嵌 JPEG 预览生成缩略图。
+
+    文件读不了时抛出 OSError；既不是图片也没有 EXIF 的文件抛出 ValueError，由调用方记为失败。
+    """
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError("文件为空") from None
         try:
-            meta = read_metadata(path)
+            return _process_buffer(buf, sizes, quality, fast, with_fingerprint)
+        finally:
+            buf.close()
+
+
+def _process_buffer(buf, sizes, quality, fast, with_fingerprint) -> ProcessedFile:
+    fp = fingerprint_buffer(buf) if with_fingerprint else None
+    tags = exif_tags_from_buffer(buf)
+    meta = metadata_from_tags(tags) if tags is not None else None
+    img = open_source_buffer(buf)
+    if img is None:
+        # 没有 PIL 时无法判断格式，照常导入（只是没有缩略图）
+        if _PIL_OK and tags is None:
+            raise ValueError("无法识别的图片格式")
+        return ProcessedFile(meta or Metadata(), fingerprint=fp)
+    with img:
+        if meta is None:
+            meta = metadata_from_image(img)
+        thumbs, smallest = thumbnail_pyramid_levels(img, sizes, quality, fast)
+    if smallest is None:
+        return ProcessedFile(meta or Metadata(), thumbs, fingerprint=fp)
+    return ProcessedFile(
+        meta or Metadata(), thumbs, dhash_from_image(smallest), color_feature(smallest), fp
+    )
+
+
+def default_workers() -> int:
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _process_one(
+    path: str,
+    initial_tags: List[str],
+    fingerprint: Optional[str] = None,
+) -> Tuple[LibraryPhoto, Dict[int, bytes]]:
+    """在工作进程中执行：读取元数据并生成各尺寸缩略图字节"""
+    processed = process_file(path, with_fingerprint=fingerprint is None)
+    photo = LibraryPhoto.from_source_path(path, tags=list(initial_tags))
+    photo.capture_date = processed.metadata.capture_date
+    photo.exif = processed.metadata.exif
+    photo.fingerprint = fingerprint or processed.fingerprint
+    photo.dhash = processed.dhash
+    photo.color_feature = processed.color
+    return photo, processed.thumbnails
+
 
-            photo = LibraryPhoto.from_source_path(path, tags=list(initial_tags))
-            photo.capture_date = meta.capture_date
-            photo.exif = meta.exif
+KnownFingerprints = Dict[str, List[Tuple[str, str]]]
 
-            dest = thumb_url(photo.id)
-            if save_thumbnail(path, dest):
-                photo.thumbnail_path = dest
+# 指纹计算以读文件为主（hashlib 计算时也释放 GIL），用线程并行即可，不必走进程池
+FINGERPRINT_THREADS = 8
 
-            result.imported.append(photo)
-        except Exception as e:
-            result.failures.append((path, str(e)))
 
+def fingerprint_files(
+    paths: List[str],
+    cancel: Optional[CancelToken] = None,
+    progress: Optional[Callable[[int], None]] = None,
+    threads: int = FINGERPRINT_THREADS,
+) -> List[Optional[str]]:
+    """并行计算快速指纹，按输入顺序返回；progress(已完成数) 在调用线程中按块回调。
+
+    取消时只返回已算完的前缀（长度可能小于 len(paths)）。
+    """
+    out: List[Optional[str]] = []
+    chunk = max(1, threads) * 16
+    with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="fingerprint") as pool:
+        for start in range(0, len(paths), chunk):
+            if cancel is not None and cancel.cancelled:
+                break
+            out.extend(pool.map(quick_fingerprint, paths[start:start + chunk]))
+            if progress is not None:
+                progress(len(out))
+    return out
+
+
+def split_duplicates(
+    paths: List[str],
+    known: KnownFingerprints,
+    cancel: Optional[CancelToken] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Tuple[List[int], List[Optional[str]], Dict[int, Union[str, int]]]:
+    """按快速指纹查重（每个文件一次字典查找，指纹相同时才做完整哈希确认）。
+
+    known 为 LibraryStore.fingerprint_index() 的快照。返回 (需要导入的序号, 各文件指纹,
+    重复项: 序号 -> 已有照片 id，或本批中首次出现的序号)。progress 见 fingerprint_files。
+    取消时未检查的文件不出现在结果中。
+    """
+    todo: List[int] = []
+    fingerprints: List[Optional[str]] = [None] * len(paths)
+    duplicates: Dict[int, Union[str, int]] = {}
+    first_seen: Dict[str, List[int]] = {}
+    for idx, fp in enumerate(fingerprint_files(paths, cancel, progress)):
+        if cancel is not None and cancel.cancelled:
+            break
+        path = paths[idx]
+        fingerprints[idx] = fp
+        if fp is None:
+            todo.append(idx)            # 读不了的文件交给后续处理报告错误
+            continue
+        target: Union[str, int, None] = next(
+            (pid for pid, src in known.get(fp, ()) if same_content(fp, path, src)), None
+        )
+        if target is None:
+            target = next((j for j in first_seen.get(fp, ()) if same_content(fp, path, paths[j])), None)
+        if target is not None:
+            duplicates[idx] = target
+        else:
+            first_seen.setdefault(fp, []).append(idx)
+            todo.append(idx)
+    return todo, fingerprints, duplicates
+
+
+def collect_result(
+    paths: List[str],
+    imported: List[Tuple[int, LibraryPhoto]],
+    failures: List[Tuple[int, str, str]],
+    duplicates: Dict[int, Union[str, int]],
+    cancelled: bool,
+) -> ImportResult:
+    """把按完成顺序收集的结果整理成按输入顺序排列的 ImportResult"""
+    by_idx = dict(imported)
+    errors = {idx: err for idx, _, err in failures}
+    failures = list(failures)
+    dup_rows: List[Tuple[int, str, str]] = []
+    for idx, target in duplicates.items():
+        if isinstance(target, str):
+            dup_rows.append((idx, paths[idx], target))
+        elif target in by_idx:
+            dup_rows.append((idx, paths[idx], by_idx[target].id))
+        elif target in errors:
+            failures.append((idx, paths[idx], errors[target]))
+
+    result = ImportResult()
+    result.imported = [p for _, p in sorted(imported, key=lambda x: x[0])]
+    result.failures = [(path, err) for _, path, err in sorted(failures)]
+    result.duplicates = [(path, pid) for _, path, pid in sorted(dup_rows)]
+    finished = len(imported) + len(failures) + len(dup_rows)
+    result.cancelled = cancelled and finished < len(paths)
     return result
+
+
+def _store_thumbnail(photo: LibraryPhoto, thumbs: Dict[int, bytes]):
+    ref = save_thumbs(photo.id, thumbs)
+    if ref is not None:
+        photo.thumbnail_path = ref
+
+
+def iter_import(
+    paths: List[str],
+    initial_tags: List[str] | None = None,
+    workers: Optional[int] = None,
+    cancel: Optional[CancelToken] = None,
+    fingerprints: Optional[List[Optional[str]]] = None,
+) -> Iterator[Tuple[int, str, Optional[LibraryPhoto], Optional[str]]]:
+    """按完成顺序逐个产出 (输入序号, 路径, 照片, 错误)；workers<=1 时在当前线程内顺序处理。
+
+    fingerprints 与 paths 一一对应（已由 split_duplicates 算出时传入，避免重复读取）。
+    """
+    initial_tags = list(initial_tags or [])
+    workers = default_workers() if workers is None else workers
+    fingerprints = fingerprints or [None] * len(paths)
+
+    if workers <= 1 or len(paths) <= 1:
+        for idx, path in enumerate(paths):
+            if cancel is not None and cancel.cancelled:
+                return
+            try:
+                photo, data = _process_one(path, initial_tags, fingerprints[idx])
+                _store_thumbnail(photo, data)
+                yield idx, path, photo, None
+            except Exception as e:
+                yield idx, path, None, str(e)
+        return
+
+    # 限制在途任务数，避免一次性提交上千个任务，也让取消能尽快生效
+    window = workers * 4
+    pending: Dict[Future, int] = {}
+    next_idx = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            while pending or next_idx < len(paths):
+                while next_idx < len(paths) and len(pending) < window:
+                    if cancel is not None and cancel.cancelled:
+                        break
+                    fut = pool.submit(
+                        _process_one, paths[next_idx], initial_tags, fingerprints[next_idx]
+                    )
+                    pending[fut] = next_idx
+                    next_idx += 1
+                if not pending:
+                    break
+                done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    idx = pending.pop(fut)
+                    try:
+                        photo, data = fut.result()
+                        _store_thumbnail(photo, data)
+                        yield idx, paths[idx], photo, None
+                    except Exception as e:
+                        yield idx, paths[idx], None, str(e)
+                if cancel is not None and cancel.cancelled:
+                    for fut in pending:
+                        fut.cancel()
+                    break
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def import_files(
+    paths: List[str],
+    initial_tags: List[str] | None = None,
+    store: Optional[LibraryStore] = None,
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[ImportProgress], None]] = None,
+    cancel: Optional[CancelToken] = None,
+) -> ImportResult:
+    """导入文件（元数据与缩略图在进程池中并行处理）。
+
+    传入 store 时，成功的照片在同一个 batch 内加入库（只写盘、通知一次）；内容已在库中
+    （或在本批中出现过）的文件不再处理，记入 duplicates，initial_tags 合并到已有照片上。
+    结果中的 imported / failures / duplicates 按输入顺序排列，与完成顺序无关。
+    """
+    imported: List[Tuple[int, LibraryPhoto]] = []
+    failures: List[Tuple[int, str, str]] = []
+    known = store.fingerprint_index() if store is not None else {}
+    todo, fingerprints, duplicates = split_duplicates(paths, known, cancel)
+    sub_paths = [paths[i] for i in todo]
+
+    with store.batch() if store is not None else nullcontext():
+        if store is not None and initial_tags:
+            existing = {t for t in duplicates.values() if isinstance(t, str)}
+            store.add_tags(existing, list(initial_tags))
+        for done, (j, path, photo, error) in enumerate(
+            iter_import(sub_paths, initial_tags, workers, cancel, [fingerprints[i] for i in todo]),
+            start=len(duplicates) + 1,
+        ):
+            idx = todo[j]
+            if photo is not None:
+                imported.append((idx, photo))
+                if store is not None:
+                    store.add_imported(photo)
+            else:
+                failures.append((idx, path, error or ""))
+            if progress is not None:
+                progress(ImportProgress(done, len(paths), path, photo, error))
+
+    return collect_result(
+        paths, imported, failures, duplicates, cancel is not None and cancel.cancelled
+    )
@@ -0,0 +1,238 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from library_models import LibraryPhoto, PhotoEXIF
+from dhash_index import format_dhash, parse_dhash
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS photos (
+    id             TEXT PRIMARY KEY,
+    file_name      TEXT NOT NULL,
+    source_path    TEXT NOT NULL,
+    thumbnail_path TEXT,
+    capture_date   TEXT,
+    import_date    TEXT NOT NULL,
+    has_exif       INTEGER NOT NULL DEFAULT 0,
+    camera_model   TEXT,
+    lens_model     TEXT,
+    focal_length   REAL,
+    f_number       REAL,
+    exposure_time  REAL,
+    iso            INTEGER,
+    fingerprint    TEXT,
+    dhash          TEXT
+);
+CREATE TABLE IF NOT EXISTS tags (
+    id   INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS photo_tags (
+    photo_id TEXT NOT NULL,
+    tag_id   INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (photo_id, tag_id)
+);
+CREATE INDEX IF NOT EXISTS photo_tags_by_tag ON photo_tags (tag_id);
+"""
+
+_PHOTO_COLUMNS = (
+    "id", "file_name", "source_path", "thumbnail_path", "capture_date", "import_date",
+    "has_exif", "camera_model", "lens_model", "focal_length", "f_number", "exposure_time", "iso",
+    "fingerprint", "dhash",
+)
+
+
+def _photo_row(p: LibraryPhoto) -> tuple:
+    e = p.exif
+    return (
+        p.id,
+        p.file_name,
+        p.source_path,
+        p.thumbnail_path,
+        p.capture_date.isoformat() if p.capture_date else None,
+        p.import_date.isoformat(),
+        1 if e else 0,
+        e.camera_model if e else None,
+        e.lens_model if e else None,
+        e.focal_length if e else None,
+        e.f_number if e else None,
+        e.exposure_time if e else None,
+        e.iso if e else None,
+        p.fingerprint,
+        format_dhash(p.dhash) if p.dhash is not None else None,
+    )
+
+
+def _row_photo(row: sqlite3.Row, tags: List[str]) -> LibraryPhoto:
+    exif = None
+    if row["has_exif"]:
+        exif = PhotoEXIF(
+            camera_model=row["camera_model"],
+            lens_model=row["lens_model"],
+            focal_length=row["focal_length"],
+            f_number=row["f_number"],
+            exposure_time=row["exposure_time"],
+            iso=row["iso"],
+        )
+    return LibraryPhoto(
+        id=row["id"],
+        file_name=row["file_name"],
+        source_path=row["source_path"],
+        thumbnail_path=row["thumbnail_path"],
+        capture_date=datetime.fromisoformat(row["capture_date"]) if row["capture_date"] else None,
+        import_date=datetime.fromisoformat(row["import_date"]),
+        exif=exif,
+        tags=tags,
+        fingerprint=row["fingerprint"],
+        dhash=parse_dhash(row["dhash"]),
+    )
+
+
+def _file_signature(path: str) -> Optional[str]:
+    """文件的 "大小:mtime_ns"；不存在时为 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+class SqliteIndex:
+    """SQLite（WAL）存储的照片索引；每次变更只写入受影响的行"""
+
+    def __init__(self, db_path: str):
+        self._path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._upgrade()
+        self._conn.commit()
+
+    def _upgrade(self):
+        """给旧版本创建的数据库补上新增的列"""
+        cols = {r["name"] for r in self._conn.execute("PRAGMA table_info(photos)")}
+        for name in ("fingerprint", "dhash"):
+            if name not in cols:
+                self._conn.execute(f"ALTER TABLE photos ADD COLUMN {name} TEXT")
+
+    def close(self):
+        self._conn.close()
+
+    def _meta(self, key: str):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def load_photos(self) -> List[LibraryPhoto]:
+        tags_by_photo: dict = {}
+        for row in self._conn.execute(
+            "SELECT pt.photo_id, t.name FROM photo_tags pt "
+            "JOIN tags t ON t.id = pt.tag_id ORDER BY pt.photo_id, pt.position"
+        ):
+            tags_by_photo.setdefault(row[0], []).append(row[1])
+        return [
+            _row_photo(row, tags_by_photo.get(row["id"], []))
+            for row in self._conn.execute("SELECT * FROM photos ORDER BY rowid")
+        ]
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # 两种引擎的同步：meta 记录上次与 JSON 索引一致时 JSON 文件的 (大小, mtime_ns)，
+    # 以及此后数据库是否又被修改过（dirty）。JSON 签名变了说明期间用过 JSON 引擎，
+    # 以 JSON 为准；数据库 dirty 而 JSON 未变说明期间用过 SQLite 引擎，以数据库为准。
+
+    def migrate_json(self, json_path: str) -> bool:
+        """JSON 索引在上次同步后被修改过（首次使用，或期间改回了 JSON 引擎）时整体导入"""
+        sig = _file_signature(json_path)
+        if sig is None:
+            return False
+        recorded = self._meta("json_sig")
+        if recorded == sig:
+            return False
+        if recorded is None and self._meta("json_migrated"):
+            # 旧版本迁移过但没有记录签名：无法判断，以数据库为准
+            with self._conn:
+                self._set_meta("json_sig", sig)
+                self._set_meta("dirty", "1")
+            return False
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        photos = [LibraryPhoto.from_dict(d) for d in data]
+        with self._conn:
+            self._conn.execute("DELETE FROM photo_tags")
+            self._conn.execute("DELETE FROM photos")
+            self._write(photos, ())
+            self._set_meta("json_migrated", datetime.now().isoformat())
+            self._set_meta("json_sig", sig)
+            self._set_meta("dirty", "0")
+        return True
+
+    def ahead_of_json(self, json_path: str) -> bool:
+        """数据库在与 JSON 同步后又被修改过、JSON 本身未变：切回 JSON 引擎时应先导出"""
+        return self._meta("dirty") == "1" and self._meta("json_sig") == _file_signature(json_path)
+
+    def mark_exported(self, json_path: str):
+        """JSON 引擎把数据库内容写成 JSON 后调用"""
+        with self._conn:
+            self._set_meta("json_sig", _file_signature(json_path))
+            self._set_meta("dirty", "0")
+
+    def apply(self, changed: Iterable[LibraryPhoto], removed: Iterable[str]):
+        """在一个事务里写入新增/修改的照片并删除已移除的照片"""
+        with self._conn:
+            self._write(changed, removed)
+            self._set_meta("dirty", "1")
+
+    def replace_all(self, photos: Iterable[LibraryPhoto]):
+        with self._conn:
+            self._conn.execute("DELETE FROM photo_tags")
+            self._conn.execute("DELETE FROM photos")
+            self._write(photos, ())
+            self._set_meta("dirty", "1")
+
+    def _write(self, changed: Iterable[LibraryPhoto], removed: Iterable[str]):
+        c = self._conn
+        touched_tags: set = set()
+
+        def drop_links(photo_id: str):
+            touched_tags.update(
+                r[0] for r in c.execute("SELECT tag_id FROM photo_tags WHERE photo_id = ?", (photo_id,))
+            )
+            c.execute("DELETE FROM photo_tags WHERE photo_id = ?", (photo_id,))
+
+        for photo_id in removed:
+            drop_links(photo_id)
+            c.execute("DELETE FROM photos WHERE id = ?", (photo_id,))
+
+        cols = ", ".join(_PHOTO_COLUMNS)
+        marks = ", ".join("?" for _ in _PHOTO_COLUMNS)
+        updates = ", ".join(f"{col} = excluded.{col}" for col in _PHOTO_COLUMNS[1:])
+        sql = f"INSERT INTO photos ({cols}) VALUES ({marks}) ON CONFLICT(id) DO UPDATE SET {updates}"
+        for p in changed:
+            c.execute(sql, _photo_row(p))
+            drop_links(p.id)
+            for pos, tag in enumerate(p.tags):
+                c.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag,))
+                c.execute(
+                    "INSERT OR IGNORE INTO photo_tags (photo_id, tag_id, position) "
+                    "SELECT ?, id, ? FROM tags WHERE name = ?",
+                    (p.id, pos, tag),
+                )
+
+        # 清理不再被任何照片引用的标签
+        c.executemany(
+            "DELETE FROM tags WHERE id = ? AND NOT EXISTS "
+            "(SELECT 1 FROM photo_tags WHERE tag_id = tags.id)",
+            [(t,) for t in touched_tags],
+        )
@@ -4,6 +4,8 @@ from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Optional
 
+from dhash_index import format_dhash, parse_dhash
+
 
 @dataclass
 class PhotoEXIF:
@@ -46,6 +48,10 @@ class LibraryPhoto:
     import_date: datetime = field(default_factory=datetime.now)
     exif: Optional[PhotoEXIF] = None
     tags: list[str] = field(default_factory=list)
+    fingerprint: Optional[str] = None      # file_fingerprint.quick_fingerprint，用于导入去重
+    dhash: Optional[int] = None            # 64 位感知哈希（thumbnail_service.dhash_from_image），用于找相似照片
+    # 导入时算出的颜色特征，只在交给 LibraryStore 前暂存；入库后存于 ColorMatrix，不写入索引文件
+    color_feature: Optional[bytes] = field(default=None, repr=False, compare=False)
 
     @staticmethod
     def from_source_path(source_path: str, tags: Optional[list[str]] = None) -> "LibraryPhoto":
@@ -70,6 +76,8 @@ class LibraryPhoto:
             "import_date": self.import_date.isoformat(),
             "exif": self.exif.to_dict() if self.exif else None,
             "tags": self.tags,
+            "fingerprint": self.fingerprint,
+            "dhash": format_dhash(self.dhash) if self.dhash is not None else None,
         }
 
     @staticmethod
@@ -83,6 +91,8 @@ class LibraryPhoto:
             import_date=datetime.fromisoformat(d["import_date"]),
             exif=PhotoEXIF.from_dict(d["exif"]) if d.get("exif") else None,
             tags=d.get("tags", []),
+            fingerprint=d.get("fingerprint"),
+            dhash=parse_dhash(d.get("dhash")),
         )
 
 
@@ -0,0 +1,339 @@
+from __future__ import annotations
+import os
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from library_models import LibraryPhoto, PhotoEXIF
+
+# 二进制快照：启动时代替逐条解析 library_index.json。
+# 文件 = 头部 + 若干段 (4 字节段名, 长度, 数据)；数值列为小端 array，字符串列为 \0 分隔的 UTF-8。
+# 头部记录写快照时 JSON 文件的 (大小, mtime_ns)，JSON 被其他程序改过时快照自动失效。
+
+_MAGIC = b"TGSNAP\x00\x01"
+_HEADER = struct.Struct("<8sQqqI")        # magic, 照片数, JSON 大小, JSON mtime_ns, 数据体 crc32
+_SECTION = struct.Struct("<4sQ")
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)     # 整数倍乘比逐个构造 timedelta 快一倍
+_NONE = -(2 ** 63)                         # 整数列中的缺失值
+
+# flags 列的位
+_HAS_EXIF = 1
+_HAS_CAPTURE = 2
+_HAS_DHASH = 4
+_HAS_THUMB = 8
+_HAS_FINGERPRINT = 16
+
+_NUMERIC_EXIF = ("focal_length", "f_number", "exposure_time")
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _micros(d: datetime) -> int:
+    # 库中的时间都是不带时区的本地时间，按挂钟时间存储，不做时区换算
+    if d.tzinfo is not None:
+        raise SnapshotError("timezone-aware datetimes are not supported")
+    delta = d - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _le(arr: array) -> bytes:
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_le(typecode: str, data) -> array:
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def _strings(values: Sequence[str]) -> bytes:
+    return "\0".join(values).encode("utf-8")
+
+
+def _code(table: Dict[str, int], names: List[str], name: Optional[str]) -> int:
+    if name is None:
+        return -1
+    code = table.get(name)
+    if code is None:
+        code = table[name] = len(names)
+        names.append(name)
+    return code
+
+
+def encode_snapshot(photos: Sequence[LibraryPhoto], json_stat: Tuple[int, int] = (0, 0)) -> bytes:
+    """把照片列表编码为快照字节；遇到无法无损表示的数据时抛出 SnapshotError"""
+    n = len(photos)
+    flags = array("B", bytes(n))
+    capture = array("q", [0]) * n
+    imported = array("q", [0]) * n
+    dhash = array("Q", [0]) * n
+    numeric = {f: array("d", [0.0]) * n for f in _NUMERIC_EXIF}
+    iso = array("q", [_NONE]) * n
+    camera = array("i", [-1]) * n
+    lens = array("i", [-1]) * n
+    tag_counts = array("I", [0]) * n
+    tag_codes = array("I")
+    tables: Dict[str, Tuple[Dict[str, int], List[str]]] = {k: ({}, []) for k in ("tags", "camera", "lens")}
+    thumbs: List[str] = []
+    fingerprints: List[str] = []
+
+    for i, p in enumerate(photos):
+        f = 0
+        if p.capture_date is not None:
+            f |= _HAS_CAPTURE
+            capture[i] = _micros(p.capture_date)
+        imported[i] = _micros(p.import_date)
+        if p.dhash is not None:
+            f |= _HAS_DHASH
+            dhash[i] = p.dhash
+        if p.thumbnail_path is not None:
+            f |= _HAS_THUMB
+            thumbs.append(p.thumbnail_path)
+        if p.fingerprint is not None:
+            f |= _HAS_FINGERPRINT
+            fingerprints.append(p.fingerprint)
+        e = p.exif
+        if e is not None:
+            f |= _HAS_EXIF
+            for name in _NUMERIC_EXIF:
+                v = getattr(e, name)
+                # 缺失记为 NaN；数值本身是 NaN 的无法区分，交给调用方退回 JSON
+                if v is not None and v != v:
+                    raise SnapshotError(f"NaN {name}")
+                numeric[name][i] = float("nan") if v is None else v
+            if e.iso is not None:
+                iso[i] = e.iso
+            camera[i] = _code(*tables["camera"], e.camera_model)
+            lens[i] = _code(*tables["lens"], e.lens_model)
+        flags[i] = f
+        tag_counts[i] = len(p.tags)
+        tag_codes.extend(_code(*tables["tags"], t) for t in p.tags)
+
+    for values in [[p.id for p in photos], [p.file_name for p in photos],
+                   [p.source_path for p in photos], thumbs, fingerprints]:
+        if any("\0" in v for v in values):
+            raise SnapshotError("NUL in string field")
+    for _, names in tables.values():
+        if any("\0" in v for v in names):
+            raise SnapshotError("NUL in string table")
+
+    sections = [
+        (b"flag", flags.tobytes()),
+        (b"capt", _le(capture)),
+        (b"impt", _le(imported)),
+        (b"dhsh", _le(dhash)),
+        (b"flen", _le(numeric["focal_length"])),
+        (b"fnum", _le(numeric["f_number"])),
+        (b"expo", _le(numeric["exposure_time"])),
+        (b"iso ", _le(iso)),
+        (b"cam ", _le(camera)),
+        (b"lens", _le(lens)),
+        (b"ntag", _le(tag_counts)),
+        (b"tags", _le(tag_codes)),
+        (b"Tcam", _strings(tables["camera"][1])),
+        (b"Tlen", _strings(tables["lens"][1])),
+        (b"Ttag", _strings(tables["tags"][1])),
+        (b"id  ", _strings([p.id for p in photos])),
+        (b"name", _strings([p.file_name for p in photos])),
+        (b"path", _strings([p.source_path for p in photos])),
+        (b"thmb", _strings(thumbs)),
+        (b"fprt", _strings(fingerprints)),
+    ]
+    body = b"".join(_SECTION.pack(name, len(data)) + data for name, data in sections)
+    return _HEADER.pack(_MAGIC, n, json_stat[0], json_stat[1], zlib.crc32(body)) + body
+
+
+def _split(data, count: int) -> List[str]:
+    if count == 0:
+        return []
+    out = bytes(data).decode("utf-8").split("\0")
+    if len(out) != count:
+        raise SnapshotError("string column length mismatch")
+    return out
+
+
+def decode_snapshot(data: bytes) -> Tuple[List[LibraryPhoto], Tuple[int, int]]:
+    """解码快照字节，返回 (照片列表, 写入时的 JSON (大小, mtime_ns))；格式不符时抛出 SnapshotError"""
+    if len(data) < _HEADER.size:
+        raise SnapshotError("truncated snapshot")
+    magic, n, json_size, json_mtime, crc = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise SnapshotError("not a library snapshot")
+    view = memoryview(data)[_HEADER.size:]
+    if zlib.crc32(view) != crc:
+        raise SnapshotError("snapshot checksum mismatch")
+    sec: Dict[bytes, memoryview] = {}
+    at = 0
+    while at < len(view):
+        name, length = _SECTION.unpack_from(view, at)
+        at += _SECTION.size
+        sec[name] = view[at:at + length]
+        at += length
+
+    try:
+        flags = bytes(sec[b"flag"])
+        capture = _from_le("q", sec[b"capt"])
+        imported = _from_le("q", sec[b"impt"])
+        dhash = _from_le("Q", sec[b"dhsh"])
+        focal = _from_le("d", sec[b"flen"])
+        fnum = _from_le("d", sec[b"fnum"])
+        expo = _from_le("d", sec[b"expo"])
+        iso = _from_le("q", sec[b"iso "])
+        camera = _from_le("i", sec[b"cam "])
+        lens = _from_le("i", sec[b"lens"])
+        tag_counts = _from_le("I", sec[b"ntag"])
+        tag_codes = _from_le("I", sec[b"tags"])
+        ids = _split(sec[b"id  "], n)
+        names = _split(sec[b"name"], n)
+        paths = _split(sec[b"path"], n)
+        thumbs = _split(sec[b"thmb"], sum(1 for f in flags if f & _HAS_THUMB))
+        fingerprints = _split(sec[b"fprt"], sum(1 for f in flags if f & _HAS_FINGERPRINT))
+        cameras = bytes(sec[b"Tcam"]).decode("utf-8").split("\0")
+        lenses = bytes(sec[b"Tlen"]).decode("utf-8").split("\0")
+        tag_names = bytes(sec[b"Ttag"]).decode("utf-8").split("\0")
+    except KeyError as e:
+        raise SnapshotError(f"missing section {e}") from None
+    if not (len(flags) == len(capture) == len(imported) == len(tag_counts) == n):
+        raise SnapshotError("column length mismatch")
+
+    # 先逐列整体转换，最后一次遍历组装对象
+    def optional(values: List, flag: int, default=None) -> List:
+        it = iter(values)
+        return [next(it) if f & flag else default for f in flags]
+
+    def dates(micros: array) -> List[datetime]:
+        return [_EPOCH + _MICROSECOND * v for v in micros.tolist()]
+
+    captures = [d if f & _HAS_CAPTURE else None for f, d in zip(flags, dates(capture))]
+    cameras.append(None)    # 编码 -1 取到末尾的 None
+    lenses.append(None)
+    exifs = [
+        PhotoEXIF(
+            cameras[c], lenses[l],
+            fl if fl == fl else None, fn if fn == fn else None, ex if ex == ex else None,
+            s if s != _NONE else None,
+        ) if f & _HAS_EXIF else None
+        for f, c, l, fl, fn, ex, s in zip(
+            flags, camera.tolist(), lens.tolist(), focal.tolist(), fnum.tolist(), expo.tolist(), iso.tolist()
+        )
+    ]
+    tag_list = [tag_names[c] for c in tag_codes.tolist()]
+    tags: List[List[str]] = []
+    at = 0
+    for count in tag_counts.tolist():
+        tags.append(tag_list[at:at + count])
+        at += count
+    hashes = [h if f & _HAS_DHASH else None for f, h in zip(flags, dhash.tolist())]
+
+    photos = [
+        LibraryPhoto(id=i, file_name=name, source_path=path, thumbnail_path=thumb, capture_date=cap,
+                     import_date=imp, exif=exif, tags=t, fingerprint=fp, dhash=h)
+        for i, name, path, thumb, cap, imp, exif, t, fp, h in zip(
+            ids, names, paths, optional(thumbs, _HAS_THUMB), captures, dates(imported),
+            exifs, tags, optional(fingerprints, _HAS_FINGERPRINT), hashes,
+        )
+    ]
+    return photos, (json_size, json_mtime)
+
+
+def json_stat(json_path: str) -> Tuple[int, int]:
+    st = os.stat(json_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def write_snapshot(path: str, photos: Sequence[LibraryPhoto], json_path: Optional[str] = None):
+    """写入快照（先写临时文件再替换）；json_path 为同时写出的 JSON 索引，用来判断快照是否过期"""
+    stat = json_stat(json_path) if json_path is not None else (0, 0)
+    data = encode_snapshot(photos, stat)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def read_snapshot(path: str, json_path: Optional[str] = None) -> Optional[List[LibraryPhoto]]:
+    """读取快照；文件缺失、损坏，或 JSON 索引在快照之后被改过时返回 None（调用方改读 JSON）"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        photos, stat = decode_snapshot(data)
+        if json_path is not None and os.path.exists(json_path) and json_stat(json_path) != stat:
+            return None
+        return photos
+    except (OSError, SnapshotError, UnicodeDecodeError, IndexError, OverflowError, struct.error):
+        return None
+
+
+if __name__ == "__main__":
+    # 用现有的 JSON 索引（或生成的样例库）验证快照与 JSON 往返一致，并比较载入时间
+    # （与 LibraryStore.load 一样在载入期间暂停循环垃圾回收）
+    import gc
+    import json
+    import random
+    import tempfile
+    import time
+    import uuid
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r", encoding="utf-8") as f:
+            source = [LibraryPhoto.from_dict(d) for d in json.load(f)]
+    else:
+        n = int(os.environ.get("SNAPSHOT_BENCH_N", "200000"))
+        rng = random.Random(1)
+        tags = [f"tag{i}" for i in range(300)] + ["旅行", "家人"]
+        cams = ["ILCE-7M4", "X-T5", "EOS R6", "iPhone 15 Pro"]
+        source = []
+        for i in range(n):
+            has_exif = rng.random() < 0.9
+            source.append(LibraryPhoto(
+                id=str(uuid.uuid4()),
+                file_name=f"IMG_{i:06d}.JPG",
+                source_path=f"/Volumes/Photos/{2015 + i % 10}/IMG_{i:06d}.JPG",
+                thumbnail_path=f"pack:{i}" if rng.random() < 0.95 else None,
+                capture_date=datetime(2015, 1, 1) + timedelta(seconds=rng.randrange(3 * 10 ** 8))
+                if rng.random() < 0.9 else None,
+                import_date=datetime(2024, 1, 1, 12, 0, 0, rng.randrange(10 ** 6)),
+                exif=PhotoEXIF(
+                    camera_model=rng.choice(cams), lens_model=rng.choice([None, "FE 35mm F1.8"]),
+                    focal_length=rng.choice([None, 35.0, 50.0, 23.5]), f_number=rng.choice([1.8, 2.8, 8.0]),
+                    exposure_time=rng.choice([None, 1 / 250, 1 / 60]), iso=rng.choice([None, 100, 3200]),
+                ) if has_exif else None,
+                tags=rng.sample(tags, rng.randrange(4)),
+                fingerprint=f"{rng.getrandbits(32):x}-{rng.getrandbits(128):032x}" if rng.random() < 0.8 else None,
+                dhash=rng.getrandbits(64) if rng.random() < 0.8 else None,
+            ))
+
+    with tempfile.TemporaryDirectory() as d:
+        json_path = os.path.join(d, "library_index.json")
+        snap_path = os.path.join(d, "library_index.snapshot")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump([p.to_dict() for p in source], f, ensure_ascii=False, indent=2)
+        t0 = time.perf_counter()
+        write_snapshot(snap_path, source, json_path)
+        t_write = time.perf_counter() - t0
+
+        gc.disable()
+        t0 = time.perf_counter()
+        with open(json_path, "r", encoding="utf-8") as f:
+            from_json = [LibraryPhoto.from_dict(x) for x in json.load(f)]
+        t_json = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        from_snap = read_snapshot(snap_path, json_path)
+        t_snap = time.perf_counter() - t0
+        gc.enable()
+
+        same = from_snap is not None and [p.to_dict() for p in from_snap] == [p.to_dict() for p in from_json]
+        print(f"{len(source)} photos, round-trip identical to JSON: {same}")
+        print(f"JSON {os.path.getsize(json_path) / 1e6:.0f} MB, load {t_json:.2f}s")
+        print(f"snapshot {os.path.getsize(snap_path) / 1e6:.0f} MB, write {t_write:.2f}s, load {t_snap:.2f}s")
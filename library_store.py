@@ -1,127 +1,758 @@
 from __future__ import annotations
+import gc
 import json
 import os
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from heapq import nlargest
+from itertools import islice
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional, Set
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 from library_models import LibraryPhoto, TagSummary
+from library_db import SqliteIndex
+from library_snapshot import read_snapshot, write_snapshot
+from tag_query import TagBitmapIndex, TagQueryEngine, bit_count
+from color_index import ColorFeatureLog, ColorMatrix
+from dhash_index import MultiIndexHash
+from exif_index import CATEGORY_FIELDS, NUMERIC_FIELDS, _NP_OK, ExifColumns, Range, bitmap_to_mask
+from thumb_cache import remove_thumbs, schedule_compaction
 
 
 _APP_SUPPORT = os.path.join(
     os.path.expanduser("~"), "Library", "Application Support", "TAGGER"
 )
 _INDEX_PATH = os.path.join(_APP_SUPPORT, "library_index.json")
+_DB_PATH = os.path.join(_APP_SUPPORT, "library_index.sqlite3")
+_COLOR_PATH = os.path.join(_APP_SUPPORT, "color_features.bin")
+# JSON 索引的二进制快照，启动时优先读取（JSON 在快照之后被改过则忽略）
+_SNAPSHOT_PATH = os.path.join(_APP_SUPPORT, "library_index.snapshot")
+
+_MAX_ID = "\U0010ffff"
+
+
+@contextmanager
+def _gc_paused():
+    """成批创建大量对象（载入整个库）时暂停循环垃圾回收，避免反复全量扫描"""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+# ---- 变更事件：监听者收到 List[StoreEvent]，batch 内的同类连续事件会被合并 ----
+# tags 为计数可能变化的标签
+
+@dataclass(frozen=True)
+class PhotosAdded:
+    photo_ids: FrozenSet[str]
+    tags: FrozenSet[str] = field(default_factory=frozenset)
+
+
+@dataclass(frozen=True)
+class PhotosRemoved:
+    photo_ids: FrozenSet[str]
+    tags: FrozenSet[str] = field(default_factory=frozenset)
+
+
+@dataclass(frozen=True)
+class TagsChanged:
+    photo_ids: FrozenSet[str]
+    tags: FrozenSet[str] = field(default_factory=frozenset)
+
+
+@dataclass(frozen=True)
+class TagDeleted:
+    tag: str
+    photo_ids: FrozenSet[str]
+
+
+StoreEvent = Union[PhotosAdded, PhotosRemoved, TagsChanged, TagDeleted]
+
+
+def _merge_events(events: List[StoreEvent]) -> List[StoreEvent]:
+    merged: List[StoreEvent] = []
+    for ev in events:
+        last = merged[-1] if merged else None
+        if type(last) is type(ev) and not isinstance(ev, TagDeleted):
+            merged[-1] = type(ev)(last.photo_ids | ev.photo_ids, last.tags | ev.tags)
+        else:
+            merged.append(ev)
+    return merged
+
+
+def _unique(tags: List[str]) -> List[str]:
+    """去掉重复标签并保留原顺序（导入时的初始标签、旧索引文件中都可能有重复）"""
+    return list(dict.fromkeys(tags))
+
+
+def _date_key(photo: LibraryPhoto) -> tuple:
+    return (photo.sort_date(), photo.id)
+
+
+def _exif_matches(exif, ranges: Dict[str, Range], equals: Dict[str, str]) -> bool:
+    """photos_where 在没有 numpy 时的逐张判断，语义与 ExifColumns.mask 相同"""
+    for f, (lo, hi) in ranges.items():
+        if f not in NUMERIC_FIELDS:
+            raise ValueError(f"unknown numeric field: {f}")
+        v = getattr(exif, f, None) if exif is not None else None
+        if v is None or (lo is not None and v < lo) or (hi is not None and v > hi):
+            return False
+    for f, name in equals.items():
+        if (getattr(exif, f, None) if exif is not None else None) != name:
+            return False
+    return True
+
+
+class _DateOrder:
+    """按 (sort_date, id) 升序维护的键数组；增删用 bisect，查询结果按时间倒序分页返回"""
+
+    __slots__ = ("_keys",)
+
+    def __init__(self, keys: Iterable[tuple] = ()):
+        self._keys: List[tuple] = sorted(keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: tuple):
+        insort(self._keys, key)
+
+    def remove(self, key: tuple):
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def _bounds(self, start: Optional[datetime], end: Optional[datetime]) -> tuple:
+        lo = 0 if start is None else bisect_left(self._keys, (start,))
+        hi = len(self._keys) if end is None else bisect_right(self._keys, (end, _MAX_ID))
+        return lo, max(lo, hi)
+
+    def count(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        lo, hi = self._bounds(start, end)
+        return hi - lo
+
+    def newest_first(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        lo, hi = self._bounds(start, end)
+        top = hi - max(0, offset)
+        bottom = lo if limit is None else max(lo, top - limit)
+        if top <= bottom:
+            return []
+        return [k[1] for k in reversed(self._keys[bottom:top])]
+
+    def iter_newest(self) -> Iterator[str]:
+        """按时间倒序逐个产出 id（调用方可随时停止）"""
+        for k in reversed(self._keys):
+            yield k[1]
 
 
 class LibraryStore:
-    def __init__(self):
+    def __init__(self, engine: str = "json"):
+        """engine: "json" 每次保存重写整个索引文件；"sqlite" 每次变更只写受影响的行"""
         os.makedirs(_APP_SUPPORT, exist_ok=True)
-        self._photos: List[LibraryPhoto] = []
+        # id -> 照片（保持插入顺序），以及随每次变更增量维护的标签倒排索引
+        self._photos: Dict[str, LibraryPhoto] = {}
+        self._tag_index: Dict[str, Set[str]] = {}
+        self._untagged: Set[str] = set()
+        # 按拍摄时间排序的索引：全部照片、每个标签、未标签
+        self._by_date = _DateOrder()
+        self._tag_dates: Dict[str, _DateOrder] = {}
+        self._untagged_dates = _DateOrder()
+        # 导入去重：快速指纹 -> 照片 id（指纹相同但内容不同的文件可能共用一项）
+        self._by_fingerprint: Dict[str, Set[str]] = {}
+        # 布尔标签查询：每张照片一个稠密位置，每个标签一个位图
+        self._bitmaps = TagBitmapIndex(lambda t: self._tag_index.get(t, ()))
+        self._query = TagQueryEngine(self._bitmaps)
+        # EXIF 数值的列式镜像（行号同上面的位置），没有 numpy 时退回逐张遍历
+        self._exif: Optional[ExifColumns] = ExifColumns() if _NP_OK else None
+        # 颜色特征矩阵（行号同上）及其追加写入的持久化文件；没有 numpy 时不可用
+        self._colors: Optional[ColorMatrix] = ColorMatrix() if _NP_OK else None
+        self._color_log: Optional[ColorFeatureLog] = ColorFeatureLog(_COLOR_PATH) if _NP_OK else None
+        # 感知哈希的多索引表，第一次查相似照片时才建立，之后随增删增量维护
+        self._dhashes: Optional[MultiIndexHash] = None
         self._listeners: List = []       
+        self._db: Optional[SqliteIndex] = SqliteIndex(_DB_PATH) if engine == "sqlite" else None
+        # batch() 期间暂存的变更，提交时统一持久化并通知一次
+        self._batch_depth = 0
+        # defer_saves() 期间只暂存写盘，监听者照常立即收到通知
+        self._defer_depth = 0
+        self._pending_changed: Dict[str, LibraryPhoto] = {}
+        self._pending_removed: Set[str] = set()
+        self._pending_save = False
+        self._pending_events: List[StoreEvent] = []
         self.load()
 
     def add_listener(self, callback):
         self._listeners.append(callback)
 
-    def _notify(self):
+    def _notify(self, *events: StoreEvent):
+        if self._batch_depth:
+            self._pending_events.extend(events)
+            return
+        events = _merge_events(list(events))
         for cb in self._listeners:
             try:
-                cb()
+                cb(events)
             except Exception:
                 pass
 
     def load(self):
+        with _gc_paused():
+            self._load()
+
+    def _load(self):
+        if self._db is not None:
+            try:
+                self._db.migrate_json(_INDEX_PATH)
+                self._rebuild_index(self._db.load_photos())
+            except Exception:
+                self._rebuild_index([])
+            return
+        if self._load_from_db():
+            return
         if not os.path.exists(_INDEX_PATH):
-            self._photos = []
+            self._rebuild_index([])
+            return
+        photos = read_snapshot(_SNAPSHOT_PATH, _INDEX_PATH)
+        if photos is not None:
+            self._rebuild_index(photos)
             return
         try:
             with open(_INDEX_PATH, "r", encoding="utf-8") as f:
                 data = json.load(f)
-            self._photos = [LibraryPhoto.from_dict(d) for d in data]
+            self._rebuild_index([LibraryPhoto.from_dict(d) for d in data])
         except Exception:
-            self._photos = []
+            self._rebuild_index([])
+            return
+        # 升级后第一次启动或 JSON 被外部修改过：补写快照，下次启动直接读取
+        self._write_snapshot()
+
+    def _load_from_db(self) -> bool:
+        """JSON 引擎启动时：上次用的是 SQLite 引擎且之后有修改，则从数据库载入并导出为 JSON"""
+        if not os.path.exists(_DB_PATH):
+            return False
+        try:
+            db = SqliteIndex(_DB_PATH)
+        except Exception:
+            return False
+        try:
+            if not db.ahead_of_json(_INDEX_PATH):
+                return False
+            self._rebuild_index(db.load_photos())
+            if self._write_json():
+                db.mark_exported(_INDEX_PATH)
+                self._write_snapshot()
+            return True
+        except Exception:
+            return False
+        finally:
+            db.close()
+
+    def _write_snapshot(self):
+        try:
+            write_snapshot(_SNAPSHOT_PATH, list(self._photos.values()), _INDEX_PATH)
+        except Exception:
+            # 写不出快照（如含无法表示的数据）时，旧快照因 JSON 已变化而自动失效
+            pass
 
     def save(self):
+        if self._db is not None:
+            try:
+                self._db.replace_all(self._photos.values())
+            except Exception:
+                pass
+            return
+        if self._write_json():
+            self._write_snapshot()
+
+    def _write_json(self) -> bool:
         try:
             with open(_INDEX_PATH, "w", encoding="utf-8") as f:
-                json.dump([p.to_dict() for p in self._photos], f, ensure_ascii=False, indent=2)
+                json.dump([p.to_dict() for p in self._photos.values()], f, ensure_ascii=False, indent=2)
+        except Exception:
+            return False
+        return True
+
+    def _rebuild_index(self, photos: Iterable[LibraryPhoto]):
+        self._photos = {}
+        self._tag_index = {}
+        self._untagged = set()
+        self._tag_dates = {}
+        self._untagged_dates = _DateOrder()
+        self._by_fingerprint = {}
+        self._dhashes = None
+        self._bitmaps.clear()
+        photos = list(photos)
+        self._by_date = _DateOrder(_date_key(p) for p in photos)
+        # 各标签的时间索引先收集再整体排序，避免逐条 insort
+        tag_keys: Dict[str, List[tuple]] = {}
+        untagged_keys: List[tuple] = []
+        for p in photos:
+            self._photos[p.id] = p
+            self._bitmaps.assign(p.id)
+            if p.fingerprint:
+                self._by_fingerprint.setdefault(p.fingerprint, set()).add(p.id)
+            key = _date_key(p)
+            p.tags = _unique(p.tags)
+            if not p.tags:
+                self._untagged.add(p.id)
+                untagged_keys.append(key)
+            for t in p.tags:
+                self._tag_index.setdefault(t, set()).add(p.id)
+                tag_keys.setdefault(t, []).append(key)
+        self._tag_dates = {t: _DateOrder(keys) for t, keys in tag_keys.items()}
+        self._untagged_dates = _DateOrder(untagged_keys)
+        if self._exif is not None:
+            self._exif.reset()
+            self._exif.set_many([self._bitmaps.position(p.id) for p in photos],
+                                [p.exif for p in photos])
+        if self._colors is not None:
+            self._load_colors()
+
+    def _load_colors(self):
+        self._colors.reset()
+        ids, vectors = self._color_log.load()
+        rows = [(k, self._bitmaps.position(i)) for k, i in enumerate(ids) if i in self._photos]
+        self._colors.set_many([pos for _, pos in rows], vectors[[k for k, _ in rows]])
+        # 失效记录（被覆盖、已删除或不在库中的照片）超过一半时压缩；库为空时（可能是索引读取失败）不动文件
+        if self._photos and self._color_log.records > 2 * len(rows):
+            self._color_log.rewrite([ids[k] for k, _ in rows], vectors[[k for k, _ in rows]])
+
+    def _index_add(self, photo: LibraryPhoto):
+        old = self._photos.get(photo.id)
+        if old is not None:
+            self._index_remove(old)
+        self._photos[photo.id] = photo
+        photo.tags = _unique(photo.tags)
+        if photo.fingerprint:
+            self._by_fingerprint.setdefault(photo.fingerprint, set()).add(photo.id)
+        if self._dhashes is not None and photo.dhash is not None:
+            self._dhashes.add(photo.dhash, photo.id)
+        pos = self._bitmaps.assign(photo.id)
+        if self._exif is not None:
+            self._exif.set(pos, photo.exif)
+        if self._colors is not None and photo.color_feature is not None:
+            self._colors.set(pos, photo.color_feature)
+            self._color_log.append([photo.id], self._colors.vector(pos)[None])
+        photo.color_feature = None
+        self._by_date.add(_date_key(photo))
+        self._index_tags(photo)
+
+    def _index_remove(self, photo: LibraryPhoto):
+        self._unindex_tags(photo)
+        self._by_date.remove(_date_key(photo))
+        self._photos.pop(photo.id, None)
+        ids = self._by_fingerprint.get(photo.fingerprint) if photo.fingerprint else None
+        if ids is not None:
+            ids.discard(photo.id)
+            if not ids:
+                del self._by_fingerprint[photo.fingerprint]
+        if self._dhashes is not None and photo.dhash is not None:
+            self._dhashes.remove(photo.dhash, photo.id)
+        pos = self._bitmaps.position(photo.id)
+        if self._exif is not None and pos is not None:
+            self._exif.clear(pos)
+        if self._colors is not None and self._colors.has(pos):
+            self._colors.clear(pos)
+            self._color_log.remove([photo.id])
+        self._bitmaps.release(photo.id)
+
+    def _index_tags(self, photo: LibraryPhoto):
+        key = _date_key(photo)
+        if not photo.tags:
+            self._untagged.add(photo.id)
+            self._untagged_dates.add(key)
+        for t in set(photo.tags):
+            self._tag_index.setdefault(t, set()).add(photo.id)
+            self._tag_dates.setdefault(t, _DateOrder()).add(key)
+        self._bitmaps.set_bits(photo.id, photo.tags)
+
+    def _unindex_tags(self, photo: LibraryPhoto):
+        key = _date_key(photo)
+        if photo.id in self._untagged:
+            self._untagged.discard(photo.id)
+            self._untagged_dates.remove(key)
+        for t in set(photo.tags):
+            ids = self._tag_index.get(t)
+            if ids is None or photo.id not in ids:
+                continue
+            ids.discard(photo.id)
+            self._tag_dates[t].remove(key)
+            if not ids:
+                del self._tag_index[t]
+                del self._tag_dates[t]
+        self._bitmaps.clear_bits(photo.id, photo.tags)
+
+    def _set_tags(self, photo: LibraryPhoto, tags: List[str]):
+        self._unindex_tags(photo)
+        photo.tags = _unique(tags)
+        self._index_tags(photo)
+
+    @contextmanager
+    def batch(self):
+        """合并多次变更：退出最外层 batch 时才写盘并通知监听者一次"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._flush_batch()
+
+    def _flush_batch(self):
+        events = self._pending_events
+        self._pending_events = []
+        if not self._defer_depth:
+            self._flush_saves()
+        if events:
+            self._notify(*events)
+
+    def _flush_saves(self):
+        changed = list(self._pending_changed.values())
+        removed = list(self._pending_removed)
+        save = self._pending_save
+        self._pending_changed = {}
+        self._pending_removed = set()
+        self._pending_save = False
+        if save:
+            self._persist(changed, removed)
+
+    def defer_saves(self):
+        """开始推迟写盘（与 resume_saves 成对使用，可嵌套），用于跨多次主线程回调的长任务，
+        如后台导入：界面每次轮询都收到事件，但 JSON 索引不会每次都整体重写"""
+        self._defer_depth += 1
+
+    def resume_saves(self):
+        self._defer_depth -= 1
+        if self._defer_depth == 0 and not self._batch_depth:
+            self._flush_saves()
+
+    def flush_saves(self):
+        """把推迟中的变更立即写盘（长任务的阶段性检查点）；batch 内调用无效"""
+        if not self._batch_depth:
+            self._flush_saves()
+
+    def _commit(self, changed: Iterable[LibraryPhoto] = (), removed: Iterable[str] = ()):
+        """持久化一次变更：SQLite 只写受影响的行，JSON 整体重写"""
+        if self._batch_depth or self._defer_depth:
+            for p in changed:
+                self._pending_removed.discard(p.id)
+                self._pending_changed[p.id] = p
+            for photo_id in removed:
+                self._pending_changed.pop(photo_id, None)
+                self._pending_removed.add(photo_id)
+            self._pending_save = True
+            return
+        self._persist(changed, removed)
+
+    def _persist(self, changed: Iterable[LibraryPhoto], removed: Iterable[str]):
+        if self._color_log is not None:
+            try:
+                self._color_log.flush()
+            except OSError:
+                pass
+        if self._db is None:
+            self.save()
+            return
+        try:
+            self._db.apply(changed, removed)
         except Exception:
             pass
 
     @property
     def photos(self) -> List[LibraryPhoto]:
-        return list(self._photos)
+        return list(self._photos.values())
+
+    def get(self, photo_id: str) -> Optional[LibraryPhoto]:
+        return self._photos.get(photo_id)
+
+    def tag_count(self, tag: str) -> int:
+        return len(self._tag_index.get(tag, ()))
+
+    def untagged_count(self) -> int:
+        return len(self._untagged)
 
     def tags(self) -> List[TagSummary]:
-        from collections import Counter
-        all_tags = [t for p in self._photos for t in p.tags]
-        counts = Counter(all_tags)
         return sorted(
-            [TagSummary(tag=k, count=v) for k, v in counts.items()],
+            [TagSummary(tag=k, count=len(v)) for k, v in self._tag_index.items()],
             key=lambda s: s.tag.lower(),
         )
 
-    def untagged_photos(self) -> List[LibraryPhoto]:
-        return sorted(
-            [p for p in self._photos if not p.tags],
-            key=lambda p: p.sort_date(),
-            reverse=True,
-        )
+    def untagged_photos(self, offset: int = 0, limit: Optional[int] = None) -> List[LibraryPhoto]:
+        ids = self._untagged_dates.newest_first(offset=offset, limit=limit)
+        return [self._photos[i] for i in ids]
 
-    def photos_for_tag(self, tag: str) -> List[LibraryPhoto]:
-        return sorted(
-            [p for p in self._photos if tag in p.tags],
-            key=lambda p: p.sort_date(),
-            reverse=True,
-        )
+    def photos_for_tag(self, tag: str, offset: int = 0, limit: Optional[int] = None) -> List[LibraryPhoto]:
+        order = self._tag_dates.get(tag)
+        if order is None:
+            return []
+        return [self._photos[i] for i in order.newest_first(offset=offset, limit=limit)]
+
+    def photos_between(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tag: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[LibraryPhoto]:
+        """时间线查询：sort_date 落在 [start, end] 内的照片（按时间倒序），可按标签过滤并分页"""
+        order = self._by_date if tag is None else self._tag_dates.get(tag)
+        if order is None:
+            return []
+        return [self._photos[i] for i in order.newest_first(start, end, offset, limit)]
+
+    def count_between(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tag: Optional[str] = None,
+    ) -> int:
+        order = self._by_date if tag is None else self._tag_dates.get(tag)
+        return 0 if order is None else order.count(start, end)
+
+    def query(self, expr: str, offset: int = 0, limit: Optional[int] = None) -> List[LibraryPhoto]:
+        """布尔标签查询（语法见 tag_query），结果按时间倒序分页；语法错误时抛出 QueryError"""
+        bits = self._query.evaluate(expr)
+        if bit_count(bits) * 8 < len(self._photos):
+            # 结果稀疏：取出后排序
+            photos = [self._photos[i] for i in self._bitmaps.ids(bits)]
+            if limit is None:
+                photos.sort(key=_date_key, reverse=True)
+                return photos[offset:]
+            return nlargest(offset + limit, photos, key=_date_key)[offset:]
+        # 结果稠密：沿时间索引倒序扫描，凑够一页即停
+        contains = self._bitmaps.membership(bits)
+        matched = (i for i in self._by_date.iter_newest() if contains(i))
+        stop = None if limit is None else offset + limit
+        return [self._photos[i] for i in islice(matched, offset, stop)]
+
+    def query_count(self, expr: str) -> int:
+        return self._query.count(expr)
+
+    def fingerprint_index(self) -> Dict[str, List[Tuple[str, str]]]:
+        """指纹 -> [(照片 id, 原文件路径)] 的快照，供后台线程查重而不直接访问库"""
+        return {
+            fp: [(i, self._photos[i].source_path) for i in ids]
+            for fp, ids in self._by_fingerprint.items()
+        }
+
+    def missing_fingerprints(self) -> List[Tuple[str, str]]:
+        """没有快速指纹的照片 [(照片 id, 原文件路径)]（查重功能加入前导入），供后台补算"""
+        return [(p.id, p.source_path) for p in self._photos.values() if not p.fingerprint]
+
+    def set_fingerprints(self, values: Dict[str, str]):
+        """补写快速指纹并更新查重索引；不影响任何视图，因此不通知监听者"""
+        changed = []
+        for photo_id, fp in values.items():
+            p = self._photos.get(photo_id)
+            if p is None or p.fingerprint == fp:
+                continue
+            ids = self._by_fingerprint.get(p.fingerprint) if p.fingerprint else None
+            if ids is not None:
+                ids.discard(p.id)
+                if not ids:
+                    del self._by_fingerprint[p.fingerprint]
+            p.fingerprint = fp
+            self._by_fingerprint.setdefault(fp, set()).add(p.id)
+            changed.append(p)
+        if changed:
+            self._commit(changed=changed)
+
+    def similar_photos(self, photo_id: str, max_distance: int = 10) -> List[LibraryPhoto]:
+        """dHash 汉明距离 <= max_distance 的其他照片，按距离升序、同距离按时间倒序；
+        该照片没有 dHash 时返回空列表（见 set_dhashes）"""
+        photo = self._photos.get(photo_id)
+        if photo is None or photo.dhash is None:
+            return []
+        if self._dhashes is None:
+            self._dhashes = MultiIndexHash(
+                (p.dhash, p.id) for p in self._photos.values() if p.dhash is not None
+            )
+        hits = [(d, self._photos[i]) for d, i in self._dhashes.search(photo.dhash, max_distance) if i != photo_id]
+        hits.sort(key=lambda h: _date_key(h[1]), reverse=True)
+        hits.sort(key=lambda h: h[0])
+        return [p for _, p in hits]
+
+    def similar_colors(self, photo_id: str, k: int = 50, query: Optional[str] = None) -> List[LibraryPhoto]:
+        """颜色与影调最接近的 k 张其他照片（相似度降序），query 为可选的布尔标签查询；需要 numpy。
+        该照片没有颜色特征时返回空列表（见 set_color_features）"""
+        if self._colors is None:
+            raise RuntimeError("similar_colors requires numpy")
+        pos = self._bitmaps.position(photo_id)
+        vec = self._colors.vector(pos) if pos is not None else None
+        if vec is None:
+            return []
+        hits = self._colors.top_k(vec, k, within=self._query_mask(query), exclude=pos)
+        return [self._photos[self._bitmaps.photo_id_at(p)] for p, _ in hits]
+
+    def has_color_feature(self, photo_id: str) -> bool:
+        return self._colors is not None and self._colors.has(self._bitmaps.position(photo_id))
+
+    def missing_feature_ids(self) -> List[str]:
+        """缺少 dHash 或颜色特征（numpy 可用时）的照片，供后台从缓存缩略图补算"""
+        return [
+            p.id for p in self._photos.values()
+            if p.dhash is None or (self._colors is not None and not self.has_color_feature(p.id))
+        ]
+
+    def set_color_features(self, values: Dict[str, bytes]):
+        """补写颜色特征；和 set_dhashes 一样不通知监听者"""
+        if self._colors is None:
+            return
+        ids, rows = [], []
+        for photo_id, feature in values.items():
+            pos = self._bitmaps.position(photo_id)
+            if pos is None or photo_id not in self._photos:
+                continue
+            self._colors.set(pos, feature)
+            ids.append(photo_id)
+            rows.append(self._colors.vector(pos))
+        if ids:
+            self._color_log.append(ids, rows)
+            self._color_log.flush()
+
+    def set_dhashes(self, values: Dict[str, int]):
+        """补写旧照片的 dHash（由缓存缩略图计算）；不影响任何视图，因此不通知监听者"""
+        changed = []
+        for photo_id, value in values.items():
+            p = self._photos.get(photo_id)
+            if p is None or p.dhash == value:
+                continue
+            if self._dhashes is not None:
+                if p.dhash is not None:
+                    self._dhashes.remove(p.dhash, p.id)
+                self._dhashes.add(value, p.id)
+            p.dhash = value
+            changed.append(p)
+        if changed:
+            self._commit(changed=changed)
+
+    def photos_where(
+        self,
+        ranges: Optional[Dict[str, Range]] = None,
+        camera: Optional[str] = None,
+        lens: Optional[str] = None,
+        query: Optional[str] = None,
+    ) -> List[LibraryPhoto]:
+        """按 EXIF 过滤（按时间倒序）。ranges 如 {"iso": (3200, None), "focal_length": (None, 35)}，
+        闭区间；camera / lens 精确匹配；query 为可选的布尔标签查询。"""
+        equals = {}
+        if camera is not None:
+            equals["camera_model"] = camera
+        if lens is not None:
+            equals["lens_model"] = lens
+        if self._exif is None:
+            photos = [p for p in self._photos.values() if _exif_matches(p.exif, ranges or {}, equals)]
+            if query is not None:
+                keep = set(self._query.ids(query))
+                photos = [p for p in photos if p.id in keep]
+        else:
+            m = self._exif.mask(ranges, equals, within=self._query_mask(query))
+            photos = [self._photos[self._bitmaps.photo_id_at(int(i))] for i in m.nonzero()[0]]
+        photos.sort(key=_date_key, reverse=True)
+        return photos
+
+    def exif_counts(self, field: str = "camera_model", query: Optional[str] = None) -> Dict[Optional[str], int]:
+        """按相机（camera_model）或镜头（lens_model）计数，缺失值计在 None 下"""
+        if self._exif is not None:
+            return self._exif.counts_by(field, within=self._query_mask(query))
+        if field not in CATEGORY_FIELDS:
+            raise ValueError(f"unknown category field: {field}")
+        photos = self._photos.values() if query is None else [self._photos[i] for i in self._query.ids(query)]
+        counts: Dict[Optional[str], int] = {}
+        for p in photos:
+            name = getattr(p.exif, field, None) if p.exif is not None else None
+            counts[name or None] = counts.get(name or None, 0) + 1
+        return counts
+
+    def exif_histogram(self, field: str, bins=20, group_by: Optional[str] = None, query: Optional[str] = None):
+        """数值 EXIF 字段的直方图（如按镜头分组的焦距分布），见 ExifColumns.histogram；需要 numpy"""
+        if self._exif is None:
+            raise RuntimeError("exif_histogram requires numpy")
+        return self._exif.histogram(field, bins, group_by, within=self._query_mask(query))
+
+    def _query_mask(self, query: Optional[str]):
+        if query is None:
+            return None
+        return bitmap_to_mask(self._query.evaluate(query), self._bitmaps.capacity)
 
     def add_imported(self, photo: LibraryPhoto):
-        self._photos.append(photo)
-        self.save()
-        self._notify()
+        self._index_add(photo)
+        self._commit(changed=[photo])
+        self._notify(PhotosAdded(frozenset([photo.id]), frozenset(photo.tags)))
+
+    def add_imported_many(self, photos: Iterable[LibraryPhoto]):
+        photos = list(photos)
+        if not photos:
+            return
+        for p in photos:
+            self._index_add(p)
+        self._commit(changed=photos)
+        self._notify(PhotosAdded(
+            frozenset(p.id for p in photos),
+            frozenset(t for p in photos for t in p.tags),
+        ))
 
     def update_tags(self, photo_id: str, tags: List[str]):
-        for p in self._photos:
-            if p.id == photo_id:
-                p.tags = tags
-                break
-        self.save()
-        self._notify()
+        changed = []
+        affected: Set[str] = set()
+        p = self._photos.get(photo_id)
+        if p is not None:
+            affected = set(p.tags) ^ set(tags)
+            self._set_tags(p, tags)
+            changed.append(p)
+        self._commit(changed=changed)
+        self._notify(TagsChanged(frozenset(p.id for p in changed), frozenset(affected)))
 
     def add_tags(self, photo_ids: Set[str], tags_to_add: List[str]):
         if not tags_to_add:
             return
-        changed = False
-        for p in self._photos:
-            if p.id in photo_ids:
-                merged = sorted(set(p.tags) | set(tags_to_add))
-                if merged != p.tags:
-                    p.tags = merged
-                    changed = True
+        changed = []
+        for photo_id in photo_ids:
+            p = self._photos.get(photo_id)
+            if p is None:
+                continue
+            merged = sorted(set(p.tags) | set(tags_to_add))
+            if merged != p.tags:
+                self._set_tags(p, merged)
+                changed.append(p)
         if changed:
-            self.save()
-            self._notify()
+            self._commit(changed=changed)
+            self._notify(TagsChanged(frozenset(p.id for p in changed), frozenset(tags_to_add)))
 
     def delete_tag_globally(self, tag: str):
-        changed = False
-        for p in self._photos:
-            if tag in p.tags:
-                p.tags = [t for t in p.tags if t != tag]
-                changed = True
+        changed = []
+        for photo_id in list(self._tag_index.get(tag, ())):
+            p = self._photos[photo_id]
+            self._set_tags(p, [t for t in p.tags if t != tag])
+            changed.append(p)
         if changed:
-            self.save()
-            self._notify()
+            self._commit(changed=changed)
+            self._notify(TagDeleted(tag, frozenset(p.id for p in changed)))
 
     def delete_photos(self, photo_ids: Set[str], delete_thumbnail_files: bool = True):
         if not photo_ids:
             return
+        doomed = [self._photos[i] for i in photo_ids if i in self._photos]
         if delete_thumbnail_files:
-            for p in self._photos:
-                if p.id in photo_ids and p.thumbnail_path:
-                    try:
-                        os.remove(p.thumbnail_path)
-                    except OSError:
-                        pass
-        self._photos = [p for p in self._photos if p.id not in photo_ids]
-        self.save()
-        self._notify()
+            for p in doomed:
+                remove_thumbs(p.id)
+            schedule_compaction()
+        for p in doomed:
+            self._index_remove(p)
+        self._commit(removed=[p.id for p in doomed])
+        self._notify(PhotosRemoved(
+            frozenset(p.id for p in doomed),
+            frozenset(t for p in doomed for t in p.tags),
+        ))
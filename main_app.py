@@ -1,9 +1,10 @@
 from __future__ import annotations
+import io
 import os
 import subprocess
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from typing import Optional, Set
+from typing import List, Optional, Set, Tuple, Union
 
 try:
     from PIL import Image, ImageTk
@@ -12,10 +13,21 @@ except ImportError:
     _PIL_OK = False
 
 from library_models import LibraryPhoto
-from library_store import LibraryStore
-from import_service import import_files
+from library_store import LibraryStore, PhotosRemoved, StoreEvent, TagDeleted, TagsChanged
+from import_job import BackgroundImport, BackgroundSync, FeatureBackfill, FingerprintBackfill, ImportStatus
+from folder_sync import ScanPlan, SyncResult
+from import_service import ImportResult
 from tag_parser import parse as parse_tags
+from tag_query import QueryError, parse_query, query_tags
 from app_settings import AppSettings, FocalMode
+from photo_grid import PhotoGrid
+from ui_scheduler import GRID_DATA, GRID_LAYOUT, SELECTION, SIDEBAR, RefreshScheduler
+from thumb_loader import ThumbLoader
+from image_lru import ImageLRU
+import thumb_cache
+from thumb_cache import read_thumb
+from thumbnail_service import features_from_jpeg
+from exif_index import _NP_OK
 
 
 def _trim_number(x: float) -> str:
@@ -34,13 +46,25 @@ def _shutter_text(seconds: float) -> str:
     return f"1/{denom} s"
 
 
-def _load_tk_image(path: str, max_pixel: int = 150) -> Optional["ImageTk.PhotoImage"]:
-    if not _PIL_OK or not path or not os.path.exists(path):
+def _open_thumb(photo: LibraryPhoto, size: int) -> Optional["Image.Image"]:
+    """从缩略图缓存中取最接近 size 的那一级并打开"""
+    if not _PIL_OK:
         return None
+    data = read_thumb(photo.id, size, source_path=photo.source_path)
+    if data is None:
+        return None
+    return Image.open(io.BytesIO(data))
+
+
+def _decode_thumb(photo: LibraryPhoto, max_pixel: int = 150) -> Optional["Image.Image"]:
+    """在后台线程中执行：读取并缩放缩略图，PhotoImage 留给主线程创建"""
     try:
-        img = Image.open(path)
+        img = _open_thumb(photo, max_pixel)
+        if img is None:
+            return None
         img.thumbnail((max_pixel, max_pixel), Image.LANCZOS)
-        return ImageTk.PhotoImage(img)
+        img.load()
+        return img
     except Exception:
         return None
 
@@ -85,13 +109,14 @@ class PhotoDetailWindow(tk.Toplevel):
         self._build_info(scroll_frame)
 
     def _load_image(self):
-        if _PIL_OK and self._photo.thumbnail_path:
+        if _PIL_OK:
             try:
-                img = Image.open(self._photo.thumbnail_path)
-                img.thumbnail((600, 400), Image.LANCZOS)
-                self._tk_img = ImageTk.PhotoImage(img)
-                self._img_label.configure(image=self._tk_img)
-                return
+                img = _open_thumb(self._photo, 600)
+                if img is not None:
+                    img.thumbnail((600, 400), Image.LANCZOS)
+                    self._tk_img = ImageTk.PhotoImage(img)
+                    self._img_label.configure(image=self._tk_img)
+                    return
             except Exception:
                 pass
         self._img_label.configure(text="[无法加载图片]", anchor="center")
@@ -188,6 +213,72 @@ class SettingsWindow(tk.Toplevel):
         )
 
 
+def _duration_text(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class ImportDialog(tk.Toplevel):
+    """导入进度窗口：已完成数、速度、预计剩余时间，以及取消按钮"""
+
+    def __init__(self, parent, total: int, on_cancel, title: str = "导入照片"):
+        super().__init__(parent)
+        self.title(title)
+        self.resizable(False, False)
+        self.transient(parent)
+        self._on_cancel = on_cancel
+        self.protocol("WM_DELETE_WINDOW", self._cancel)
+
+        frame = ttk.Frame(self, padding=16)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        self._count_var = tk.StringVar(value=f"0 / {total}")
+        ttk.Label(frame, textvariable=self._count_var).pack(anchor="w")
+        self._bar = ttk.Progressbar(frame, length=360, maximum=max(1, total), mode="determinate")
+        self._bar.pack(fill=tk.X, pady=8)
+        self._rate_var = tk.StringVar(value="准备中…")
+        ttk.Label(frame, textvariable=self._rate_var, foreground="gray").pack(anchor="w")
+        self._file_var = tk.StringVar(value="")
+        ttk.Label(frame, textvariable=self._file_var, foreground="gray", width=48).pack(anchor="w")
+
+        self._cancel_btn = ttk.Button(frame, text="取消", command=self._cancel)
+        self._cancel_btn.pack(pady=(12, 0))
+
+    def set_total(self, total: int):
+        """总数在开始后才确定时（如文件夹同步扫描完成）更新进度条"""
+        self._count_var.set(f"0 / {total}")
+        self._bar.configure(maximum=max(1, total), value=0)
+
+    def set_note(self, text: str):
+        self._rate_var.set(text)
+
+    def update_status(self, status: ImportStatus):
+        text = f"{status.done} / {status.total}"
+        notes = []
+        if status.duplicates:
+            notes.append(f"跳过重复 {status.duplicates}")
+        if status.failed:
+            notes.append(f"失败 {status.failed}")
+        if notes:
+            text += f"（{'，'.join(notes)}）"
+        self._count_var.set(text)
+        self._bar.configure(value=status.done)
+        if status.done:
+            eta = status.eta
+            eta_text = _duration_text(eta) if eta is not None else "—"
+            self._rate_var.set(f"{status.rate:.1f} 张/秒 · 剩余约 {eta_text}")
+        elif status.checked < status.total:
+            self._rate_var.set(f"正在查重 {status.checked} / {status.total}…")
+        if status.current:
+            self._file_var.set(os.path.basename(status.current))
+
+    def _cancel(self):
+        self._cancel_btn.configure(state="disabled", text="正在取消…")
+        self._on_cancel()
+
+
 class TaggerApp(tk.Tk):
     _THUMB_SIZE = 150
 
@@ -195,21 +286,63 @@ class TaggerApp(tk.Tk):
         super().__init__()
         self.title("TAGGER")
         self.minsize(900, 600)
-        self._store = LibraryStore()
         self._settings = AppSettings()
+        thumb_cache.configure(
+            self._settings.thumb_backend,
+            max_bytes=self._settings.thumb_cache_mb * 1024 * 1024,
+        )
+        self._store = LibraryStore(engine=self._settings.storage_engine)
         self._selected_ids: Set[str] = set()
         self._current_tag: Optional[str] = None
-        self._thumb_cache: dict = {}
+        # 布尔标签查询视图；非 None 时优先于侧栏选中的标签
+        self._current_query: Optional[str] = None
+        self._query_tags: Set[str] = set()
+        # 相似照片视图：(方式 "look" 外观 / "color" 颜色, 基准照片 id)；非 None 时优先于查询与标签视图
+        self._similar_to: Optional[Tuple[str, str]] = None
+        self._grid_view: Optional[tuple] = None
+        self._thumb_cache = ImageLRU(self._settings.image_cache_mb * 1024 * 1024)
+        self._thumb_loader = ThumbLoader(
+            self,
+            decode=lambda p: _decode_thumb(p, self._THUMB_SIZE),
+            on_ready=self._on_thumb_decoded,
+        )
 
-        self._store.add_listener(self._refresh)
+        # 待刷新的细节：侧栏需要更新计数的标签 / 是否整体重建，需要重绘选中样式的照片
+        self._sidebar_tags: Set[str] = set()
+        self._sidebar_rebuild = True
+        self._restyle_ids: Set[str] = set()
+        self._scheduler = RefreshScheduler(self, {
+            SIDEBAR: self._flush_sidebar,
+            GRID_DATA: self._refresh_grid,
+            GRID_LAYOUT: lambda: self._grid.relayout(),
+            SELECTION: self._flush_selection,
+        })
+
+        self._import_job: Optional[Union[BackgroundImport, BackgroundSync]] = None
+        self._import_dialog: Optional[ImportDialog] = None
+
+        self._store.add_listener(self._on_store_change)
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
         self._build_ui()
         self._refresh()
+        thumb_cache.start_background_gc({p.id for p in self._store.photos})
+        self._feature_backfill = FeatureBackfill(self, self._store)
+        self._feature_backfill.start()
+        self._fingerprint_backfill = FingerprintBackfill(self, self._store)
+        self._fingerprint_backfill.start()
 
     def _build_ui(self):
         toolbar = ttk.Frame(self, padding=(8, 4))
         toolbar.pack(side=tk.TOP, fill=tk.X)
         ttk.Button(toolbar, text="导入…", command=self._import_files).pack(side=tk.LEFT)
+        ttk.Button(toolbar, text="同步文件夹…", command=self._sync_folder).pack(side=tk.LEFT, padx=(4, 0))
         ttk.Button(toolbar, text="设置", command=self._open_settings).pack(side=tk.LEFT, padx=4)
+        ttk.Button(toolbar, text="清除", command=self._clear_query).pack(side=tk.RIGHT)
+        self._query_input = tk.StringVar()
+        query_entry = ttk.Entry(toolbar, textvariable=self._query_input, width=36)
+        query_entry.pack(side=tk.RIGHT, padx=4)
+        query_entry.bind("<Return>", lambda e: self._run_query())
+        ttk.Label(toolbar, text="查询（AND / OR / NOT）：").pack(side=tk.RIGHT)
 
         pane = ttk.PanedWindow(self, orient=tk.HORIZONTAL)
         pane.pack(fill=tk.BOTH, expand=True)
@@ -258,36 +391,40 @@ class TaggerApp(tk.Tk):
         grid_container = ttk.Frame(right)
         grid_container.pack(fill=tk.BOTH, expand=True, padx=8, pady=(0, 8))
 
-        self._canvas = tk.Canvas(grid_container, borderwidth=0, highlightthickness=0)
-        vsb = ttk.Scrollbar(grid_container, orient="vertical", command=self._canvas.yview)
-        self._canvas.configure(yscrollcommand=vsb.set)
-        vsb.pack(side=tk.RIGHT, fill=tk.Y)
-        self._canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-        self._grid_frame = ttk.Frame(self._canvas)
-        self._canvas_window = self._canvas.create_window(
-            (0, 0), window=self._grid_frame, anchor="nw"
+        self._grid = PhotoGrid(
+            grid_container,
+            thumb_size=self._THUMB_SIZE,
+            get_thumb=self._get_thumb,
+            is_selected=lambda pid: pid in self._selected_ids,
+            on_click=lambda p: self._toggle_select(p.id),
+            on_double_click=self._open_detail,
+            on_context=self._card_context_menu,
+            on_viewport=self._on_grid_viewport,
+            on_resize=lambda: self._scheduler.mark(GRID_LAYOUT),
         )
-        self._grid_frame.bind("<Configure>", self._on_grid_configure)
-        self._canvas.bind("<Configure>", self._on_canvas_configure)
-
-        self._canvas.bind_all("<MouseWheel>", self._on_mousewheel)
-        self._canvas.bind_all("<Button-4>", self._on_mousewheel)
-        self._canvas.bind_all("<Button-5>", self._on_mousewheel)
+        self._grid.pack(fill=tk.BOTH, expand=True)
 
     def _refresh(self):
-        self._refresh_sidebar()
-        self._refresh_grid()
+        self._sidebar_rebuild = True
+        self._scheduler.mark(SIDEBAR, GRID_DATA)
+
+    def _flush_sidebar(self):
+        tags, self._sidebar_tags = self._sidebar_tags, set()
+        rebuild, self._sidebar_rebuild = self._sidebar_rebuild, False
+        if rebuild or not self._patch_sidebar_counts(tags):
+            self._refresh_sidebar()
+
+    def _flush_selection(self):
+        ids, self._restyle_ids = self._restyle_ids, set()
+        self._grid.restyle(ids)
+        self._update_selected_count()
 
     def _refresh_sidebar(self):
         lb = self._sidebar_list
-        old_sel = lb.curselection()
-        old_idx = old_sel[0] if old_sel else 0
-
         lb.delete(0, tk.END)
         self._sidebar_items = []
 
-        untagged_count = len(self._store.untagged_photos())
+        untagged_count = self._store.untagged_count()
         lb.insert(tk.END, f"  未标签  ({untagged_count})")
         self._sidebar_items.append(None)
 
@@ -295,103 +432,144 @@ class TaggerApp(tk.Tk):
             lb.insert(tk.END, f"  #{ts.tag}  ({ts.count})")
             self._sidebar_items.append(ts.tag)
 
-        target = min(old_idx, lb.size() - 1)
-        lb.selection_set(target)
-        lb.see(target)
+        # 当前标签已不存在时回到“未标签”
+        if self._current_tag not in self._sidebar_items:
+            self._current_tag = None
+        if self._current_query is None and self._similar_to is None:
+            target = self._sidebar_items.index(self._current_tag)
+            lb.selection_set(target)
+            lb.see(target)
+
+    def _patch_sidebar_counts(self, tags: Set[str]) -> bool:
+        """原地更新这些标签与“未标签”的计数；标签集合有增删时返回 False（需要重建）"""
+        index = {t: i for i, t in enumerate(self._sidebar_items)}
+        for tag in tags:
+            if (tag in index) != (self._store.tag_count(tag) > 0):
+                return False
+        lb = self._sidebar_list
+        selected = lb.curselection()
+        rows = [(0, f"  未标签  ({self._store.untagged_count()})")]
+        # 没有行、计数也为 0 的标签（如刚被删除或合并掉的）无需显示
+        rows += [(index[t], f"  #{t}  ({self._store.tag_count(t)})") for t in tags if t in index]
+        for i, text in rows:
+            if lb.get(i) != text:
+                lb.delete(i)
+                lb.insert(i, text)
+        for i in selected:
+            lb.selection_set(i)
+        return True
+
+    def _on_store_change(self, events: List[StoreEvent]):
+        """按事件增量更新：侧栏只改计数，网格只在当前视图受影响时重新取数据"""
+        tags: Set[str] = set()
+        ids: Set[str] = set()
+        view_dirty = False
+        for ev in events:
+            ids |= ev.photo_ids
+            if isinstance(ev, TagDeleted):
+                tags.add(ev.tag)
+                if self._current_tag == ev.tag:
+                    self._current_tag = None
+                view_dirty = True
+                continue
+            tags |= ev.tags
+            if isinstance(ev, PhotosRemoved):
+                self._selected_ids -= ev.photo_ids
+                for photo_id in ev.photo_ids:
+                    self._thumb_cache.invalidate(photo_id)
+                    self._thumb_loader.cancel(photo_id)
+            # 未标签视图受任何增删/改标签影响；标签视图只受该标签影响；
+            # 查询视图受增删照片（NOT 的全集变了）以及查询中出现的标签影响；相似视图只受增删照片影响
+            if self._similar_to is not None:
+                if not isinstance(ev, TagsChanged):
+                    view_dirty = True
+            elif self._current_query is not None:
+                if not isinstance(ev, TagsChanged) or ev.tags & self._query_tags:
+                    view_dirty = True
+            elif self._current_tag is None or self._current_tag in ev.tags:
+                view_dirty = True
+
+        self._sidebar_tags |= tags
+        self._scheduler.mark(SIDEBAR)
+        if view_dirty or self._view_key() != self._grid_view:
+            self._scheduler.mark(GRID_DATA)
+        else:
+            self._restyle_ids |= ids
+            self._scheduler.mark(SELECTION)
 
-        if target < len(self._sidebar_items):
-            self._current_tag = self._sidebar_items[target]
+    def _view_key(self) -> tuple:
+        if self._similar_to is not None:
+            return ("similar",) + self._similar_to
+        if self._current_query is not None:
+            return ("query", self._current_query)
+        return ("tag", self._current_tag)
 
     def _refresh_grid(self):
-        for w in self._grid_frame.winfo_children():
-            w.destroy()
-
-        photos = (self._store.untagged_photos() if self._current_tag is None
-                  else self._store.photos_for_tag(self._current_tag))
-
-        title = "未标签" if self._current_tag is None else f"#{self._current_tag}"
+        anchor = self._store.get(self._similar_to[1]) if self._similar_to is not None else None
+        if self._similar_to is not None and anchor is None:
+            # 基准照片已被移除：回到标签视图
+            self._similar_to = None
+            self._sidebar_list.selection_set(self._sidebar_items.index(self._current_tag))
+        if anchor is not None and self._similar_to[0] == "color":
+            photos = [anchor] + self._store.similar_colors(anchor.id)
+            title = f"与「{anchor.file_name}」颜色相近"
+        elif anchor is not None:
+            photos = [anchor] + self._store.similar_photos(anchor.id)
+            title = f"与「{anchor.file_name}」相似"
+        elif self._current_query is not None:
+            photos = self._store.query(self._current_query)
+            title = self._current_query
+        elif self._current_tag is None:
+            photos = self._store.untagged_photos()
+            title = "未标签"
+        else:
+            photos = self._store.photos_for_tag(self._current_tag)
+            title = f"#{self._current_tag}"
         self._title_var.set(title)
         self._count_var.set(f"{len(photos)} 张")
 
-        canvas_width = self._canvas.winfo_width()
-        cols = max(1, canvas_width // (self._THUMB_SIZE + 16))
-
-        for idx, photo in enumerate(photos):
-            row, col = divmod(idx, cols)
-            card = self._make_card(photo)
-            card.grid(row=row, column=col, padx=6, pady=6, sticky="nsew")
-
+        view = self._view_key()
+        view_changed = view != self._grid_view
+        self._grid_view = view
+        self._grid.set_photos(photos, reset_scroll=view_changed)
         self._update_selected_count()
 
-    def _make_card(self, photo: LibraryPhoto) -> tk.Frame:
-        is_selected = photo.id in self._selected_ids
-        bg = "#cce0ff" if is_selected else "#f5f5f5"
-
-        card = tk.Frame(self._grid_frame, bg=bg, bd=1,
-                        relief="solid", cursor="hand2",
-                        width=self._THUMB_SIZE + 16,
-                        height=self._THUMB_SIZE + 60)
-        card.pack_propagate(False)
-
-        tk_img = self._get_thumb(photo.thumbnail_path)
-        if tk_img:
-            img_label = tk.Label(card, image=tk_img, bg=bg, cursor="hand2")
-            img_label.image = tk_img
-        else:
-            img_label = tk.Label(card, text="📷", bg=bg, font=("", 32))
-        img_label.pack(fill=tk.BOTH, expand=True)
-
-        tk.Label(card, text=photo.file_name, bg=bg,
-                 font=("", 9), wraplength=self._THUMB_SIZE,
-                 justify="left", anchor="w").pack(fill=tk.X, padx=4)
-
-        date_str = (photo.capture_date or photo.import_date).strftime("%Y-%m-%d")
-        tk.Label(card, text=date_str, bg=bg,
-                 font=("", 8), foreground="gray").pack(anchor="w", padx=4)
-
-        # 单击 / 双击 区分
-        click_timer = [None]
-
-        def on_click(e, pid=photo.id):
-            if click_timer[0] is not None:
-                self.after_cancel(click_timer[0])
-            click_timer[0] = self.after(250, lambda: self._toggle_select(pid))
-
-        def on_dbl_click(e, p=photo):
-            if click_timer[0] is not None:
-                self.after_cancel(click_timer[0])
-                click_timer[0] = None
-            self._open_detail(p)
-
-        for widget in [card, img_label]:
-            widget.bind("<Button-1>", on_click)
-            widget.bind("<Double-Button-1>", on_dbl_click)
-
-        # 右键菜单
-        def show_ctx(e, p=photo):
-            menu = tk.Menu(self, tearoff=0)
+    def _card_context_menu(self, photo: LibraryPhoto, event):
+        menu = tk.Menu(self, tearoff=0)
+        menu.add_command(label="查找相似照片", command=lambda: self._show_similar(photo, "look"))
+        if _NP_OK:
+            menu.add_command(label="查找颜色相近的照片", command=lambda: self._show_similar(photo, "color"))
+        menu.add_separator()
+        menu.add_command(
+            label="删除这张照片（仅从库移除）",
+            command=lambda: self._confirm_delete({photo.id})
+        )
+        if self._selected_ids:
             menu.add_command(
-                label="删除这张照片（仅从库移除）",
-                command=lambda: self._confirm_delete({p.id})
+                label="删除已选照片（仅从库移除）",
+                command=lambda: self._confirm_delete(set(self._selected_ids))
             )
-            if self._selected_ids:
-                menu.add_command(
-                    label="删除已选照片（仅从库移除）",
-                    command=lambda: self._confirm_delete(set(self._selected_ids))
-                )
-            menu.tk_popup(e.x_root, e.y_root)
+        menu.tk_popup(event.x_root, event.y_root)
 
-        card.bind("<Button-2>", show_ctx)
-        card.bind("<Button-3>", show_ctx)
+    def _get_thumb(self, photo: LibraryPhoto, priority: int = 0) -> Optional["ImageTk.PhotoImage"]:
+        """已解码则直接返回；否则排队到后台解码，先显示占位图"""
+        if not photo.thumbnail_path or not _PIL_OK:
+            return None
+        found, tk_img = self._thumb_cache.lookup((photo.id, self._THUMB_SIZE))
+        if found:
+            return tk_img
+        self._thumb_loader.request(photo.id, photo, priority)
+        return None
 
-        return card
+    def _on_thumb_decoded(self, photo_id: str, img):
+        if self._store.get(photo_id) is None:
+            return
+        tk_img = ImageTk.PhotoImage(img) if img is not None else None
+        self._thumb_cache.put((photo_id, self._THUMB_SIZE), tk_img)
+        self._grid.set_thumb(photo_id, tk_img)
 
-    def _get_thumb(self, path: Optional[str]) -> Optional["ImageTk.PhotoImage"]:
-        if not path:
-            return None
-        if path not in self._thumb_cache:
-            self._thumb_cache[path] = _load_tk_image(path, self._THUMB_SIZE)
-        return self._thumb_cache[path]
+    def _on_grid_viewport(self, photos):
+        self._thumb_loader.retain(p.id for p in photos)
 
     def _on_sidebar_select(self, event=None):
         sel = self._sidebar_list.curselection()
@@ -400,8 +578,73 @@ class TaggerApp(tk.Tk):
         idx = sel[0]
         if idx < len(self._sidebar_items):
             self._current_tag = self._sidebar_items[idx]
+        self._set_query(None)
         self._selected_ids.clear()
-        self._refresh_grid()
+        self._scheduler.mark(GRID_DATA)
+
+    def _show_tag(self, tag: Optional[str]):
+        """切换到某个标签视图（None 为未标签），同步侧栏选中项"""
+        self._current_tag = tag if tag in self._sidebar_items else None
+        self._set_query(None)
+        lb = self._sidebar_list
+        lb.selection_clear(0, tk.END)
+        idx = self._sidebar_items.index(self._current_tag)
+        lb.selection_set(idx)
+        lb.see(idx)
+        if self._view_key() != self._grid_view:
+            self._selected_ids.clear()
+            self._scheduler.mark(GRID_DATA)
+
+    def _set_query(self, query: Optional[str]):
+        # 先解析：语法错误时抛出 QueryError，当前视图保持不变
+        self._query_tags = set(query_tags(parse_query(query))) if query is not None else set()
+        self._current_query = query
+        self._similar_to = None
+        if query is None:
+            self._query_input.set("")
+
+    def _run_query(self):
+        text = self._query_input.get().strip()
+        if not text:
+            self._clear_query()
+            return
+        try:
+            self._set_query(text)
+        except QueryError as e:
+            messagebox.showwarning("查询无效", str(e))
+            return
+        self._sidebar_list.selection_clear(0, tk.END)
+        if self._view_key() != self._grid_view:
+            self._selected_ids.clear()
+            self._scheduler.mark(GRID_DATA)
+
+    def _show_similar(self, photo: LibraryPhoto, kind: str):
+        """切换到与 photo 相似的照片视图，基准照片排在最前。
+        kind: "look" 按 dHash 找近似重复；"color" 按颜色/影调特征取最接近的若干张"""
+        ready = photo.dhash is not None if kind == "look" else self._store.has_color_feature(photo.id)
+        if not ready:
+            # 旧照片尚未补算特征：先用它的缓存缩略图算出
+            data = read_thumb(photo.id, self._THUMB_SIZE, source_path=photo.source_path)
+            dhash, color = features_from_jpeg(data) if data is not None else (None, None)
+            if (dhash if kind == "look" else color) is None:
+                messagebox.showwarning("无法比较", "无法读取这张照片的缩略图。")
+                return
+            if dhash is not None:
+                self._store.set_dhashes({photo.id: dhash})
+            if color is not None:
+                self._store.set_color_features({photo.id: color})
+        self._set_query(None)
+        self._similar_to = (kind, photo.id)
+        self._sidebar_list.selection_clear(0, tk.END)
+        if self._view_key() != self._grid_view:
+            self._selected_ids.clear()
+            self._scheduler.mark(GRID_DATA)
+
+    def _clear_query(self):
+        if self._current_query is not None or self._similar_to is not None:
+            self._show_tag(self._current_tag)
+        else:
+            self._query_input.set("")
 
     def _sidebar_context_menu(self, event):
         idx = self._sidebar_list.nearest(event.y)
@@ -422,7 +665,8 @@ class TaggerApp(tk.Tk):
             self._selected_ids.discard(photo_id)
         else:
             self._selected_ids.add(photo_id)
-        self._refresh_grid()
+        self._restyle_ids.add(photo_id)
+        self._scheduler.mark(SELECTION)
 
     def _open_detail(self, photo: LibraryPhoto):
         win = PhotoDetailWindow(self, photo, self._settings)
@@ -433,6 +677,9 @@ class TaggerApp(tk.Tk):
         SettingsWindow(self, self._settings)
 
     def _import_files(self):
+        if self._import_job is not None and self._import_job.running:
+            self._import_dialog.lift()
+            return
         paths = filedialog.askopenfilenames(
             title="导入照片",
             filetypes=[
@@ -442,30 +689,102 @@ class TaggerApp(tk.Tk):
         )
         if not paths:
             return
-        result = import_files(list(paths), initial_tags=[])
-        for p in result.imported:
-            self._store.add_imported(p)
-        self._current_tag = None
-        self._refresh()
+        self._show_tag(None)
+        # 在后台导入，已完成的照片分批出现在网格中
+        job = BackgroundImport(
+            self, self._store, list(paths), initial_tags=[],
+            on_progress=self._on_import_progress,
+            on_done=self._on_import_done,
+        )
+        self._import_dialog = ImportDialog(self, len(paths), on_cancel=job.cancel)
+        self._import_job = job
+        job.start()
+
+    def _on_import_progress(self, status: ImportStatus):
+        if self._import_dialog is not None:
+            self._import_dialog.update_status(status)
+
+    def _on_import_done(self, result: ImportResult):
+        if self._import_dialog is not None:
+            self._import_dialog.destroy()
+        self._import_dialog = None
+        self._import_job = None
+        if result.duplicates:
+            messagebox.showinfo("跳过重复", f"{len(result.duplicates)} 个文件已在库中，未重复导入。")
         if result.failures:
             names = "\n".join(os.path.basename(f) for f, _ in result.failures)
             messagebox.showwarning("导入失败", f"以下文件导入失败：\n{names}")
 
+    def _sync_folder(self):
+        if self._import_job is not None and self._import_job.running:
+            self._import_dialog.lift()
+            return
+        root = filedialog.askdirectory(title="同步文件夹", mustexist=True)
+        if not root:
+            return
+        self._show_tag(None)
+        # 只导入上次同步后新增或修改过的文件；扫描与导入都在后台进行
+        job = BackgroundSync(
+            self, self._store, root, initial_tags=[],
+            on_planned=self._on_sync_planned,
+            on_progress=self._on_import_progress,
+            on_done=self._on_sync_done,
+        )
+        self._import_dialog = ImportDialog(self, 0, on_cancel=job.cancel, title="同步文件夹")
+        self._import_dialog.set_note("正在扫描文件夹…")
+        self._import_job = job
+        job.start()
+
+    def _on_sync_planned(self, plan: ScanPlan):
+        if self._import_dialog is not None:
+            self._import_dialog.set_total(len(plan.to_import))
+            self._import_dialog.set_note(
+                f"新增 {len(plan.new)} · 已修改 {len(plan.changed)} · 未变化 {plan.unchanged}"
+            )
+
+    def _on_sync_done(self, sync: SyncResult):
+        manifest = self._import_job.manifest if self._import_job is not None else None
+        self._on_import_done(sync.result)
+        plan = sync.plan
+        if not sync.result.cancelled and not sync.missing_ids:
+            messagebox.showinfo(
+                "同步完成",
+                f"导入 {len(sync.result.imported)} 张（新增 {len(plan.new)}、已修改 {len(plan.changed)}），"
+                f"{plan.unchanged} 个文件未变化。",
+            )
+        if sync.missing_ids and messagebox.askyesno(
+            "原文件缺失",
+            f"{len(sync.missing_ids)} 张照片的原始文件已不在「{os.path.basename(plan.root)}」中。\n"
+            "是否从 TAGGER 索引库中移除这些照片？",
+        ):
+            self._store.delete_photos(set(sync.missing_ids), delete_thumbnail_files=True)
+            if manifest is not None:
+                manifest.forget(plan.missing)
+                manifest.save()
+
+    def _on_close(self):
+        if self._import_job is not None:
+            self._import_job.shutdown()
+        self._feature_backfill.cancel()
+        self._fingerprint_backfill.cancel()
+        self._thumb_loader.shutdown()
+        thumb_cache.flush_access_times()
+        self.destroy()
+
     def _add_tags(self):
         tags = parse_tags(self._tag_input.get())
         if not tags or not self._selected_ids:
             return
-        self._store.add_tags(set(self._selected_ids), tags)
-        self._tag_input.set("")
+        was_selected = set(self._selected_ids)
         self._selected_ids.clear()
-        self._refresh()
+        self._tag_input.set("")
+        self._store.add_tags(was_selected, tags)
+        self._restyle_ids |= was_selected
+        self._scheduler.mark(SELECTION)
 
     def _delete_tag(self, tag: str):
         if messagebox.askyesno("确认", f"从所有照片移除标签「{tag}」？"):
             self._store.delete_tag_globally(tag)
-            if self._current_tag == tag:
-                self._current_tag = None
-            self._refresh()
 
     def _delete_selected(self):
         if not self._selected_ids:
@@ -478,27 +797,10 @@ class TaggerApp(tk.Tk):
             f"将从 TAGGER 索引库中移除 {len(ids)} 张照片（不会删除原始图片文件）。"
         ):
             self._store.delete_photos(ids, delete_thumbnail_files=True)
-            self._selected_ids -= ids
-            self._refresh()
 
     def _update_selected_count(self):
         self._selected_count_var.set(f"已选 {len(self._selected_ids)} 张")
 
-    def _on_grid_configure(self, event=None):
-        self._canvas.configure(scrollregion=self._canvas.bbox("all"))
-
-    def _on_canvas_configure(self, event=None):
-        self._canvas.itemconfig(self._canvas_window, width=event.width)
-        self._refresh_grid()
-
-    def _on_mousewheel(self, event):
-        if event.num == 4:
-            self._canvas.yview_scroll(-1, "units")
-        elif event.num == 5:
-            self._canvas.yview_scroll(1, "units")
-        else:
-            self._canvas.yview_scroll(int(-1 * event.delta / 120), "units")
-
 
 if __name__ == "__main__":
     app = TaggerApp()
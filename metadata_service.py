@@ -11,6 +11,7 @@ except ImportError:
     _PIL_OK = False
 
 from library_models import PhotoEXIF
+from exif_reader import read_exif_tags
 
 
 @dataclass
@@ -28,11 +29,24 @@ def _parse_exif_date(s: str) -> Optional[datetime]:
 
 
 def read_metadata(path: str) -> Metadata:
+    """先用只读文件头的解析器（RAW 也适用），不是 JPEG/TIFF 容器时再交给 PIL"""
+    tags = read_exif_tags(path)
+    if tags is not None:
+        return metadata_from_tags(tags)
+
     if not _PIL_OK:
         return Metadata()
 
     try:
         img = Image.open(path)
+    except Exception:
+        return Metadata()
+    return metadata_from_image(img)
+
+
+def metadata_from_image(img: "Image.Image") -> Metadata:
+    """从已打开的 PIL 图像读取元数据（不解码像素）"""
+    try:
         raw = img._getexif()
     except Exception:
         return Metadata()
@@ -40,7 +54,18 @@ def read_metadata(path: str) -> Metadata:
     if not raw:
         return Metadata()
 
-    decoded: dict = {TAGS.get(k, k): v for k, v in raw.items()}
+    return metadata_from_tags({TAGS.get(k, k): v for k, v in raw.items()})
+
+
+def _as_float(v) -> float:
+    return float(v) if not hasattr(v, "numerator") else v.numerator / v.denominator
+
+
+def metadata_from_tags(decoded: dict) -> Metadata:
+    """从以 EXIF 标签名为键的字典（PIL 或 exif_reader 的结果）构造元数据"""
+    if not decoded:
+        return Metadata()
+
     capture_date: Optional[datetime] = None
     for key in ("DateTimeOriginal", "DateTimeDigitized", "DateTime"):
         if key in decoded:
@@ -57,19 +82,16 @@ def read_metadata(path: str) -> Metadata:
         info.lens_model = str(decoded["LensModel"]).strip()
 
     if "FNumber" in decoded:
-        fn = decoded["FNumber"]
-        info.f_number = float(fn) if not hasattr(fn, "numerator") else fn.numerator / fn.denominator
+        info.f_number = _as_float(decoded["FNumber"])
 
     if "ISOSpeedRatings" in decoded:
         iso = decoded["ISOSpeedRatings"]
         info.iso = int(iso[0]) if isinstance(iso, (list, tuple)) else int(iso)
 
     if "ExposureTime" in decoded:
-        et = decoded["ExposureTime"]
-        info.exposure_time = float(et) if not hasattr(et, "numerator") else et.numerator / et.denominator
+        info.exposure_time = _as_float(decoded["ExposureTime"])
 
     if "FocalLength" in decoded:
-        fl = decoded["FocalLength"]
-        info.focal_length = float(fl) if not hasattr(fl, "numerator") else fl.numerator / fl.denominator
+        info.focal_length = _as_float(decoded["FocalLength"])
 
     return Metadata(capture_date=capture_date, exif=info)
@@ -0,0 +1,243 @@
+from __future__ import annotations
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Dict, Iterable, List, Optional
+
+from library_models import LibraryPhoto
+
+
+class _Card:
+    """可复用的照片卡片；滚动时重新绑定到另一张照片而不是销毁重建"""
+
+    def __init__(self, grid: "PhotoGrid"):
+        self.photo: Optional[LibraryPhoto] = None
+        self.index = -1
+        size = grid.thumb_size
+        self.frame = tk.Frame(grid.canvas, bd=1, relief="solid", cursor="hand2",
+                              width=size + 16, height=size + 60)
+        self.frame.pack_propagate(False)
+        self.img_label = tk.Label(self.frame, cursor="hand2")
+        self.img_label.pack(fill=tk.BOTH, expand=True)
+        self.name_label = tk.Label(self.frame, font=("", 9), wraplength=size,
+                                   justify="left", anchor="w")
+        self.name_label.pack(fill=tk.X, padx=4)
+        self.date_label = tk.Label(self.frame, font=("", 8), foreground="gray")
+        self.date_label.pack(anchor="w", padx=4)
+        self.item = grid.canvas.create_window(0, 0, window=self.frame, anchor="nw")
+
+        # 单击 / 双击 区分
+        self._click_timer = None
+
+        def on_click(e):
+            if self.photo is None:
+                return
+            if self._click_timer is not None:
+                grid.after_cancel(self._click_timer)
+            photo = self.photo
+            self._click_timer = grid.after(250, lambda: self._fire(grid.on_click, photo))
+
+        def on_dbl_click(e):
+            if self._click_timer is not None:
+                grid.after_cancel(self._click_timer)
+                self._click_timer = None
+            if self.photo is not None:
+                grid.on_double_click(self.photo)
+
+        def on_context(e):
+            if self.photo is not None:
+                grid.on_context(self.photo, e)
+
+        for widget in (self.frame, self.img_label):
+            widget.bind("<Button-1>", on_click)
+            widget.bind("<Double-Button-1>", on_dbl_click)
+        self.frame.bind("<Button-2>", on_context)
+        self.frame.bind("<Button-3>", on_context)
+
+    def _fire(self, callback, photo: LibraryPhoto):
+        self._click_timer = None
+        callback(photo)
+
+    def show(self, photo: LibraryPhoto, selected: bool, thumb):
+        self.photo = photo
+        self.set_selected(selected)
+        self.set_thumb(thumb)
+        self.name_label.configure(text=photo.file_name)
+        date_str = (photo.capture_date or photo.import_date).strftime("%Y-%m-%d")
+        self.date_label.configure(text=date_str)
+
+    def set_selected(self, selected: bool):
+        bg = "#cce0ff" if selected else "#f5f5f5"
+        for widget in (self.frame, self.img_label, self.name_label, self.date_label):
+            widget.configure(bg=bg)
+
+    def set_thumb(self, thumb):
+        if thumb is not None:
+            self.img_label.configure(image=thumb, text="")
+        else:
+            self.img_label.configure(image="", text="📷", font=("", 32))
+        self.img_label.image = thumb
+
+
+class PhotoGrid(ttk.Frame):
+    """虚拟化的照片网格：只为可见行（加少量预取行）创建卡片，滚动时复用"""
+
+    _PAD = 6
+    _OVERSCAN_ROWS = 2
+
+    def __init__(
+        self,
+        parent,
+        thumb_size: int,
+        get_thumb: Callable[[LibraryPhoto, int], object],
+        is_selected: Callable[[str], bool],
+        on_click: Callable[[LibraryPhoto], None],
+        on_double_click: Callable[[LibraryPhoto], None],
+        on_context: Callable[[LibraryPhoto, tk.Event], None],
+        on_viewport: Optional[Callable[[List[LibraryPhoto]], None]] = None,
+        on_resize: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__(parent)
+        self.thumb_size = thumb_size
+        self.get_thumb = get_thumb
+        self.is_selected = is_selected
+        self.on_click = on_click
+        self.on_double_click = on_double_click
+        self.on_context = on_context
+        self.on_viewport = on_viewport
+        self.on_resize = on_resize
+
+        self._cell_w = thumb_size + 16 + 2 * self._PAD
+        self._cell_h = thumb_size + 60 + 2 * self._PAD
+        self._photos: List[LibraryPhoto] = []
+        self._cols = 1
+        self._active: Dict[int, _Card] = {}
+        self._spare: List[_Card] = []
+
+        self.canvas = tk.Canvas(self, borderwidth=0, highlightthickness=0)
+        self._vsb = ttk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_yview)
+        self._vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.canvas.bind("<Configure>", self._on_configure)
+
+        self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
+        self.canvas.bind_all("<Button-4>", self._on_mousewheel)
+        self.canvas.bind_all("<Button-5>", self._on_mousewheel)
+
+    @property
+    def photos(self) -> List[LibraryPhoto]:
+        return self._photos
+
+    def set_photos(self, photos: List[LibraryPhoto], reset_scroll: bool = False):
+        self._photos = photos
+        # 内容变了，已显示的卡片全部重新绑定
+        for card in self._active.values():
+            card.index = -1
+        self._layout()
+        if reset_scroll:
+            self.canvas.yview_moveto(0)
+        self._update_visible()
+
+    def set_thumb(self, photo_id: str, thumb):
+        """后台解码完成后替换占位图"""
+        for card in self._active.values():
+            if card.photo is not None and card.photo.id == photo_id:
+                card.set_thumb(thumb)
+
+    def restyle(self, photo_ids: Iterable[str]):
+        """只更新这些照片对应卡片的选中样式"""
+        ids = set(photo_ids)
+        for card in self._active.values():
+            if card.photo is not None and card.photo.id in ids:
+                card.set_selected(self.is_selected(card.photo.id))
+
+    def refresh_cards(self):
+        """重新绑定当前可见卡片（选中状态、缩略图等变化后调用）"""
+        for idx, card in self._active.items():
+            self._bind_card(card, idx)
+
+    def _layout(self):
+        width = max(1, self.canvas.winfo_width())
+        self._cols = max(1, width // self._cell_w)
+        rows = -(-len(self._photos) // self._cols)
+        self.canvas.configure(scrollregion=(0, 0, width, max(rows * self._cell_h, 1)))
+
+    def _visible_range(self) -> range:
+        if not self._photos:
+            return range(0)
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first_row = max(0, int(top // self._cell_h) - self._OVERSCAN_ROWS)
+        last_row = int(bottom // self._cell_h) + self._OVERSCAN_ROWS
+        start = first_row * self._cols
+        stop = min(len(self._photos), (last_row + 1) * self._cols)
+        return range(start, stop)
+
+    def _row_distance(self, row: int) -> int:
+        """0 表示在视口内，否则为距视口的行数（用于缩略图加载优先级）"""
+        top = self.canvas.canvasy(0)
+        first = int(top // self._cell_h)
+        last = int((top + self.canvas.winfo_height()) // self._cell_h)
+        if row < first:
+            return first - row
+        return max(0, row - last)
+
+    def _update_visible(self):
+        wanted = self._visible_range()
+        for idx in [i for i in self._active if i not in wanted]:
+            card = self._active.pop(idx)
+            card.photo = None
+            self.canvas.itemconfigure(card.item, state="hidden")
+            self._spare.append(card)
+        for idx in wanted:
+            card = self._active.get(idx)
+            if card is None:
+                card = self._spare.pop() if self._spare else _Card(self)
+                card.index = -1
+                self._active[idx] = card
+            if card.index != idx:
+                self._bind_card(card, idx)
+            elif card.img_label.image is None:
+                # 仍在等缩略图：按当前位置更新加载优先级（滚入视口的卡片提前）
+                photo = self._photos[idx]
+                thumb = self.get_thumb(photo, self._row_distance(idx // self._cols))
+                if thumb is not None:
+                    card.set_thumb(thumb)
+        if self.on_viewport is not None:
+            self.on_viewport([self._photos[i] for i in wanted])
+
+    def _bind_card(self, card: _Card, idx: int):
+        photo = self._photos[idx]
+        card.index = idx
+        row, col = divmod(idx, self._cols)
+        card.show(photo, self.is_selected(photo.id), self.get_thumb(photo, self._row_distance(row)))
+        self.canvas.coords(card.item, col * self._cell_w + self._PAD, row * self._cell_h + self._PAD)
+        self.canvas.itemconfigure(card.item, state="normal")
+
+    def _on_yview(self, first, last):
+        self._vsb.set(first, last)
+        self._update_visible()
+
+    def _on_configure(self, event=None):
+        # 交给调度器合并：拖动窗口边缘时每秒会有几十次 Configure
+        if self.on_resize is not None:
+            self.on_resize()
+        else:
+            self.relayout()
+
+    def relayout(self):
+        """按当前画布尺寸重新计算列数与可见卡片"""
+        cols = max(1, self.canvas.winfo_width() // self._cell_w)
+        if cols != self._cols:
+            for card in self._active.values():
+                card.index = -1
+        self._layout()
+        self._update_visible()
+
+    def _on_mousewheel(self, event):
+        if event.num == 4:
+            self.canvas.yview_scroll(-1, "units")
+        elif event.num == 5:
+            self.canvas.yview_scroll(1, "units")
+        else:
+            self.canvas.yview_scroll(int(-1 * event.delta / 120), "units")
@@ -0,0 +1,350 @@
+from __future__ import annotations
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 查询语法：
+#   travel AND 2024 AND NOT rejected
+#   (portrait OR street) AND film
+#   "new york" & !rejected          相邻的词之间默认为 AND
+# 关键字不区分大小写；含空格或与关键字同名的标签用双引号括起来。
+
+
+class QueryError(ValueError):
+    pass
+
+
+# 语法树节点：("tag", name) / ("not", node) / ("and", (node, ...)) / ("or", (node, ...))
+Node = Tuple
+
+
+_TOKEN_RE = re.compile(r'\s*(?:(?P<lp>\()|(?P<rp>\))|(?P<and>&)|(?P<or>\|)|(?P<not>!)'
+                       r'|"(?P<quoted>[^"]*)"|(?P<word>[^\s()&|!"]+))')
+_KEYWORDS = {"and": "and", "or": "or", "not": "not"}
+
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens: List[Tuple[str, str]] = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if m is None:
+            raise QueryError(f"无法解析的字符：{text[pos:].strip()[:1]!r}")
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == "word" and m.group("word").lower() in _KEYWORDS:
+            tokens.append((_KEYWORDS[m.group("word").lower()], ""))
+        elif kind in ("word", "quoted"):
+            tokens.append(("tag", m.group(kind)))
+        else:
+            tokens.append((kind, ""))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self._tokens = tokens
+        self._i = 0
+
+    def _peek(self) -> Optional[str]:
+        return self._tokens[self._i][0] if self._i < len(self._tokens) else None
+
+    def _take(self) -> Tuple[str, str]:
+        tok = self._tokens[self._i]
+        self._i += 1
+        return tok
+
+    def parse(self) -> Node:
+        if not self._tokens:
+            raise QueryError("查询为空")
+        node = self._or()
+        if self._peek() is not None:
+            raise QueryError("多余的右括号" if self._peek() == "rp" else "查询语法错误")
+        return node
+
+    def _or(self) -> Node:
+        items = [self._and()]
+        while self._peek() == "or":
+            self._take()
+            items.append(self._and())
+        return items[0] if len(items) == 1 else ("or", tuple(items))
+
+    def _and(self) -> Node:
+        items = [self._not()]
+        while self._peek() in ("and", "not", "tag", "lp"):
+            if self._peek() == "and":
+                self._take()
+            items.append(self._not())
+        return items[0] if len(items) == 1 else ("and", tuple(items))
+
+    def _not(self) -> Node:
+        if self._peek() == "not":
+            self._take()
+            return ("not", self._not())
+        return self._atom()
+
+    def _atom(self) -> Node:
+        kind = self._peek()
+        if kind is None:
+            raise QueryError("查询不完整")
+        if kind == "tag":
+            return ("tag", self._take()[1])
+        if kind == "lp":
+            self._take()
+            node = self._or()
+            if self._peek() != "rp":
+                raise QueryError("缺少右括号")
+            self._take()
+            return node
+        raise QueryError("查询语法错误")
+
+
+def _normalize(node: Node) -> Node:
+    """展开嵌套的同类 AND/OR、去掉重复项与双重否定，使等价查询得到相同的计划"""
+    op = node[0]
+    if op == "tag":
+        return node
+    if op == "not":
+        inner = _normalize(node[1])
+        return inner[1] if inner[0] == "not" else ("not", inner)
+    items: List[Node] = []
+    for child in node[1]:
+        child = _normalize(child)
+        for item in (child[1] if child[0] == op else (child,)):
+            if item not in items:
+                items.append(item)
+    return items[0] if len(items) == 1 else (op, tuple(items))
+
+
+def parse_query(text: str) -> Node:
+    return _normalize(_Parser(_tokenize(text)).parse())
+
+
+def query_tags(node: Node) -> List[str]:
+    """查询中引用的所有标签"""
+    if node[0] == "tag":
+        return [node[1]]
+    if node[0] == "not":
+        return query_tags(node[1])
+    return [t for child in node[1] for t in query_tags(child)]
+
+
+# ---- 位图 ----
+
+_BYTE_BITS = [tuple(i for i in range(8) if b >> i & 1) for b in range(256)]
+
+
+def bit_count(bits: int) -> int:
+    return bits.bit_count() if hasattr(bits, "bit_count") else bin(bits).count("1")
+
+
+def bit_positions(bits: int) -> List[int]:
+    """位图中所有置位的位置（升序）"""
+    out: List[int] = []
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for i, byte in enumerate(data):
+        if byte:
+            base = i << 3
+            out.extend(base + j for j in _BYTE_BITS[byte])
+    return out
+
+
+class TagBitmapIndex:
+    """给每张照片分配稠密的整数位置，并按需为每个标签构建位图（Python int，第 pos 位对应一张照片）。
+
+    标签位图在第一次查询时从 members(tag) 构建，之后随增删原地置位/清位；删除照片空出的位置会被复用。
+    generation 在任何变化后递增，可用来判断缓存的查询结果是否仍然有效。
+    """
+
+    def __init__(self, members: Callable[[str], Iterable[str]]):
+        self._members = members
+        self._pos: Dict[str, int] = {}
+        self._slots: List[Optional[str]] = []
+        self._free: List[int] = []
+        self._bits: Dict[str, int] = {}
+        self._live: Optional[int] = None
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    @property
+    def capacity(self) -> int:
+        """位置上限（含空位），列式数组按此长度分配"""
+        return len(self._slots)
+
+    def position(self, photo_id: str) -> Optional[int]:
+        return self._pos.get(photo_id)
+
+    def photo_id_at(self, pos: int) -> Optional[str]:
+        return self._slots[pos] if 0 <= pos < len(self._slots) else None
+
+    def clear(self):
+        self._pos = {}
+        self._slots = []
+        self._free = []
+        self._bits = {}
+        self._live = None
+        self.generation += 1
+
+    def assign(self, photo_id: str) -> int:
+        pos = self._pos.get(photo_id)
+        if pos is not None:
+            return pos
+        if self._free:
+            pos = self._free.pop()
+            self._slots[pos] = photo_id
+        else:
+            pos = len(self._slots)
+            self._slots.append(photo_id)
+        self._pos[photo_id] = pos
+        self.generation += 1
+        return pos
+
+    def release(self, photo_id: str):
+        pos = self._pos.pop(photo_id, None)
+        if pos is None:
+            return
+        self._slots[pos] = None
+        self._free.append(pos)
+        if self._live is not None:
+            self._live &= ~(1 << pos)
+        self.generation += 1
+
+    def set_bits(self, photo_id: str, tags: Iterable[str]):
+        """照片加入这些标签：已构建的位图原地置位，未构建的等到查询时再建"""
+        self.generation += 1
+        built = [t for t in tags if t in self._bits]
+        if not built and self._live is None:
+            return
+        bit = 1 << self._pos[photo_id]
+        for t in built:
+            self._bits[t] |= bit
+        if self._live is not None:
+            self._live |= bit
+
+    def clear_bits(self, photo_id: str, tags: Iterable[str]):
+        self.generation += 1
+        built = [t for t in tags if t in self._bits]
+        pos = self._pos.get(photo_id)
+        if not built or pos is None:
+            return
+        mask = ~(1 << pos)
+        for t in built:
+            self._bits[t] &= mask
+
+    def _from_ids(self, ids: Iterable[str]) -> int:
+        buf = bytearray((len(self._slots) + 7) >> 3)
+        pos = self._pos
+        for photo_id in ids:
+            p = pos.get(photo_id)
+            if p is not None:
+                buf[p >> 3] |= 1 << (p & 7)
+        return int.from_bytes(buf, "little")
+
+    def bitmap(self, tag: str) -> int:
+        bits = self._bits.get(tag)
+        if bits is None:
+            bits = self._bits[tag] = self._from_ids(self._members(tag))
+        return bits
+
+    def live(self) -> int:
+        """所有在库照片的位图（NOT 的全集）"""
+        if self._live is None:
+            self._live = self._from_ids(self._pos)
+        return self._live
+
+    def ids(self, bits: int) -> List[str]:
+        slots = self._slots
+        return [slots[p] for p in bit_positions(bits)]
+
+    def membership(self, bits: int) -> Callable[[str], bool]:
+        """返回判断某张照片是否在位图中的函数（先转成字节，避免每次对大整数移位）"""
+        data = bits.to_bytes((len(self._slots) + 7) >> 3, "little")
+        pos = self._pos
+
+        def contains(photo_id: str) -> bool:
+            p = pos.get(photo_id)
+            return p is not None and bool(data[p >> 3] >> (p & 7) & 1)
+
+        return contains
+
+
+class TagQueryEngine:
+    """解析并执行布尔标签查询。
+
+    解析结果（查询计划）按查询文本缓存；执行结果按 (文本, generation) 缓存，库未变化时重复查询直接返回。
+    AND 按标签规模从小到大求交，结果为空时提前结束；AND 中的 NOT 直接用 & ~x，不需要全集。
+    """
+
+    def __init__(self, index: TagBitmapIndex, cache_size: int = 128):
+        self._index = index
+        self._cache_size = cache_size
+        self._plans: "OrderedDict[str, Node]" = OrderedDict()
+        self._results: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+
+    def plan(self, text: str) -> Node:
+        key = text.strip()
+        node = self._plans.get(key)
+        if node is not None:
+            self._plans.move_to_end(key)
+            return node
+        node = parse_query(key)
+        self._plans[key] = node
+        if len(self._plans) > self._cache_size:
+            self._plans.popitem(last=False)
+        return node
+
+    def evaluate(self, text: str) -> int:
+        key = text.strip()
+        generation = self._index.generation
+        cached = self._results.get(key)
+        if cached is not None and cached[0] == generation:
+            self._results.move_to_end(key)
+            return cached[1]
+        bits = self._eval(self.plan(key))
+        self._results[key] = (generation, bits)
+        if len(self._results) > self._cache_size:
+            self._results.popitem(last=False)
+        return bits
+
+    def count(self, text: str) -> int:
+        return bit_count(self.evaluate(text))
+
+    def ids(self, text: str) -> List[str]:
+        return self._index.ids(self.evaluate(text))
+
+    def _cost(self, node: Node) -> int:
+        """估算节点结果大小，用于安排 AND 的求值顺序"""
+        op = node[0]
+        if op == "tag":
+            return bit_count(self._index.bitmap(node[1]))
+        if op == "not":
+            return len(self._index) - self._cost(node[1])
+        costs = [self._cost(child) for child in node[1]]
+        return min(costs) if op == "and" else sum(costs)
+
+    def _eval(self, node: Node) -> int:
+        op = node[0]
+        if op == "tag":
+            return self._index.bitmap(node[1])
+        if op == "not":
+            return self._index.live() & ~self._eval(node[1])
+        if op == "or":
+            bits = 0
+            for child in node[1]:
+                bits |= self._eval(child)
+            return bits
+        positive = sorted((c for c in node[1] if c[0] != "not"), key=self._cost)
+        negative = [c[1] for c in node[1] if c[0] == "not"]
+        bits = self._eval(positive[0]) if positive else self._index.live()
+        for child in positive[1:]:
+            if not bits:
+                return 0
+            bits &= self._eval(child)
+        for child in negative:
+            if not bits:
+                return 0
+            bits &= ~self._eval(child)
+        return bits
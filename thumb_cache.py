@@ -1,8 +1,31 @@
+import mmap
 import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+from thumbnail_service import make_thumbnail_pyramid
 
 _CACHE_ROOT = os.path.join(
     os.path.expanduser("~"), "Library", "Application Support", "TAGGER", "ThumbCache"
 )
+_PACK_PATH = os.path.join(
+    os.path.expanduser("~"), "Library", "Application Support", "TAGGER", "ThumbPack", "thumbs.pack"
+)
+
+# 导入时生成的缩略图尺寸（长边像素）：网格、详情窗口、原有的 900px 基础尺寸
+THUMB_SIZES = (150, 600, 900)
+BASE_SIZE = 900
+
+# 缩略图存储后端："files" 每张图一个文件；"pack" 追加写入单个 mmap 打包文件
+THUMB_BACKENDS = ("files", "pack")
+
+_FILE_RE = re.compile(r"^(?P<id>.+?)(?:_(?P<size>\d+))?\.jpg$")
+
+ThumbBytes = Union[bytes, memoryview]
 
 
 def cache_root() -> str:
@@ -10,5 +33,570 @@ def cache_root() -> str:
     return _CACHE_ROOT
 
 
-def thumb_url(photo_id: str) -> str:
-    return os.path.join(cache_root(), f"{photo_id}.jpg")
+def thumb_url(photo_id: str, size: int = BASE_SIZE) -> str:
+    if size == BASE_SIZE:
+        return os.path.join(cache_root(), f"{photo_id}.jpg")
+    return os.path.join(cache_root(), f"{photo_id}_{size}.jpg")
+
+
+class FileThumbStore:
+    """ThumbCache 目录下每个尺寸一个 JPEG 文件：{id}.jpg / {id}_{size}.jpg"""
+
+    def __init__(self):
+        self._touched: Set[Tuple[str, int]] = set()
+        self._touch_lock = threading.Lock()
+
+    def ref(self, photo_id: str) -> str:
+        return thumb_url(photo_id)
+
+    def put(self, photo_id: str, size: int, data: bytes):
+        with open(thumb_url(photo_id, size), "wb") as f:
+            f.write(data)
+
+    def get(self, photo_id: str, size: int) -> Optional[bytes]:
+        try:
+            with open(thumb_url(photo_id, size), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def levels(self, photo_id: str) -> List[int]:
+        return [s for s in THUMB_SIZES if os.path.exists(thumb_url(photo_id, s))]
+
+    def remove(self, photo_id: str):
+        for level in THUMB_SIZES:
+            try:
+                os.remove(thumb_url(photo_id, level))
+            except OSError:
+                pass
+
+    def touch(self, photo_id: str, size: int):
+        """记下一次命中；文件 mtime 是跨进程重启仍然有效的 LRU 时间戳，由 flush_touched 批量更新"""
+        with self._touch_lock:
+            self._touched.add((photo_id, size))
+
+    def flush_touched(self):
+        with self._touch_lock:
+            touched, self._touched = self._touched, set()
+        for photo_id, size in touched:
+            try:
+                os.utime(thumb_url(photo_id, size))
+            except OSError:
+                pass
+
+    def entries(self) -> List[Tuple[str, int, str]]:
+        """[(photo_id, size, 文件路径)]"""
+        out = []
+        root = cache_root()
+        with os.scandir(root) as it:
+            for entry in it:
+                m = _FILE_RE.match(entry.name)
+                if m and entry.is_file():
+                    size = int(m.group("size")) if m.group("size") else BASE_SIZE
+                    out.append((m.group("id"), size, entry.path))
+        return out
+
+    def usage(self) -> Dict[str, Tuple[int, float]]:
+        """{photo_id: (占用字节, 最近使用时间)}"""
+        out: Dict[str, Tuple[int, float]] = {}
+        for photo_id, _, path in self.entries():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            nbytes, last = out.get(photo_id, (0, 0.0))
+            out[photo_id] = (nbytes + st.st_size, max(last, st.st_mtime))
+        return out
+
+    def photo_ids(self) -> Set[str]:
+        return {photo_id for photo_id, _, _ in self.entries()}
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def maybe_compact(self):
+        pass
+
+
+# 打包文件格式：文件头 magic + 版本，随后是首尾相接的记录
+#   记录头 <BHI：flags(1=数据, 0=删除标记), key 长度, 数据长度；随后是 key(utf-8) 与数据
+# key 为 "{photo_id}:{size}"，删除标记的 key 为 photo_id（删除该照片所有尺寸）
+_PACK_MAGIC = b"TGPK\x01\x00\x00\x00"
+_REC = struct.Struct("<BHI")
+
+
+class PackThumbStore:
+    """追加写入的单文件缩略图仓库；读取经 mmap 直接返回 memoryview 切片，不复制数据"""
+
+    def __init__(self, pack_path: str = _PACK_PATH):
+        os.makedirs(os.path.dirname(pack_path), exist_ok=True)
+        self._path = pack_path
+        self._lock = threading.RLock()
+        self._index: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        self._levels: Dict[str, Set[int]] = {}
+        self._dead_bytes = 0
+        self._map: Optional[mmap.mmap] = None
+        self._open()
+
+    def _open(self):
+        if not os.path.exists(self._path) or os.path.getsize(self._path) < len(_PACK_MAGIC):
+            self._create()
+        try:
+            end = self._load()
+        except ValueError:
+            # 文件头或记录键无法解析：丢弃重建，缩略图之后按需从原图重新生成
+            self._map = None
+            self._fh.close()
+            self._create()
+            end = self._load()
+        self._fh.seek(0, os.SEEK_END)
+        if self._fh.tell() != end:
+            # 上次写入中断留下的半条记录
+            self._fh.truncate(end)
+            self._remap()
+        self._fh.seek(end)
+
+    def _create(self):
+        with open(self._path, "wb") as f:
+            f.write(_PACK_MAGIC)
+
+    def _load(self) -> int:
+        self._fh = open(self._path, "r+b")
+        self._index = {}
+        self._levels = {}
+        self._dead_bytes = 0
+        self._remap()
+        return self._scan()
+
+    def _remap(self):
+        # 旧映射可能仍被外部的 memoryview 引用，不主动 close，交给引用计数回收
+        size = os.fstat(self._fh.fileno()).st_size
+        self._map = mmap.mmap(self._fh.fileno(), size, access=mmap.ACCESS_READ) if size else None
+
+    def _scan(self) -> int:
+        m = self._map
+        if m is None or m[:len(_PACK_MAGIC)] != _PACK_MAGIC:
+            raise ValueError(f"not a thumbnail pack: {self._path}")
+        pos = len(_PACK_MAGIC)
+        total = len(m)
+        while pos + _REC.size <= total:
+            flags, key_len, data_len = _REC.unpack_from(m, pos)
+            end = pos + _REC.size + key_len + data_len
+            if end > total:
+                break
+            key = m[pos + _REC.size:pos + _REC.size + key_len].decode("utf-8")
+            self._apply(flags, key, pos + _REC.size + key_len, data_len, _REC.size + key_len)
+            pos = end
+        return pos
+
+    def _apply(self, flags: int, key: str, data_at: int, data_len: int, overhead: int):
+        if flags == 1:
+            photo_id, _, size = key.rpartition(":")
+            k = (photo_id, int(size))
+            old = self._index.get(k)
+            if old is not None:
+                self._dead_bytes += old[1] + overhead
+            self._index[k] = (data_at, data_len)
+            self._levels.setdefault(photo_id, set()).add(k[1])
+        else:
+            self._dead_bytes += overhead
+            for size in self._levels.pop(key, ()):
+                _, length = self._index.pop((key, size))
+                self._dead_bytes += length + _REC.size + len(f"{key}:{size}".encode("utf-8"))
+
+    def _append(self, flags: int, key: str, data: bytes = b"") -> int:
+        kb = key.encode("utf-8")
+        pos = self._fh.tell()
+        self._fh.write(_REC.pack(flags, len(kb), len(data)))
+        self._fh.write(kb)
+        self._fh.write(data)
+        self._fh.flush()
+        self._apply(flags, key, pos + _REC.size + len(kb), len(data), _REC.size + len(kb))
+        return pos
+
+    def ref(self, photo_id: str) -> str:
+        return f"{self._path}#{photo_id}"
+
+    def put(self, photo_id: str, size: int, data: bytes):
+        with self._lock:
+            self._append(1, f"{photo_id}:{size}", data)
+
+    def get(self, photo_id: str, size: int) -> Optional[memoryview]:
+        with self._lock:
+            loc = self._index.get((photo_id, size))
+            if loc is None:
+                return None
+            at, length = loc
+            if self._map is None or at + length > len(self._map):
+                self._remap()
+            return memoryview(self._map)[at:at + length]
+
+    def _read(self, at: int, length: int) -> Optional[bytes]:
+        """复制一条记录的数据；映射落后于追加写入时先重新映射，长度不符返回 None"""
+        if self._map is None or at + length > len(self._map):
+            self._fh.flush()
+            self._remap()
+        data = self._map[at:at + length] if self._map is not None else b""
+        return data if len(data) == length else None
+
+    def levels(self, photo_id: str) -> List[int]:
+        with self._lock:
+            return sorted(self._levels.get(photo_id, ()))
+
+    def touch(self, photo_id: str, size: int):
+        pass
+
+    def flush_touched(self):
+        pass
+
+    def usage(self) -> Dict[str, Tuple[int, float]]:
+        """{photo_id: (占用字节, 顺序值)}；打包文件不记录访问时间，以写入位置近似"""
+        with self._lock:
+            out: Dict[str, Tuple[int, float]] = {}
+            for (photo_id, _), (at, length) in self._index.items():
+                nbytes, last = out.get(photo_id, (0, 0.0))
+                out[photo_id] = (nbytes + length, max(last, float(at)))
+            return out
+
+    def remove(self, photo_id: str):
+        with self._lock:
+            if photo_id in self._levels:
+                self._append(0, photo_id)
+
+    def photo_ids(self) -> Set[str]:
+        with self._lock:
+            return set(self._levels)
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._fh.tell()
+
+    def compact(self):
+        """只保留仍有效的记录，重写为新文件后原子替换"""
+        with self._lock:
+            tmp = self._path + ".tmp"
+            with open(tmp, "wb") as out:
+                out.write(_PACK_MAGIC)
+                for (photo_id, size), (at, length) in sorted(self._index.items(), key=lambda kv: kv[1][0]):
+                    data = self._read(at, length)
+                    if data is None:
+                        continue
+                    kb = f"{photo_id}:{size}".encode("utf-8")
+                    out.write(_REC.pack(1, len(kb), length))
+                    out.write(kb)
+                    out.write(data)
+            self._fh.close()
+            os.replace(tmp, self._path)
+            self._open()
+
+    def needs_compaction(self, min_dead_bytes: int = 16 * 1024 * 1024) -> bool:
+        """删除产生的无效数据超过有效数据且达到一定规模"""
+        with self._lock:
+            live = self.size_bytes() - self._dead_bytes
+            return self._dead_bytes >= min_dead_bytes and self._dead_bytes > live
+
+    def maybe_compact(self, min_dead_bytes: int = 16 * 1024 * 1024):
+        with self._lock:
+            if self.needs_compaction(min_dead_bytes):
+                self.compact()
+
+    def migrate_from_files(self, files: FileThumbStore) -> int:
+        """把旧的逐文件缓存搬进打包文件并删除原文件；返回迁移的文件数"""
+        moved = 0
+        with self._lock:
+            for photo_id, size, path in files.entries():
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    self._append(1, f"{photo_id}:{size}", data)
+                    os.remove(path)
+                    moved += 1
+                except OSError:
+                    continue
+        return moved
+
+    def migrate_to_files(self, files: FileThumbStore) -> int:
+        """切回逐文件缓存时把打包文件中的缩略图写成文件；返回写出的文件数"""
+        moved = 0
+        with self._lock:
+            for (photo_id, size), (at, length) in self._index.items():
+                data = self._read(at, length)
+                if data is not None:
+                    files.put(photo_id, size, data)
+                    moved += 1
+        return moved
+
+    def close(self):
+        with self._lock:
+            self._map = None
+            self._fh.close()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    regenerated: int = 0
+    evictions: int = 0
+    orphans_removed: int = 0
+    bytes_used: int = 0
+    max_bytes: int = 0
+
+
+class _LruBudget:
+    """按照片为单位记录缓存占用；超过预算时从最久未使用的照片开始淘汰。
+
+    预算为 0（不限制）时不做任何记录。占用表由 GC 线程首次 enforce 时扫描缓存建立，
+    在此之前写入的照片先记在 _early 中，建表时合并。
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes          # 0 表示不限制
+        self._lru: Optional["OrderedDict[str, int]"] = None
+        self._early: Dict[str, int] = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    def touch(self, photo_id: str):
+        if not self.max_bytes:
+            return
+        with self._lock:
+            if self._lru is not None and photo_id in self._lru:
+                self._lru.move_to_end(photo_id)
+
+    def added(self, photo_id: str, nbytes: int) -> List[str]:
+        """记录新写入的缩略图，返回需要淘汰的照片 id"""
+        if not self.max_bytes:
+            return []
+        with self._lock:
+            if self._lru is None:
+                self._early[photo_id] = nbytes
+                return []
+            self._total += nbytes - self._lru.pop(photo_id, 0)
+            self._lru[photo_id] = nbytes
+            return self._over_budget(keep=photo_id)
+
+    def removed(self, photo_id: str):
+        if not self.max_bytes:
+            return
+        with self._lock:
+            if self._lru is None:
+                self._early.pop(photo_id, None)
+            else:
+                self._total -= self._lru.pop(photo_id, 0)
+
+    def enforce(self, store) -> List[str]:
+        """在 GC 线程中调用；首次调用时扫描缓存建立占用表（扫描期间不持锁）"""
+        if not self.max_bytes:
+            return []
+        if self._lru is None:
+            usage = sorted(store.usage().items(), key=lambda kv: kv[1][1])
+            with self._lock:
+                if self._lru is None:
+                    lru = OrderedDict((photo_id, nbytes) for photo_id, (nbytes, _) in usage)
+                    for photo_id, nbytes in self._early.items():
+                        lru.pop(photo_id, None)
+                        lru[photo_id] = nbytes
+                    self._early.clear()
+                    self._lru = lru
+                    self._total = sum(lru.values())
+        with self._lock:
+            return self._over_budget(keep=None)
+
+    def _over_budget(self, keep: Optional[str]) -> List[str]:
+        victims = []
+        for photo_id in list(self._lru):
+            if self._total <= self.max_bytes:
+                break
+            if photo_id == keep:
+                continue
+            self._total -= self._lru.pop(photo_id)
+            victims.append(photo_id)
+        return victims
+
+
+_active: Optional[Union[FileThumbStore, PackThumbStore]] = None
+_active_lock = threading.Lock()
+_budget = _LruBudget()
+_stats = CacheStats()
+# 上一次 GC 开始后新写入的照片；GC 不会把它们当作孤儿（可能尚未加入索引）
+_fresh: Set[str] = set()
+_compact_lock = threading.Lock()
+_compacting = False
+
+
+def configure(backend: str = "files", max_bytes: int = 0) -> Union[FileThumbStore, PackThumbStore]:
+    """选择缩略图存储后端与磁盘预算（0 表示不限）；切换后端时自动把已有缩略图迁移过去"""
+    global _active, _budget, _stats
+    if backend not in THUMB_BACKENDS:
+        raise ValueError(f"unknown thumbnail backend: {backend}")
+    with _active_lock:
+        if backend == "pack":
+            store = PackThumbStore()
+            store.migrate_from_files(FileThumbStore())
+        else:
+            store = FileThumbStore()
+            if os.path.exists(_PACK_PATH):
+                pack = PackThumbStore()
+                try:
+                    pack.migrate_to_files(store)
+                except OSError:
+                    pass        # 写不出的留在打包文件中，下次启动再试
+                else:
+                    pack.close()
+                    os.remove(_PACK_PATH)
+        _active = store
+        _budget = _LruBudget(max_bytes)
+        _stats = CacheStats()
+    return store
+
+
+def thumb_store() -> Union[FileThumbStore, PackThumbStore]:
+    global _active
+    with _active_lock:
+        if _active is None:
+            _active = FileThumbStore()
+        return _active
+
+
+def cache_stats() -> CacheStats:
+    return CacheStats(
+        hits=_stats.hits,
+        misses=_stats.misses,
+        regenerated=_stats.regenerated,
+        evictions=_stats.evictions,
+        orphans_removed=_stats.orphans_removed,
+        bytes_used=_budget.total,
+        max_bytes=_budget.max_bytes,
+    )
+
+
+def best_level(levels: List[int], size: int) -> Optional[int]:
+    """能满足 size 的最小尺寸；都不够大时取最大的那个"""
+    if not levels:
+        return None
+    fitting = [s for s in levels if s >= size]
+    return min(fitting) if fitting else max(levels)
+
+
+def _evict(store, victims: List[str]):
+    for photo_id in victims:
+        store.remove(photo_id)
+    if victims:
+        _stats.evictions += len(victims)
+        schedule_compaction()
+
+
+def schedule_compaction():
+    """删除或淘汰缩略图后调用：需要时在后台线程压缩打包文件，不阻塞导入与界面线程"""
+    global _compacting
+    store = thumb_store()
+    if not store.needs_compaction():
+        return
+    with _compact_lock:
+        if _compacting:
+            return
+        _compacting = True
+
+    def run():
+        global _compacting
+        try:
+            store.maybe_compact()
+        except OSError:
+            pass
+        finally:
+            with _compact_lock:
+                _compacting = False
+
+    threading.Thread(target=run, name="thumb-compact", daemon=True).start()
+
+
+def save_thumbs(photo_id: str, thumbs: Dict[int, bytes]) -> Optional[str]:
+    """写入各尺寸缩略图，返回存入 LibraryPhoto.thumbnail_path 的引用"""
+    store = thumb_store()
+    try:
+        for size, data in thumbs.items():
+            store.put(photo_id, size, data)
+    except OSError:
+        return None
+    _fresh.add(photo_id)
+    _evict(store, _budget.added(photo_id, sum(len(d) for d in thumbs.values())))
+    return store.ref(photo_id) if BASE_SIZE in thumbs else None
+
+
+def peek_thumb(photo_id: str, size: int) -> Optional[ThumbBytes]:
+    """读取最接近 size 的缓存缩略图，不计入命中统计、不更新 LRU（供后台补算等批量读取）"""
+    store = thumb_store()
+    level = best_level(store.levels(photo_id), size)
+    return store.get(photo_id, level) if level is not None else None
+
+
+def read_thumb(photo_id: str, size: int, source_path: Optional[str] = None) -> Optional[ThumbBytes]:
+    """读取最接近 size 的缓存缩略图 JPEG 字节；未命中且给出 source_path 时从原图重新生成"""
+    store = thumb_store()
+    level = best_level(store.levels(photo_id), size)
+    if level is not None:
+        data = store.get(photo_id, level)
+        if data is not None:
+            _stats.hits += 1
+            _budget.touch(photo_id)
+            store.touch(photo_id, level)
+            return data
+    _stats.misses += 1
+    if not source_path or not os.path.exists(source_path):
+        return None
+    thumbs = make_thumbnail_pyramid(source_path, THUMB_SIZES)
+    if not thumbs or save_thumbs(photo_id, thumbs) is None:
+        return None
+    _stats.regenerated += 1
+    return thumbs[best_level(list(thumbs), size)]
+
+
+def flush_access_times():
+    """把内存中记下的缓存命中写回存储（逐文件后端更新 mtime）；GC 与程序退出时调用"""
+    thumb_store().flush_touched()
+
+
+def remove_thumbs(photo_id: str):
+    thumb_store().remove(photo_id)
+    _budget.removed(photo_id)
+
+
+def collect_garbage(live_ids: Set[str]) -> int:
+    """对照索引清理孤儿缩略图（崩溃、导入失败遗留），并按预算淘汰；返回清理的照片数。
+
+    可在后台线程中调用；调用开始后新写入的缩略图不会被当作孤儿。
+    """
+    _fresh.clear()
+    store = thumb_store()
+    orphans = store.photo_ids() - set(live_ids)
+    removed = 0
+    for photo_id in orphans:
+        if photo_id in _fresh:
+            continue
+        store.remove(photo_id)
+        _budget.removed(photo_id)
+        removed += 1
+    _stats.orphans_removed += removed
+    store.flush_touched()
+    _evict(store, _budget.enforce(store))
+    store.maybe_compact()
+    return removed
+
+
+def start_background_gc(live_ids: Set[str], on_done: Optional[Callable[[int], None]] = None) -> threading.Thread:
+    def run():
+        try:
+            n = collect_garbage(live_ids)
+        except Exception:
+            return
+        if on_done is not None:
+            on_done(n)
+
+    t = threading.Thread(target=run, name="thumb-gc", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,100 @@
+from __future__ import annotations
+import itertools
+import queue
+import threading
+from typing import Callable, Dict, Hashable, Iterable
+
+from library_models import LibraryPhoto
+
+
+class ThumbLoader:
+    """后台线程解码缩略图，结果通过 after() 交回 Tk 主线程。
+
+    decode 在工作线程中执行，只能做 PIL 操作；on_ready 在主线程中执行，
+    负责创建 PhotoImage 并更新界面。priority 越小越先处理（可见卡片为 0）。
+    """
+
+    def __init__(
+        self,
+        widget,
+        decode: Callable[[LibraryPhoto], object],
+        on_ready: Callable[[Hashable, object], None],
+        workers: int = 3,
+        poll_ms: int = 30,
+    ):
+        self._widget = widget
+        self._decode = decode
+        self._on_ready = on_ready
+        self._poll_ms = poll_ms
+        self._tasks: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._results: "queue.Queue" = queue.Queue()
+        self._pending: Dict[Hashable, int] = {}
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._polling = False
+        self._closed = False
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"thumb-loader-{i}", daemon=True).start()
+
+    def request(self, key: Hashable, photo: LibraryPhoto, priority: int = 0):
+        with self._lock:
+            old = self._pending.get(key)
+            if old is not None and old <= priority:
+                return
+            self._pending[key] = priority
+        self._tasks.put((priority, next(self._seq), key, photo))
+        self._ensure_polling()
+
+    def retain(self, keys: Iterable[Hashable]):
+        """取消所有不在 keys 中的待处理请求（例如已滚出视口的卡片）"""
+        keep = set(keys)
+        with self._lock:
+            for key in [k for k in self._pending if k not in keep]:
+                del self._pending[key]
+
+    def cancel(self, key: Hashable):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def shutdown(self):
+        self._closed = True
+        with self._lock:
+            self._pending.clear()
+
+    def _work(self):
+        while not self._closed:
+            priority, _, key, photo = self._tasks.get()
+            with self._lock:
+                # 已取消，或同一 key 已被优先级更高的重复任务处理
+                if self._pending.get(key) != priority:
+                    continue
+                del self._pending[key]
+                self._inflight += 1
+            try:
+                result = self._decode(photo)
+            except Exception:
+                result = None
+            self._results.put((key, result))
+            with self._lock:
+                self._inflight -= 1
+
+    def _ensure_polling(self):
+        if not self._polling and not self._closed:
+            self._polling = True
+            self._widget.after(self._poll_ms, self._drain)
+
+    def _drain(self):
+        self._polling = False
+        if self._closed:
+            return
+        while True:
+            try:
+                key, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._on_ready(key, result)
+        with self._lock:
+            busy = bool(self._pending) or self._inflight > 0
+        if busy or not self._results.empty():
+            self._ensure_polling()
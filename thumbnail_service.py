@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
+import io
 import os
 
 try:
@@ -8,26 +9,197 @@ try:
 except ImportError:
     _PIL_OK = False
 
+from exif_reader import exif_thumbnail, raw_preview, raw_preview_from_buffer
+from color_index import color_feature
+
 
 def make_thumbnail_jpeg(
     image_path: str,
     max_pixel: int = 900,
     quality: int = 78,
+    fast: bool = True,
 ) -> Optional[bytes]:
     """生成 JPEG 缩略��字节；失败返回 None"""
+    img = open_source_image(image_path)
+    if img is None:
+        return None
+    return thumbnail_from_image(img, max_pixel, quality, fast)
+
+
+def open_source_image(image_path: str) -> Optional["Image.Image"]:
+    """打开原图用于生成缩略图。
+
+    PIL 打不开的 RAW（ARW/CR2/NEF…），或只能读到 IFD0 小缩略图的 TIFF 容器，
+    改用 exif_reader.raw_preview 切出的最大内嵌 JPEG 预览（不解码传感器数据）。
+    """
+    if not _PIL_OK:
+        return None
+    return _open_source(image_path, lambda: raw_preview(image_path))
+
+
+def open_source_buffer(buf) -> Optional["Image.Image"]:
+    """同 open_source_image，作用于调用方已映射的整个文件（mmap）；
+    返回的图像在 buf 关闭前必须用完"""
     if not _PIL_OK:
         return None
+    return _open_source(buf, lambda: raw_preview_from_buffer(buf))
+
+
+def _open_source(fp, read_preview) -> Optional["Image.Image"]:
+    img = None
+    try:
+        img = Image.open(fp)
+    except Exception:
+        pass
+    if img is not None and img.format != "TIFF":
+        return img
+    data = read_preview()
+    if data is not None:
+        try:
+            preview = Image.open(io.BytesIO(data))
+            if img is None or max(preview.size) > max(img.size):
+                return preview
+        except Exception:
+            pass
+    return img
+
+
+def _embedded_preview(img: "Image.Image", max_pixel: int) -> Optional["Image.Image"]:
+    """EXIF 内嵌缩略图足够大（长边 >= max_pixel）时返回它，否则 None"""
+    data = exif_thumbnail(img.info.get("exif", b""))
+    if data is None:
+        return None
+    try:
+        preview = Image.open(io.BytesIO(data))
+    except Exception:
+        return None
+    return preview if max(preview.size) >= max_pixel else None
+
+
+# thumbnail 对这些模式只能最近邻缩放（调色板）或不支持（16 位灰度）
+_NEAREST_ONLY_MODES = ("1", "P", "PA", "I;16", "I;16L", "I;16B", "I;16N")
+
+
+def _nearest_shrink(img: "Image.Image", max_pixel: int) -> "Image.Image":
+    scale = max_pixel / max(img.size)
+    if scale >= 1:
+        return img
+    return img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.NEAREST)
+
+
+def _reduced_image(img: "Image.Image", max_pixel: int, fast: bool) -> "Image.Image":
+    if fast:
+        preview = _embedded_preview(img, max_pixel)
+        if preview is not None:
+            img = preview
+        elif img.format == "JPEG":
+            img.draft("RGB", (max_pixel, max_pixel))
+        # 先缩小再转换颜色模式，避免按原图分辨率分配一份 RGB 副本；
+        # thumbnail 处理不好的模式先最近邻缩到目标的两倍，再转 RGB 做高质量重采样
+        if img.mode in _NEAREST_ONLY_MODES:
+            img = _nearest_shrink(img, 2 * max_pixel).convert("RGB")
+        img.thumbnail((max_pixel, max_pixel), Image.LANCZOS, reducing_gap=2.0)
+        return img.convert("RGB")
+    img = img.convert("RGB")
+    img.thumbnail((max_pixel, max_pixel), Image.LANCZOS, reducing_gap=None)
+    return img
+
+
+def _encode_jpeg(img: "Image.Image", quality: int) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def thumbnail_from_image(
+    img: "Image.Image",
+    max_pixel: int = 900,
+    quality: int = 78,
+    fast: bool = True,
+) -> Optional[bytes]:
+    """用已打开的 PIL 图像生成 JPEG 缩略图字节；失败返回 None
+
+    fast=True：优先使用足够大的 EXIF 内嵌缩略图；JPEG 源用 draft 在 DCT 域按 1/2~1/8
+    降分辨率解码，峰值内存与目标尺寸而非原图尺寸相关。其他格式由 thumbnail 的
+    reducing_gap 先做整数倍 reduce 再重采样。
+    fast=False：完整解码后直接 LANCZOS 重采样，画质最好但最慢。
+    """
+    try:
+        return _encode_jpeg(_reduced_image(img, max_pixel, fast), quality)
+    except Exception:
+        return None
+
+
+def dhash_from_image(img: "Image.Image") -> Optional[int]:
+    """64 位差异哈希（dHash）：灰度缩到 9x8，每行相邻像素右边更亮记 1；用于找近似重复"""
     try:
-        img = Image.open(image_path)
-        img = img.convert("RGB")    
-        img.thumbnail((max_pixel, max_pixel), Image.LANCZOS)
-
-        import io
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=quality)
-        return buf.getvalue()
+        px = img.convert("L").resize((9, 8), Image.BOX).tobytes()
     except Exception:
         return None
+    bits = 0
+    for row in range(0, 72, 9):
+        for col in range(row, row + 8):
+            bits = (bits << 1) | (px[col + 1] > px[col])
+    return bits
+
+
+def features_from_jpeg(data) -> Tuple[Optional[int], Optional[bytes]]:
+    """由缓存的缩略图字节同时计算 (dHash, 颜色特征)，给导入时还没有这些特征的旧照片补算"""
+    if not _PIL_OK:
+        return None, None
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception:
+        return None, None
+    return dhash_from_image(img), color_feature(img)
+
+
+def thumbnail_pyramid_levels(
+    img: "Image.Image",
+    sizes: Iterable[int],
+    quality: int = 78,
+    fast: bool = True,
+) -> Tuple[Dict[int, bytes], Optional["Image.Image"]]:
+    """同 thumbnail_pyramid_from_image，同时返回最小一级的已解码图像，
+    供 dHash、颜色特征等直接使用而不再解码原图"""
+    sizes = sorted(set(sizes), reverse=True)
+    out: Dict[int, bytes] = {}
+    if not sizes:
+        return out, None
+    try:
+        level = _reduced_image(img, sizes[0], fast)
+        out[sizes[0]] = _encode_jpeg(level, quality)
+        for size in sizes[1:]:
+            level = level.copy()
+            level.thumbnail((size, size), Image.LANCZOS)
+            out[size] = _encode_jpeg(level, quality)
+    except Exception:
+        return {}, None
+    return out, level
+
+
+def thumbnail_pyramid_from_image(
+    img: "Image.Image",
+    sizes: Iterable[int],
+    quality: int = 78,
+    fast: bool = True,
+) -> Dict[int, bytes]:
+    """只解码一次，生成多个尺寸的 JPEG 缩略图 {长边: 字节}；每级从上一级缩小"""
+    return thumbnail_pyramid_levels(img, sizes, quality, fast)[0]
+
+
+def make_thumbnail_pyramid(
+    image_path: str,
+    sizes: Iterable[int],
+    quality: int = 78,
+    fast: bool = True,
+) -> Dict[int, bytes]:
+    """从原图生成多尺寸缩略图；失败返回空 dict"""
+    img = open_source_image(image_path)
+    if img is None:
+        return {}
+    return thumbnail_pyramid_from_image(img, sizes, quality, fast)
 
 
 def save_thumbnail(image_path: str, dest_path: str, max_pixel: int = 900, quality: int = 78) -> bool:
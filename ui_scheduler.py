@@ -0,0 +1,70 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Set
+
+# 可标记为“脏”的界面区域，按刷新顺序排列
+SIDEBAR = "sidebar"
+GRID_DATA = "grid_data"        # 当前视图的照片列表需要重新查询
+GRID_LAYOUT = "grid_layout"    # 只需按新尺寸重新排布
+SELECTION = "selection"        # 只需更新选中样式与计数
+
+REGIONS = (SIDEBAR, GRID_DATA, GRID_LAYOUT, SELECTION)
+
+# 刷新前者时后者已被一并处理
+_SUPERSEDES = {
+    GRID_DATA: (GRID_LAYOUT, SELECTION),
+}
+
+
+@dataclass
+class SchedulerStats:
+    marks: int = 0         # mark() 调用次数（按区域计）
+    flushes: int = 0       # 实际执行的刷新批次
+    coalesced: int = 0     # 被合并进已排队刷新的标记数
+    runs: Dict[str, int] = field(default_factory=dict)   # 每个区域实际刷新次数
+
+
+class RefreshScheduler:
+    """把同一轮事件循环中的多次刷新请求合并，在空闲时每个区域只刷新一次"""
+
+    def __init__(self, widget, handlers: Dict[str, Callable[[], None]]):
+        self._widget = widget
+        self._handlers = handlers
+        self._dirty: Set[str] = set()
+        self._scheduled = False
+        self._stats = SchedulerStats(runs={r: 0 for r in REGIONS})
+
+    def mark(self, *regions: str):
+        for region in regions:
+            if region not in self._handlers:
+                raise ValueError(f"unknown region: {region}")
+            self._stats.marks += 1
+            if self._scheduled:
+                self._stats.coalesced += 1
+            self._dirty.add(region)
+        if self._dirty and not self._scheduled:
+            self._scheduled = True
+            self._widget.after_idle(self.flush)
+
+    def flush(self):
+        """立即执行所有待刷新区域（通常由 after_idle 调用）"""
+        self._scheduled = False
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        for region, covered in _SUPERSEDES.items():
+            if region in dirty:
+                dirty.difference_update(covered)
+        self._stats.flushes += 1
+        for region in REGIONS:
+            if region in dirty:
+                self._stats.runs[region] += 1
+                self._handlers[region]()
+
+    def stats(self) -> SchedulerStats:
+        s = self._stats
+        return SchedulerStats(s.marks, s.flushes, s.coalesced, dict(s.runs))
+
+    @property
+    def pending(self) -> List[str]:
+        return [r for r in REGIONS if r in self._dirty]